@@ -0,0 +1,181 @@
+"""
+Vẽ kết quả phát hiện lên ảnh đã decode và encode ra bytes.
+Dùng chung cho mọi detector (YOLO, CV, simple) thay cho các hàm vẽ riêng:
+một bảng màu, vẽ trên frame có sẵn trong ImageContext, encode một lần sang
+JPEG hoặc WebP, kèm ảnh preview/thumbnail thu nhỏ nếu cần.
+"""
+import cv2
+
+from image_context import ImageContext
+
+# Bảng màu (BGR) theo tên lớp của mọi detector
+COLORS = {
+    # YOLO (7 classes)
+    'Data caries': (0, 0, 255),           # Red
+    'Mouth Ulcer': (255, 0, 255),         # Magenta
+    'Tooth Discoloration': (0, 255, 255), # Yellow
+    'hypodontia': (255, 165, 0),          # Orange
+    'Gingivitis': (0, 165, 255),          # Orange-Red
+    'Calculus': (255, 255, 0),            # Cyan
+    'Caries_Gingivitus_ToothDiscoloration_Ulcer': (128, 0, 128),  # Purple
+    # Detector CV / simple
+    'Sâu răng': (0, 0, 255),              # Red
+    'Cao răng': (0, 255, 255),            # Yellow
+    'Răng đổi màu': (255, 165, 0),        # Orange
+    'Viêm lợi': (255, 0, 255),            # Magenta
+    'Răng khỏe mạnh': (0, 255, 0),        # Green
+}
+
+# Kiểu vẽ của từng detector
+STYLES = {
+    'yolo': {'thickness': 3, 'font_scale': 0.7, 'label_height': 35, 'text_color': (255, 255, 255),
+             'confidence_format': '.2%', 'default_color': (255, 255, 255)},
+    'cv': {'thickness': 4, 'font_scale': 0.7, 'label_height': 30, 'text_color': (255, 255, 255),
+           'confidence_format': '.0%', 'default_color': (255, 0, 0)},
+    'simple': {'thickness': 3, 'font_scale': 0.6, 'label_height': 25, 'text_color': (0, 0, 0),
+               'confidence_format': '.0%', 'default_color': (0, 255, 255)},
+}
+
+# Định dạng ảnh đầu ra: đuôi file, MIME type, tham số chất lượng của OpenCV
+FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def mimetype_for(name):
+    """MIME type theo đuôi file ảnh kết quả."""
+    for ext, mimetype, _ in FORMATS.values():
+        if name.endswith(ext):
+            return mimetype
+    return 'application/octet-stream'
+
+
+def resize_max_side(img, max_side):
+    """Thu nhỏ ảnh để cạnh dài nhất không quá max_side (0 = giữ nguyên)."""
+    height, width = img.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return img
+    scale = max_side / max(height, width)
+    return cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def draw_detections(img, detections, style='yolo', scale=1.0):
+    """
+    Vẽ bounding box và nhãn lên img (sửa trực tiếp).
+
+    Args:
+        img: Ảnh BGR
+        detections: List detection có 'bbox', 'class_name', 'confidence'
+        style: Tên kiểu vẽ trong STYLES
+        scale: Hệ số nhân toạ độ bbox (khi img đã bị thu nhỏ)
+    """
+    style = STYLES[style]
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    for det in detections:
+        bbox = det.get('bbox', {})
+        x1 = int(bbox.get('x1', 0) * scale)
+        y1 = int(bbox.get('y1', 0) * scale)
+        x2 = int(bbox.get('x2', 0) * scale)
+        y2 = int(bbox.get('y2', 0) * scale)
+        class_name = det.get('class_name', 'Unknown')
+        color = COLORS.get(class_name, style['default_color'])
+
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, style['thickness'])
+
+        label = f"{class_name} {det.get('confidence', 0):{style['confidence_format']}}"
+        (w, _), _ = cv2.getTextSize(label, font, style['font_scale'], 2)
+        cv2.rectangle(img, (x1, y1 - style['label_height']), (x1 + w + 10, y1), color, -1)
+        cv2.putText(img, label, (x1 + 5, y1 - 8), font, style['font_scale'], style['text_color'], 2)
+    return img
+
+
+def draw_problems(img, problems):
+    """Khoanh vùng các vấn đề [(x, y), mô tả] bằng vòng tròn bán trong suốt (sửa trực tiếp)."""
+    overlay = img.copy()
+    for loc, desc in problems:
+        x, y = int(loc[0]), int(loc[1])
+        # Vùng highlight bán trong suốt và viền
+        cv2.circle(overlay, (x, y), 30, (0, 0, 255), -1)
+        cv2.circle(img, (x, y), 30, (0, 0, 255), 2)
+        # Box chứa text mô tả
+        (w, h), _ = cv2.getTextSize(desc, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        cv2.rectangle(img, (x + 10, y - 25), (x + 10 + w, y - 10), (255, 255, 255), -1)
+        cv2.rectangle(img, (x + 10, y - 25), (x + 10 + w, y - 10), (0, 0, 255), 1)
+        cv2.putText(img, desc, (x + 10, y - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    alpha = 0.3
+    cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
+    return img
+
+
+def render(image, detections, style='yolo', max_side=0):
+    """
+    Vẽ detection lên bản sao của frame đã decode (không đọc lại file).
+
+    Args:
+        image: ImageContext (hoặc đường dẫn ảnh / mảng BGR)
+        detections: List detection
+        style: Tên kiểu vẽ trong STYLES
+        max_side: Thu nhỏ frame trước khi vẽ (0 = độ phân giải gốc)
+
+    Returns:
+        Ảnh BGR đã vẽ, hoặc None nếu không đọc được ảnh
+    """
+    ctx = ImageContext.ensure(image)
+    if ctx is None:
+        return None
+    img = resize_max_side(ctx.bgr, max_side)
+    scale = img.shape[1] / ctx.width
+    if img is ctx.bgr:
+        img = img.copy()
+    return draw_detections(img, detections, style, scale)
+
+
+def encode(img, fmt='jpeg', quality=90):
+    """
+    Encode ảnh BGR.
+
+    Returns:
+        tuple (bytes, đuôi file)
+
+    Raises:
+        ValueError: Nếu định dạng không hỗ trợ
+        RuntimeError: Nếu encode lỗi
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng ảnh không hỗ trợ: {fmt}")
+    ext, _, quality_flag = FORMATS[fmt]
+    ok, encoded = cv2.imencode(ext, img, [quality_flag, max(1, min(100, int(quality)))])
+    if not ok:
+        raise RuntimeError('Không encode được ảnh kết quả')
+    return encoded.tobytes(), ext
+
+
+def encode_outputs(img, fmt='jpeg', quality=90, preview_side=0, thumb_side=0):
+    """
+    Encode ảnh kết quả và (tuỳ chọn) bản preview, thumbnail thu nhỏ.
+
+    Returns:
+        dict: {'data', 'ext', 'mimetype', 'preview', 'thumbnail'}; preview/thumbnail
+        là bytes hoặc None nếu tắt (hoặc ảnh đã nhỏ hơn kích thước đó)
+    """
+    data, ext = encode(img, fmt, quality)
+    outputs = {'data': data, 'ext': ext, 'mimetype': FORMATS[fmt][1], 'preview': None, 'thumbnail': None}
+    source = img
+    for key, side in (('preview', preview_side), ('thumbnail', thumb_side)):
+        small = resize_max_side(source, side)
+        if small is not source:
+            outputs[key] = encode(small, fmt, quality)[0]
+            # Thumbnail thu nhỏ tiếp từ preview, rẻ hơn từ ảnh gốc
+            source = small
+    return outputs
+
+
+def render_encoded(image, detections, style='yolo', fmt='jpeg', quality=90, max_side=0,
+                   preview_side=0, thumb_side=0):
+    """Vẽ (render) rồi encode (encode_outputs); None nếu không đọc được ảnh."""
+    img = render(image, detections, style, max_side)
+    if img is None:
+        return None
+    return encode_outputs(img, fmt, quality, preview_side, thumb_side)
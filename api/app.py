@@ -2,37 +2,55 @@
 Flask Web Server for Dental Analysis AI.
 Cung cấp API endpoint để frontend có thể gọi và phân tích ảnh.
 """
+import io
 import os
 import sys
-from flask import Flask, request, jsonify, send_from_directory
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, request, jsonify, send_file, send_from_directory, abort, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-import cv2
-import numpy as np
-from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import annotation_renderer
+import box_fusion
+import color_lut
+import config
 from gemini_client import GeminiClient
-try:
-    from src.ai.dental_predictor import DentalPredictor
-    CNN_AVAILABLE = True
-except ImportError:
-    CNN_AVAILABLE = False
+from batch_analysis import create_cv_pool, detect_cv, read_batch_files
+from image_context import ImageContext
+from inference_scheduler import MicroBatcher
+from jobs import JobManager, JobQueueFullError
+import memory_stats
+import metrics
+from model_loaders import (CNN_AVAILABLE, YOLO_AVAILABLE, CNN_SERVING_PATH, YOLO_MODEL_PATH, YOLO_CONF,
+                           load_cnn, load_yolo, warmup_cnn, warmup_yolo)
+from model_registry import ModelRegistry
+import model_server
+from result_cache import ResultCache, make_cache_key
+from result_store import ExpiringStore
+import smoothing
+from upload_store import UploadStore
+import tiling
+from detector_cascade import (CascadePolicy, Detector, KIND_CLASSIFIER, MODE_FAST, MODE_STANDARD,
+                              SKIP_MODE)
+from stage_executor import (Stage, StageExecutor, STATUS_OK, STATUS_SKIPPED, STATUS_ERROR,
+                            STATUS_TIMEOUT, STATUS_CANCELLED)
+
+# TensorFlow và ultralytics chỉ được import trong thread load model (xem model_loaders),
+# ở đây chỉ kiểm tra đã cài hay chưa để server khởi động nhanh
+if not CNN_AVAILABLE:
     print("⚠️  CNN predictor not available")
 
-# Try to import YOLO (optional)
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
+if not YOLO_AVAILABLE:
     print("⚠️  YOLOv8 not installed. Install: pip install ultralytics")
 
 # Import Computer Vision tooth detector
 try:
-    from tooth_detector import detect_damaged_teeth, draw_detections as cv_draw_detections
+    from tooth_detector import detect_damaged_teeth
     CV_DETECTOR_AVAILABLE = True
     print("✅ CV Tooth Detector loaded")
 except ImportError as e:
@@ -41,154 +59,162 @@ except ImportError as e:
 
 # Import Simple tooth detector (better accuracy)
 try:
-    from simple_tooth_detector import detect_individual_teeth, draw_simple_detections
+    from simple_tooth_detector import detect_individual_teeth
     SIMPLE_DETECTOR_AVAILABLE = True
     print("✅ Simple Tooth Detector loaded")
 except ImportError as e:
     SIMPLE_DETECTOR_AVAILABLE = False
     print(f"⚠️  Simple tooth detector not available: {e}")
 
-def draw_yolo_annotations(image_path, detections):
-    """
-    Vẽ bounding boxes từ YOLO detections
-    
-    Args:
-        image_path: Đường dẫn ảnh
-        detections: List các detection từ YOLO
-    
-    Returns:
-        Đường dẫn ảnh đã vẽ
-    """
-    import cv2
-    
-    print(f"🎨 Drawing {len(detections)} bounding boxes on {image_path}")
-    
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"❌ Cannot read image: {image_path}")
-        return image_path
-    
-    print(f"  Image size: {img.shape}")
-    
-    # Color map for 7 classes
-    colors = {
-        'Data caries': (0, 0, 255),           # Red
-        'Mouth Ulcer': (255, 0, 255),         # Magenta
-        'Tooth Discoloration': (0, 255, 255), # Yellow
-        'hypodontia': (255, 165, 0),          # Orange
-        'Gingivitis': (0, 165, 255),          # Orange-Red
-        'Calculus': (255, 255, 0),            # Cyan
-        'Caries_Gingivitus_ToothDiscoloration_Ulcer': (128, 0, 128)  # Purple
-    }
-    
-    # Draw each detection
-    for i, det in enumerate(detections):
-        class_name = det.get('class_name', 'Unknown')
-        confidence = det.get('confidence', 0)
-        bbox = det.get('bbox', {})
-        
-        x1 = int(bbox.get('x1', 0))
-        y1 = int(bbox.get('y1', 0))
-        x2 = int(bbox.get('x2', 0))
-        y2 = int(bbox.get('y2', 0))
-        
-        print(f"  Box {i+1}: {class_name} at ({x1},{y1})-({x2},{y2})")
-        
-        color = colors.get(class_name, (255, 255, 255))
-        
-        # Draw rectangle
-        cv2.rectangle(img, (x1, y1), (x2, y2), color, 3)
-        
-        # Draw label background
-        label = f"{class_name} {confidence:.2%}"
-        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-        cv2.rectangle(img, (x1, y1-35), (x1+w+10, y1), color, -1)
-        
-        # Draw label text
-        cv2.putText(img, label, (x1+5, y1-10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    
-    # Save annotated image
-    annotated_path = image_path.replace('.', '_detected.')
-    success = cv2.imwrite(annotated_path, img)
-    print(f"  {'✅' if success else '❌'} Saved to: {annotated_path}")
-    
-    return annotated_path
-
-def draw_annotations(image_path, problems):
-    """Vẽ khoanh vùng các vấn đề trên ảnh."""
-    # Đọc ảnh bằng OpenCV
-    img = cv2.imread(image_path)
-    overlay = img.copy()
-    
-    # Vẽ khoanh vùng cho mỗi vấn đề
-    for loc, desc in problems:
-        x, y = loc
-        x, y = int(x), int(y)
-        
-        # Vẽ vùng highlight bán trong suốt
-        cv2.circle(overlay, (x, y), 30, (0, 0, 255), -1)
-        
-        # Vẽ viền vòng tròn
-        cv2.circle(img, (x, y), 30, (0, 0, 255), 2)
-        
-        # Thêm box chứa text
-        (w, h), _ = cv2.getTextSize(desc, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-        cv2.rectangle(img, (x+10, y-25), (x+10+w, y-10), (255, 255, 255), -1)
-        cv2.rectangle(img, (x+10, y-25), (x+10+w, y-10), (0, 0, 255), 1)
-        
-        # Thêm text mô tả
-        cv2.putText(img, desc, (x+10, y-12), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-    
-    # Kết hợp ảnh gốc với overlay
-    alpha = 0.3
-    cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
-    
-    # Lưu ảnh đã đánh dấu
-    annotated_path = image_path.replace('.', '_annotated.')
-    cv2.imwrite(annotated_path, img)
-    return annotated_path
-
 # Thiết lập đường dẫn tuyệt đối từ thư mục gốc của dự án
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 frontend_folder = os.path.join(project_root, 'frontend')
 upload_folder = os.path.join(project_root, 'uploads')
 
+class InMemoryRequest(Request):
+    """
+    Request giữ file upload trong bộ nhớ.
+    Mặc định werkzeug ghi file lớn hơn 500KB ra file tạm trên đĩa.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 # Khởi tạo Flask app và bật CORS
 app = Flask(__name__, static_folder=frontend_folder)
+app.request_class = InMemoryRequest
+# Body được giữ trong bộ nhớ: giới hạn chung theo MAX_UPLOAD_MB (áp dụng cả khi upload
+# chunked, không có Content-Length); /analyze/batch tự nâng giới hạn cho request của nó
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_MB * 1024 * 1024
 CORS(app)
 
-# Cấu hình thư mục upload và tạo nếu chưa có
-os.makedirs(upload_folder, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = upload_folder
+# Process con của /analyze/batch (multiprocessing 'spawn') import lại file này
+# với tên '__mp_main__'; các process đó chỉ chạy detector CV nên không load model
+# và không mở kho upload.
+IS_WORKER_PROCESS = __name__ == '__mp_main__'
 
-# Khởi tạo AI clients
-gemini_client = GeminiClient()
+# Kho file upload theo nội dung, có quota (chỉ khi bật lưu file)
+app.config['UPLOAD_FOLDER'] = config.UPLOAD_DIR or upload_folder
+upload_store = None
+if config.PERSIST_UPLOADS and not IS_WORKER_PROCESS:
+    upload_store = UploadStore(app.config['UPLOAD_FOLDER'],
+                               max_bytes=config.UPLOAD_QUOTA_MB * 1024 * 1024,
+                               evict_interval=config.UPLOAD_EVICT_INTERVAL)
+    metrics.UPLOAD_STORE_BYTES.set_function(lambda: upload_store.stats()['bytes'])
 
-# Khởi tạo CNN predictor (nếu có mô hình)
-cnn_predictor = None
-if CNN_AVAILABLE:
-    model_path = os.path.join(project_root, 'models', 'dental_model_final.h5')
-    if os.path.exists(model_path):
-        try:
-            cnn_predictor = DentalPredictor(model_path)
-            print(f"✅ CNN model loaded: {model_path}")
-        except Exception as e:
-            print(f"⚠️  CNN model error: {e}")
+# Ảnh kết quả được giữ trong bộ nhớ và tự hết hạn (của riêng process này: nhiều
+# worker cần định tuyến sticky, xem api/model_server.py)
+result_store = ExpiringStore(ttl=config.RESULT_TTL,
+                             max_items=config.RESULT_STORE_MAX_ITEMS,
+                             max_bytes=config.RESULT_STORE_MAX_MB * 1024 * 1024)
 
-# Khởi tạo YOLO detection model (nếu có)
-yolo_model = None
-if YOLO_AVAILABLE:
-    yolo_path = os.path.join(project_root, 'models', 'dental_detection_yolo.pt')
-    if os.path.exists(yolo_path):
-        try:
-            yolo_model = YOLO(yolo_path)
-            print(f"✅ YOLO Detection model loaded: {yolo_path}")
-        except Exception as e:
-            print(f"⚠️  YOLO model error: {e}")
-    else:
-        print(f"ℹ️  YOLO model not found: {yolo_path}")
+def _load_gemini():
+    """Khởi tạo Gemini client (lỗi nếu thiếu GEMINI_API_KEY, chỉ tắt stage gemini)."""
+    return GeminiClient()
+
+# Với DENTAL_MODEL_SERVER_SOCKET, CNN và YOLO chạy trong api/model_server.py
+# (một bản model cho mọi web worker); worker chỉ giữ client
+_model_server_client = None
+
+def _model_server():
+    global _model_server_client
+    if _model_server_client is None:
+        _model_server_client = model_server.create_client()
+    return _model_server_client
+
+if config.MODEL_SERVER_SOCKET and not IS_WORKER_PROCESS:
+    print("ℹ️  Model server mode: /jobs và /results nằm trong bộ nhớ của từng worker, "
+          "cần định tuyến sticky khi chạy nhiều worker")
+
+def _connect_remote_cnn():
+    """CNN trên model server, None nếu server không có model này."""
+    client = _model_server()
+    return model_server.RemoteCNN(client) if client.wait_model('cnn') else None
+
+def _connect_remote_yolo():
+    """YOLO trên model server, None nếu server không có model này."""
+    client = _model_server()
+    return model_server.RemoteYolo(client) if client.wait_model('yolo') else None
+
+# Model nặng được load ở background; các stage dùng model chưa sẵn sàng sẽ
+# không chạy, detector CV vẫn phục vụ ngay từ khi khởi động
+model_registry = ModelRegistry()
+
+def get_gemini():
+    return model_registry.get('gemini')
+
+def get_cnn():
+    return model_registry.get('cnn')
+
+def get_yolo():
+    return model_registry.get('yolo')
+
+def _file_version(path):
+    """Phiên bản của file model (kích thước + mtime), None nếu không có file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_size}-{int(st.st_mtime)}"
+
+def model_versions():
+    """
+    Phiên bản các model đang phục vụ: thay đổi bất kỳ giá trị nào sẽ tạo key cache mới.
+    Model chưa load xong có giá trị None, nên kết quả tính khi thiếu model không
+    được dùng lại sau khi model sẵn sàng.
+    """
+    gemini_client = get_gemini()
+    return {
+        'cnn': _file_version(CNN_SERVING_PATH) if get_cnn() else None,
+        'yolo': _file_version(YOLO_MODEL_PATH) if get_yolo() else None,
+        'gemini': gemini_client.model_name if gemini_client else None,
+        'simple_detector': SIMPLE_DETECTOR_AVAILABLE,
+        'cv_detector': CV_DETECTOR_AVAILABLE,
+    }
+
+CV_SENSITIVITY = 'medium'
+# Định dạng, chất lượng và kích thước ảnh kết quả (xem annotation_renderer)
+RENDER_OPTIONS = {
+    'fmt': config.ANNOTATED_FORMAT,
+    'quality': config.ANNOTATED_QUALITY,
+    'max_side': config.ANNOTATED_MAX_SIDE,
+    'preview_side': config.ANNOTATED_PREVIEW_SIDE,
+    'thumb_side': config.ANNOTATED_THUMB_SIDE,
+}
+
+# Tham số chung của detector CV: độ phân giải làm việc, ngưỡng lớp màu, chia ô
+DETECTOR_OPTIONS = {
+    'max_side': config.DETECTOR_WORKING_SIDE,
+    'color_ranges': config.COLOR_RANGES or None,
+    'tile_size': config.TILE_SIZE,
+    'tile_overlap': config.TILE_OVERLAP,
+    'tile_workers': config.TILE_WORKERS,
+}
+# Kiểm tra ngưỡng màu ngay lúc khởi động thay vì ở request đầu tiên
+color_lut.normalize_ranges(DETECTOR_OPTIONS['color_ranges'])
+
+# Backend làm mịn của simple detector (chỉ simple detector có bước này)
+SMOOTHING = config.SMOOTHING
+if SMOOTHING not in smoothing.BACKENDS:
+    raise ValueError(f"DENTAL_SMOOTHING không hợp lệ: {SMOOTHING} (chọn {', '.join(smoothing.BACKENDS)})")
+
+STAGE_OPTIONS = {
+    'cv_sensitivity': CV_SENSITIVITY,
+    'yolo_conf': YOLO_CONF,
+    'detector': DETECTOR_OPTIONS,
+    'smoothing': SMOOTHING,
+    'fusion': {'iou': config.FUSION_IOU, 'class_aware': config.FUSION_CLASS_AWARE,
+               'weights': config.FUSION_WEIGHTS},
+    'render': RENDER_OPTIONS,
+}
+
+# Cache kết quả theo nội dung ảnh
+result_cache = None
+if config.RESULT_CACHE_ENABLED:
+    result_cache = ResultCache(max_items=config.RESULT_CACHE_MAX_ITEMS,
+                               ttl=config.RESULT_CACHE_TTL,
+                               disk_path=config.RESULT_CACHE_DISK_PATH or None,
+                               disk_ttl=config.RESULT_CACHE_DISK_TTL)
 
 @app.route('/')
 def serve_index():
@@ -200,172 +226,870 @@ def serve_static_files(path):
     """Phục vụ các file tĩnh khác (css, js, images)."""
     return send_from_directory(app.static_folder, path)
 
-@app.route('/uploads/<path:filename>')
+@app.route('/uploads/<filename>')
 def serve_uploads(filename):
-    """Phục vụ file ảnh từ thư mục uploads."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Phục vụ file ảnh từ kho upload (tên theo nội dung nên cache được lâu)."""
+    path = upload_store.touch(filename) if upload_store is not None else None
+    if path is None:
+        abort(404)
+    try:
+        response = send_file(path, conditional=True)
+    except FileNotFoundError:
+        # File vừa bị xoá khỏi quota
+        abort(404)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/results/<key>')
+def serve_results(key):
+    """Phục vụ ảnh kết quả từ kho trong bộ nhớ."""
+    item = result_store.get(key)
+    if item is None:
+        abort(404)
+    data, mimetype = item
+    return app.response_class(data, mimetype=mimetype,
+                              headers={'Cache-Control': f'private, max-age={config.RESULT_TTL}'})
+
+def publish_annotated(ctx, detections, style, suffix):
+    """
+    Vẽ detection lên frame đã decode, encode một lần và công bố để frontend tải về.
+
+    Args:
+        ctx: ImageContext của request
+        detections: List detection
+        style: Kiểu vẽ ('yolo', 'cv', 'simple')
+        suffix: Hậu tố tên file (vd '_detected')
+
+    Returns:
+        dict: xem publish_outputs
+    """
+    with metrics.STAGE_LATENCY.time(stage='draw'):
+        img = annotation_renderer.render(ctx, detections, style, RENDER_OPTIONS['max_side'])
+    with metrics.STAGE_LATENCY.time(stage='encode'):
+        outputs = annotation_renderer.encode_outputs(img, RENDER_OPTIONS['fmt'], RENDER_OPTIONS['quality'],
+                                                     RENDER_OPTIONS['preview_side'],
+                                                     RENDER_OPTIONS['thumb_side'])
+    return publish_outputs(outputs, suffix, ctx.source)
+
+def _store_bytes(data, suffix, ext, source=None):
+    """
+    Lưu một ảnh đã encode, trả về (tên, URL).
+
+    Khi bật lưu file, ảnh nằm trong kho upload (uploads/); ngược lại ảnh được
+    giữ trong result_store (không chạm đĩa).
+    """
+    if upload_store is not None and source:
+        name = upload_store.put(data, ext)
+        return name, f'/uploads/{name}'
+    key = result_store.put(data, mimetype=annotation_renderer.mimetype_for(ext), suffix=f'{suffix}{ext}')
+    return key, f'/results/{key}'
+
+def publish_outputs(outputs, suffix, source=None):
+    """
+    Công bố kết quả của annotation_renderer.encode_outputs.
+
+    Args:
+        outputs: dict {'data', 'ext', 'preview', 'thumbnail'}
+        suffix: Hậu tố tên file (vd '_detected')
+        source: Đường dẫn ảnh upload nếu đã lưu ra đĩa
+
+    Returns:
+        dict: {'annotated_image', 'annotated_image_url'} và, nếu bật,
+        {'annotated_preview', 'annotated_preview_url', 'annotated_thumbnail', 'annotated_thumbnail_url'}
+    """
+    name, url = _store_bytes(outputs['data'], suffix, outputs['ext'], source)
+    published = {'annotated_image': name, 'annotated_image_url': url}
+    for key, tag in (('preview', '_preview'), ('thumbnail', '_thumb')):
+        if outputs.get(key):
+            name, url = _store_bytes(outputs[key], suffix + tag, outputs['ext'], source)
+            published[f'annotated_{key}'] = name
+            published[f'annotated_{key}_url'] = url
+    return published
+
+# Thread pool dùng chung cho các stage của mọi request
+stage_executor = StageExecutor(max_workers=config.STAGE_WORKERS)
+
+def run_yolo_detection(ctx, timeout=None):
+    """
+    Chạy YOLO trên ảnh và chuyển kết quả về dạng list detection.
+
+    Args:
+        ctx: ImageContext của request
+        timeout: Xem run_yolo_detection_batch
+
+    Returns:
+        List các detection: [{'class_id', 'class_name', 'confidence', 'bbox'}]
+    """
+    return run_yolo_detection_batch([ctx], timeout=timeout)[0]
+
+def run_yolo_detection_batch(ctxs, timeout=None):
+    """
+    Chạy YOLO một lần cho nhiều ảnh.
+
+    Ảnh lớn hơn DENTAL_TILE_SIZE được chia thành các ô (view, không copy) chạy
+    chung batch với ảnh khác; detection của các ô được gộp lại theo từng ảnh.
+
+    Args:
+        ctxs: List ImageContext
+        timeout: Thời gian chờ tối đa (giây) cho cả lần chạy; chỉ có tác dụng với
+            model server (model trong process này chạy đồng bộ)
+
+    Returns:
+        List detection cho từng ảnh, cùng thứ tự đầu vào
+    """
+    detect_batch = get_yolo().detect_batch
+    if timeout is not None and config.MODEL_SERVER_SOCKET:
+        # Mọi lần gọi (các batch ô) dùng chung thời gian còn lại của stage
+        deadline = time.monotonic() + timeout
+        remote = detect_batch
+        detect_batch = lambda images: remote(images, timeout=max(0.0, deadline - time.monotonic()))
+    return tiling.detect_batched(detect_batch, [ctx.bgr for ctx in ctxs],
+                                 tile_size=config.TILE_SIZE, overlap=config.TILE_OVERLAP,
+                                 max_batch=config.INFER_MAX_BATCH)
+
+# Scheduler gom các request /analyze đồng thời thành batch cho CNN và YOLO
+# (tạo khi model tương ứng load xong)
+cnn_batcher = None
+yolo_batcher = None
+
+def _batch_observer(model):
+    """Callback ghi metrics cho mỗi batch của MicroBatcher."""
+    def on_batch(batch_size, waits, elapsed):
+        metrics.INFER_BATCH_SIZE.observe(batch_size, model=model)
+        for waited in waits:
+            metrics.INFER_QUEUE_WAIT.observe(waited, model=model)
+    return on_batch
+
+def _on_cnn_ready(predictor):
+    global cnn_batcher
+    # Model server tự gom batch từ mọi worker
+    if config.INFER_BATCHING and not config.MODEL_SERVER_SOCKET:
+        cnn_batcher = MicroBatcher('cnn', predictor.predict_batch,
+                                   max_batch_size=config.INFER_MAX_BATCH,
+                                   max_wait_ms=config.INFER_MAX_WAIT_MS,
+                                   max_queue=config.INFER_MAX_QUEUE,
+                                   on_batch=_batch_observer('cnn'))
+        metrics.QUEUE_DEPTH.set_function(cnn_batcher.queue_depth, queue='cnn')
+
+def _on_yolo_ready(model):
+    global yolo_batcher
+    if config.INFER_BATCHING and not config.MODEL_SERVER_SOCKET:
+        yolo_batcher = MicroBatcher('yolo', run_yolo_detection_batch,
+                                    max_batch_size=config.INFER_MAX_BATCH,
+                                    max_wait_ms=config.INFER_MAX_WAIT_MS,
+                                    max_queue=config.INFER_MAX_QUEUE,
+                                    on_batch=_batch_observer('yolo'))
+        metrics.QUEUE_DEPTH.set_function(yolo_batcher.queue_depth, queue='yolo')
+
+# Gemini trước (nhanh), sau đó CNN và YOLO
+model_registry.register('gemini', _load_gemini)
+if config.MODEL_SERVER_SOCKET:
+    # Model server đã warm-up model
+    model_registry.register('cnn', _connect_remote_cnn, on_ready=_on_cnn_ready)
+    model_registry.register('yolo', _connect_remote_yolo, on_ready=_on_yolo_ready)
+else:
+    model_registry.register('cnn', load_cnn, warmup=warmup_cnn if config.MODEL_WARMUP else None,
+                            on_ready=_on_cnn_ready)
+    model_registry.register('yolo', load_yolo, warmup=warmup_yolo if config.MODEL_WARMUP else None,
+                            on_ready=_on_yolo_ready)
+if not IS_WORKER_PROCESS:
+    model_registry.start()
+    # Dựng sẵn bảng tra màu (~0.5s) để request đầu tiên không phải chờ
+    if SIMPLE_DETECTOR_AVAILABLE or CV_DETECTOR_AVAILABLE:
+        threading.Thread(target=color_lut.lookup_table, args=(DETECTOR_OPTIONS['color_ranges'],),
+                         name='color-lut', daemon=True).start()
+
+def _detect_simple(ctx, publish, timeout=None):
+    """Simple tooth detector (Best accuracy - detects individual teeth)."""
+    print("🦷 Running Simple tooth detector...")
+    simple_detections = detect_individual_teeth(ctx, smoothing=SMOOTHING, **DETECTOR_OPTIONS)
+    print(f"  Found {len(simple_detections)} teeth")
+    if not simple_detections:
+        print("  ⚠️ Simple detector found 0 teeth")
+        return {}
+    partial = {
+        'cv_detections': {
+            'num_detections': len(simple_detections),
+            'detections': simple_detections
+        }
+    }
+    if publish:
+        partial.update(publish_annotated(ctx, simple_detections, 'simple', '_simple_detected'))
+        print(f"  ✅ Simple detections saved to: {partial['annotated_image_url']}")
+    return partial
+
+def _detect_cv(ctx, publish, timeout=None):
+    """Color-based detector: tìm vùng tổn thương theo màu."""
+    print("🔬 Running CV tooth detector...")
+    cv_detections = detect_damaged_teeth(ctx, sensitivity=CV_SENSITIVITY, **DETECTOR_OPTIONS)
+    print(f"  Found {len(cv_detections)} damaged areas")
+    if not cv_detections:
+        print("  ⚠️ CV found 0 detections")
+        return {}
+    partial = {
+        'cv_detections': {
+            'num_detections': len(cv_detections),
+            'detections': cv_detections
+        }
+    }
+    if publish:
+        partial.update(publish_annotated(ctx, cv_detections, 'cv', '_cv_detected'))
+        print(f"  ✅ CV detections saved to: {partial['annotated_image_url']}")
+    return partial
+
+def _detect_yolo(ctx, publish, timeout=None):
+    """YOLO Detection (AI model, đắt nhất)."""
+    detections = yolo_batcher(ctx, timeout=timeout) if yolo_batcher else run_yolo_detection(ctx, timeout)
+    partial = {
+        'yolo_detections': {
+            'num_detections': len(detections),
+            'detections': detections
+        }
+    }
+    if detections and publish:
+        partial.update(publish_annotated(ctx, detections, 'yolo', '_detected'))
+    return partial
+
+def _classify_cnn(ctx, publish, timeout=None):
+    """CNN Classification trên toàn ảnh."""
+    if cnn_batcher:
+        cnn_result = cnn_batcher(ctx, timeout=timeout)
+    elif config.MODEL_SERVER_SOCKET:
+        # RemoteCNN: dừng chờ (và huỷ ảnh trên server) khi hết thời gian còn lại của stage
+        cnn_result = get_cnn().predict(ctx, timeout=timeout)
+    else:
+        cnn_result = get_cnn().predict(ctx)
+    return {'cnn_prediction': cnn_result if cnn_result.get('success') else None}
+
+# Detector của /analyze kèm chi phí dự kiến; detector_cascade quyết định chạy cái nào
+DETECTORS = [
+    Detector('simple', _detect_simple, config.DETECTOR_COSTS['simple'],
+             result_key='cv_detections', available=lambda: SIMPLE_DETECTOR_AVAILABLE),
+    Detector('cv', _detect_cv, config.DETECTOR_COSTS['cv'],
+             result_key='cv_detections', available=lambda: CV_DETECTOR_AVAILABLE),
+    Detector('yolo', _detect_yolo, config.DETECTOR_COSTS['yolo'],
+             result_key='yolo_detections', available=lambda: get_yolo() is not None),
+    Detector('cnn', _classify_cnn, config.DETECTOR_COSTS['cnn'],
+             kind=KIND_CLASSIFIER, available=lambda: get_cnn() is not None),
+]
+
+def make_cascade_policy(mode=None, budget_ms=None):
+    """
+    CascadePolicy của một request.
+
+    Args:
+        mode: fast | standard | full (None = DENTAL_CASCADE_MODE)
+        budget_ms: Ngân sách (ms) gửi kèm request (None/rỗng = mặc định của mode, 0 = không giới hạn)
+
+    Raises:
+        ValueError: Nếu mode hoặc budget_ms không hợp lệ
+    """
+    mode = (mode or config.CASCADE_MODE).strip().lower()
+    if budget_ms in (None, ''):
+        budget_ms = {MODE_FAST: config.CASCADE_FAST_BUDGET_MS,
+                     MODE_STANDARD: config.CASCADE_BUDGET_MS}.get(mode, 0)
+    try:
+        budget_ms = float(budget_ms)
+    except (TypeError, ValueError):
+        raise ValueError(f"budget_ms không hợp lệ: {budget_ms}") from None
+    return CascadePolicy(mode, budget_ms=budget_ms or None,
+                         min_confidence=config.CASCADE_MIN_CONFIDENCE,
+                         min_detections=config.CASCADE_MIN_DETECTIONS)
+
+def build_analysis_stages(ctx, policy):
+    """
+    Tạo danh sách stage cho một request /analyze.
+    Mọi stage dùng chung ImageContext ctx (ảnh chỉ decode một lần).
+
+    Quan hệ giữa các stage (xem detector_cascade):
+    - simple, cv, yolo: chuỗi detector từ rẻ tới đắt; detector sau chỉ chạy khi
+      kết quả trước chưa đủ tin cậy và còn ngân sách (mode full: chạy hết)
+    - cnn: song song ngay từ đầu nếu vừa ngân sách
+    - gemini: song song ngay từ đầu, trừ mode fast
+
+    Stage của model chưa load xong (xem model_registry) không được thêm vào.
+
+    Mỗi stage trả về một dict được gộp vào combined_result.
+    """
+    stages = policy.build_stages(ctx, DETECTORS, timeouts=config.STAGE_TIMEOUTS)
+
+    # Gemini AI Analysis
+    gemini_client = get_gemini()
+    if gemini_client is not None and not policy.include_gemini:
+        policy.skipped['gemini'] = SKIP_MODE
+    elif gemini_client is not None:
+        def run_gemini(inputs):
+            gemini_result = gemini_client.analyze_dental_image(ctx)
+            if not gemini_result.get('success'):
+                metrics.GEMINI_ERRORS.inc(type=gemini_result.get('error_type', 'other'))
+                raise RuntimeError(gemini_result.get('error', 'Gemini error'))
+            return {'gemini_analysis': gemini_result.get('analysis', '')}
+
+        stages.append(Stage('gemini', run_gemini, timeout=config.STAGE_TIMEOUTS['gemini']))
+
+    return stages
+
+def _log_stage_result(result):
+    """In trạng thái stage khi nó kết thúc và ghi latency vào metrics."""
+    if result.status != STATUS_SKIPPED:
+        metrics.STAGE_LATENCY.observe(result.elapsed, stage=result.name)
+    if result.name == 'gemini' and result.status in (STATUS_TIMEOUT, STATUS_CANCELLED):
+        metrics.GEMINI_ERRORS.inc(type='timeout')
+    if result.status == STATUS_OK:
+        print(f"⏱️  Stage {result.name}: {result.elapsed * 1000:.0f}ms")
+    elif result.status != STATUS_SKIPPED:
+        print(f"⚠️  Stage {result.name} {result.status}: {result.error}")
+
+def assemble_result(stages, results):
+    """Gộp kết quả các stage (theo thứ tự khai báo) thành response của /analyze."""
+    combined_result = {
+        'success': True,
+        'gemini_analysis': '',
+        'cnn_prediction': None,
+        'yolo_detections': None,
+        'cv_detections': None,
+        'model': 'hybrid',
+        'stages': {}
+    }
+    detectors = {detector.name: detector for detector in DETECTORS}
+    sources = {}
+    for stage in stages:
+        result = results.get(stage.name)
+        if result is None:
+            continue
+        combined_result['stages'][stage.name] = {
+            'status': result.status,
+            'elapsed_ms': round(result.elapsed * 1000, 1)
+        }
+        if result.ok and result.value:
+            value = result.value
+            detector = detectors.get(stage.name)
+            key = detector.result_key if detector else None
+            if key and combined_result.get(key) and 'annotated_image' not in value:
+                # Mode full: detector cùng result_key trước đó đã đủ tin cậy và đã vẽ ảnh
+                # kết quả; giữ kết quả của nó (khớp ảnh), kết quả này nằm ở detections_by_detector
+                value = {k: v for k, v in value.items() if k != key}
+            combined_result.update(value)
+            found = detector.detections(result.value) if detector else []
+            if found:
+                sources[stage.name] = found
+    # Nhiều detector cùng có kết quả: trả kết quả riêng của từng detector và gộp các box
+    # cùng một vùng thành một (cv_detections chỉ giữ một detector)
+    if len(sources) > 1:
+        combined_result['detections_by_detector'] = {
+            name: {'num_detections': len(found), 'detections': found} for name, found in sources.items()
+        }
+        fused = box_fusion.fuse_detections(sources, config.FUSION_IOU, weights=config.FUSION_WEIGHTS,
+                                           class_aware=config.FUSION_CLASS_AWARE)
+        combined_result['fused_detections'] = {
+            'num_detections': len(fused),
+            'detections': fused,
+            'sources': list(sources)
+        }
+    return combined_result
+
+def _is_cacheable(results):
+    """Chỉ cache khi mọi stage chạy xong bình thường (không lỗi, không timeout)."""
+    return all(r.status in (STATUS_OK, STATUS_SKIPPED) for r in results.values())
+
+def _annotated_blob(combined_result):
+    """Bytes ảnh kết quả (để lưu kèm cache), None nếu không có."""
+    url = combined_result.get('annotated_image_url') or ''
+    key = combined_result.get('annotated_image')
+    if url.startswith('/uploads/') and upload_store is not None:
+        path = upload_store.touch(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    if not url.startswith('/results/'):
+        return None
+    item = result_store.get(key)
+    return item[0] if item else None
+
+def _is_published(url, key):
+    """True nếu ảnh kết quả (tên key, URL url) vẫn còn để tải."""
+    if url.startswith('/uploads/'):
+        return upload_store is not None and upload_store.touch(key) is not None
+    return result_store.get(key) is not None
+
+def _cached_response(payload, blob):
+    """Tạo response từ item trong cache, công bố lại ảnh kết quả nếu đã hết hạn / bị xoá."""
+    combined_result = dict(payload)
+    key = combined_result.get('annotated_image')
+    url = combined_result.get('annotated_image_url') or ''
+    if blob is not None and key and not _is_published(url, key):
+        if url.startswith('/uploads/'):
+            # Tên theo nội dung nên ghi lại cho ra đúng tên cũ
+            if upload_store is not None:
+                upload_store.put(blob, os.path.splitext(key)[1])
+        else:
+            result_store.put(blob, mimetype=annotation_renderer.mimetype_for(key), key=key)
+    # Preview/thumbnail không lưu kèm cache: bỏ link nếu đã hết hạn
+    for extra in ('annotated_preview', 'annotated_thumbnail'):
+        name = combined_result.get(extra)
+        if name and not _is_published(combined_result.get(f'{extra}_url', ''), name):
+            combined_result.pop(extra)
+            combined_result.pop(f'{extra}_url', None)
+    combined_result['cached'] = True
+    return combined_result
+
+if result_cache is not None:
+    for _key, _result in (('memory_hits', 'memory_hit'), ('disk_hits', 'disk_hit'), ('misses', 'miss')):
+        metrics.CACHE_LOOKUPS.set_function(lambda key=_key: result_cache.stats()[key], result=_result)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metrics theo định dạng Prometheus."""
+    return app.response_class(metrics.REGISTRY.render(), mimetype=None,
+                              headers={'Content-Type': metrics.CONTENT_TYPE})
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Thống kê hit/miss của cache kết quả."""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    stats = result_cache.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/inference/stats')
+def inference_stats():
+    """Thống kê micro-batching (kích thước batch, thời gian chờ hàng đợi) và chi phí detector."""
+    stats = {
+        name: batcher.stats()
+        for name, batcher in (('cnn', cnn_batcher), ('yolo', yolo_batcher))
+        if batcher is not None
+    }
+    # Chi phí khai báo và chi phí đo được của từng detector trong cascade
+    stats['detectors'] = {detector.name: detector.to_dict() for detector in DETECTORS}
+    return jsonify(stats)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: process còn chạy và nhận request (không phụ thuộc model)."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: các stage đang phục vụ được và trạng thái load từng model.
+    Trả 503 khi một model trong DENTAL_READY_REQUIRES chưa sẵn sàng.
+    """
+    models = model_registry.status()
+    stages = {
+        'simple': SIMPLE_DETECTOR_AVAILABLE,
+        'cv': CV_DETECTOR_AVAILABLE,
+        'yolo': get_yolo() is not None,
+        'cnn': get_cnn() is not None,
+        'gemini': get_gemini() is not None,
+    }
+    missing = [name for name in config.READY_REQUIRES if not model_registry.is_ready(name)]
+    ready = not missing and (SIMPLE_DETECTOR_AVAILABLE or CV_DETECTOR_AVAILABLE or any(stages.values()))
+    body = {'ready': ready, 'stages': stages, 'models': models}
+    if missing:
+        body['waiting_for'] = missing
+    return jsonify(body), 200 if ready else 503
+
+def run_analysis(data, filename, on_stage=None, endpoint='analyze', policy=None):
+    """
+    Phân tích một ảnh upload: tra cache, decode một lần rồi chạy các stage song song.
+
+    Args:
+        data: Bytes file ảnh
+        filename: Tên file gốc (chỉ dùng khi bật lưu file)
+        on_stage: Callback on_stage(StageResult) gọi ngay khi một stage kết thúc
+        endpoint: Nhãn endpoint cho metrics
+        policy: CascadePolicy của request (None = chế độ mặc định)
+
+    Returns:
+        dict: combined_result như response của /analyze, kèm 'memory' (đỉnh RSS
+        của process trong lúc phân tích, để chọn cỡ container) và 'cascade'
+        (detector nào đã chạy / bị bỏ qua)
+
+    Raises:
+        ValueError: Nếu không decode được ảnh
+    """
+    policy = policy or make_cascade_policy()
+    cache_key = None
+    if result_cache is not None:
+        cache_key = make_cache_key(data, model_versions(), {**STAGE_OPTIONS, 'cascade': policy.cache_options()})
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            print("⚡ Cache hit, skipping analysis")
+            return _cached_response(*cached)
+
+    image_path = None
+    if upload_store is not None:
+        # Lưu theo sha256: upload trùng tên của người khác không ghi đè lên nhau
+        name = upload_store.put(data, os.path.splitext(filename)[1])
+        image_path = upload_store.path(name)
+
+    def on_complete(result):
+        _log_stage_result(result)
+        if on_stage is not None:
+            on_stage(result)
+
+    with memory_stats.TRACKER.track() as usage:
+        # Decode một lần từ bộ nhớ, dùng chung cho mọi stage
+        with metrics.STAGE_LATENCY.time(stage='decode'):
+            ctx = ImageContext.from_bytes(data, source=image_path)
+
+        stages = build_analysis_stages(ctx, policy)
+        results = stage_executor.run(stages, timeout=config.REQUEST_TIMEOUT, on_complete=on_complete)
+    combined_result = assemble_result(stages, results)
+    if cache_key is not None and _is_cacheable(results):
+        result_cache.put(cache_key, combined_result, _annotated_blob(combined_result))
+
+    metrics.REQUEST_PEAK_RSS.observe(usage['peak_rss'], endpoint=endpoint)
+    memory = {
+        'peak_rss_mb': memory_stats.format_mb(usage['peak_rss']),
+        'start_rss_mb': memory_stats.format_mb(usage['start_rss']),
+        # Có request khác chạy cùng lúc: đỉnh là của cả process
+        'concurrent': usage['overlapped'],
+    }
+    print(f"🧠 Peak RSS: {memory['peak_rss_mb']}MB")
+    # Không lưu vào cache: chỉ đúng cho lần phân tích này
+    return {**combined_result, 'memory': memory, 'cascade': policy.summary(results)}
+
+def _read_single_upload():
+    """
+    Đọc file ảnh từ field 'image' của request.
+
+    Returns:
+        tuple (file, None) hoặc (None, (response, status)) khi request không hợp lệ
+    """
+    if request.content_length and request.content_length > config.MAX_UPLOAD_MB * 1024 * 1024:
+        return None, (jsonify({'success': False, 'error': f'File quá lớn (tối đa {config.MAX_UPLOAD_MB}MB)'}), 413)
+
+    if 'image' not in request.files:
+        return None, (jsonify({'success': False, 'error': 'Không có file ảnh nào được gửi lên'}), 400)
+
+    file = request.files['image']
+    if file.filename == '':
+        return None, (jsonify({'success': False, 'error': 'Tên file không hợp lệ'}), 400)
+    return file, None
+
+def _read_cascade_policy():
+    """
+    Đọc mode (fast | standard | full) và budget_ms từ form hoặc query string.
+
+    Returns:
+        tuple (CascadePolicy, None) hoặc (None, (response, status)) khi giá trị không hợp lệ
+    """
+    try:
+        policy = make_cascade_policy(request.values.get('mode'), request.values.get('budget_ms'))
+    except ValueError as e:
+        return None, (jsonify({'success': False, 'error': str(e)}), 400)
+    return policy, None
 
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
     """
     API endpoint để nhận ảnh, phân tích và trả về kết quả.
     
-    Kết hợp:
+    Kết hợp (các stage độc lập chạy song song, xem build_analysis_stages):
     1. YOLO Detection - khoanh vùng bệnh lý
     2. CNN Classification - phân loại toàn ảnh
     3. Gemini AI - phân tích chi tiết
+
+    Tuỳ chọn: mode=fast|standard|full và budget_ms (ngân sách tính toán, xem detector_cascade).
     """
-    if 'image' not in request.files:
-        return jsonify({'success': False, 'error': 'Không có file ảnh nào được gửi lên'}), 400
+    with metrics.IN_FLIGHT.track_inprogress(endpoint='analyze'):
+        file, error = _read_single_upload()
+        if not error:
+            policy, error = _read_cascade_policy()
+        if error:
+            metrics.REQUESTS.inc(endpoint='analyze', outcome='bad_request')
+            return error
 
-    file = request.files['image']
-    if file.filename == '':
-        return jsonify({'success': False, 'error': 'Tên file không hợp lệ'}), 400
+        data = file.read()
+        metrics.UPLOAD_BYTES.observe(len(data), endpoint='analyze')
+        try:
+            combined_result = run_analysis(data, file.filename, policy=policy)
+        except ValueError:
+            metrics.REQUESTS.inc(endpoint='analyze', outcome='bad_request')
+            return jsonify({'success': False, 'error': 'Không đọc được file ảnh'}), 400
+        except Exception as e:
+            metrics.REQUESTS.inc(endpoint='analyze', outcome='error')
+            print(f"❌ Error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return jsonify({'success': False, 'error': f'Lỗi server: {str(e)}'}), 500
+
+        metrics.REQUESTS.inc(endpoint='analyze', outcome='cached' if combined_result.get('cached') else 'ok')
+        return jsonify(combined_result)
+
+def _run_job(job):
+    """Runner của JobManager: chạy phân tích và báo kết quả từng stage vào job."""
+    data, filename, policy = job.payload
 
-    if file:
-        filename = secure_filename(file.filename)
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(image_path)
+    def on_stage(result):
+        job.stage_done(result.name, result.status, round(result.elapsed * 1000, 1),
+                       result.value if result.ok else None)
 
+    with metrics.IN_FLIGHT.track_inprogress(endpoint='job'):
         try:
-            combined_result = {
+            return run_analysis(data, filename, on_stage=on_stage, endpoint='job', policy=policy)
+        except ValueError:
+            raise RuntimeError('Không đọc được file ảnh')
+
+# Job nằm trong bộ nhớ của process tạo ra nó (nhiều worker: cần định tuyến sticky)
+job_manager = JobManager(_run_job, workers=config.JOB_WORKERS,
+                         max_queue=config.JOB_MAX_QUEUE, ttl=config.JOB_TTL)
+metrics.QUEUE_DEPTH.set_function(lambda: job_manager.stats()['queue_depth'], queue='jobs')
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Tạo job phân tích bất đồng bộ, trả về job id ngay (202).
+
+    Theo dõi bằng GET /jobs/<id> (kết quả từng phần) hoặc
+    GET /jobs/<id>/events (Server-Sent Events, một event cho mỗi stage).
+    Nhận mode và budget_ms như /analyze.
+    """
+    file, error = _read_single_upload()
+    if not error:
+        policy, error = _read_cascade_policy()
+    if error:
+        metrics.REQUESTS.inc(endpoint='jobs', outcome='bad_request')
+        return error
+
+    data = file.read()
+    metrics.UPLOAD_BYTES.observe(len(data), endpoint='jobs')
+    try:
+        job = job_manager.submit((data, file.filename, policy))
+    except JobQueueFullError as e:
+        metrics.REQUESTS.inc(endpoint='jobs', outcome='rejected')
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    metrics.REQUESTS.inc(endpoint='jobs', outcome='accepted')
+
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}',
+        'events_url': f'/jobs/{job.id}/events'
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Trạng thái job và kết quả các stage đã xong."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Không tìm thấy job'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """Server-Sent Events: 'status', 'stage' (mỗi stage xong), 'done' hoặc 'error'."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Không tìm thấy job'}), 404
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+    return app.response_class(
+        stream_with_context(job_manager.stream(job, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Process pool cho detector CV của /analyze/batch (tạo khi cần)
+_cv_pool = None
+
+def _get_cv_pool():
+    global _cv_pool
+    if _cv_pool is None:
+        _cv_pool = create_cv_pool(config.BATCH_CV_WORKERS or None)
+    return _cv_pool
+
+# Thread pool riêng cho Gemini của /analyze/batch: một batch tới BATCH_MAX_IMAGES ảnh
+# không được chiếm hết stage_executor mà các request /analyze dùng chung
+_gemini_pool = None
+_gemini_pool_lock = threading.Lock()
+
+def _get_gemini_pool():
+    global _gemini_pool
+    with _gemini_pool_lock:
+        if _gemini_pool is None:
+            _gemini_pool = ThreadPoolExecutor(max_workers=max(1, config.BATCH_GEMINI_WORKERS),
+                                              thread_name_prefix='batch-gemini')
+    return _gemini_pool
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Phân tích nhiều ảnh trong một request (cả bộ ảnh của một lần khám).
+
+    Nhận các file trong field 'images' (multipart, có thể là file .zip).
+    Detector CV chạy song song trên process pool; YOLO và CNN được gọi một
+    lần cho cả batch. Gemini chỉ chạy khi gửi kèm gemini=1.
+
+    Returns:
+        {'success', 'num_images', 'results': [{'filename', ...như /analyze}]}
+    """
+    with metrics.IN_FLIGHT.track_inprogress(endpoint='batch'):
+        response = _analyze_batch()
+    status = response[1] if isinstance(response, tuple) else 200
+    outcome = 'ok' if status < 400 else ('bad_request' if status < 500 else 'error')
+    metrics.REQUESTS.inc(endpoint='batch', outcome=outcome)
+    return response
+
+def _analyze_batch():
+    """Xử lý /analyze/batch (xem analyze_batch)."""
+    # Phải đặt trước khi đọc request.files (body được parse ở lần truy cập đầu tiên)
+    request.max_content_length = config.BATCH_MAX_UPLOAD_MB * 1024 * 1024
+    try:
+        files = request.files.getlist('images') or request.files.getlist('image')
+    except RequestEntityTooLarge:
+        return jsonify({'success': False,
+                        'error': f'Batch quá lớn (tối đa {config.BATCH_MAX_UPLOAD_MB}MB)'}), 413
+    try:
+        items = read_batch_files(files, config.BATCH_MAX_IMAGES,
+                                 max_image_bytes=config.MAX_UPLOAD_MB * 1024 * 1024,
+                                 max_total_bytes=config.BATCH_MAX_UPLOAD_MB * 1024 * 1024)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not items:
+        return jsonify({'success': False, 'error': 'Không có file ảnh nào được gửi lên'}), 400
+    for _, data in items:
+        metrics.UPLOAD_BYTES.observe(len(data), endpoint='batch')
+
+    include_gemini = request.form.get('gemini', '0').lower() in ('1', 'true', 'yes')
+    options = STAGE_OPTIONS if include_gemini else {**STAGE_OPTIONS, 'gemini': False}
+
+    gemini_client = get_gemini() if include_gemini else None
+    cnn_predictor = get_cnn()
+    yolo_model = get_yolo()
+    versions = model_versions()
+
+    try:
+        results = [None] * len(items)
+        pending = []
+        for index, (filename, data) in enumerate(items):
+            cache_key = make_cache_key(data, versions, options) if result_cache else None
+            cached = result_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                results[index] = {'filename': filename, **_cached_response(*cached)}
+            else:
+                pending.append((index, filename, data, cache_key))
+
+        print(f"📦 Batch: {len(items)} images, {len(items) - len(pending)} cached")
+
+        # 1. Detector CV trên process pool (mỗi ảnh một task)
+        cv_futures = {}
+        if SIMPLE_DETECTOR_AVAILABLE or CV_DETECTOR_AVAILABLE:
+            pool = _get_cv_pool()
+            for index, _, data, _ in pending:
+                cv_futures[index] = pool.submit(detect_cv, data, CV_SENSITIVITY, RENDER_OPTIONS,
+                                                DETECTOR_OPTIONS, SMOOTHING)
+
+        # Decode trong process chính cho YOLO/CNN/Gemini (song song với detector CV)
+        contexts = {}
+        decode_errors = {}
+        for index, filename, data, _ in pending:
+            try:
+                with metrics.STAGE_LATENCY.time(stage='decode'):
+                    contexts[index] = ImageContext.from_bytes(data)
+            except ValueError as e:
+                decode_errors[index] = str(e)
+
+        # 2. Gemini (tuỳ chọn) chạy nền trên pool riêng (tối đa BATCH_GEMINI_WORKERS lời gọi cùng lúc)
+        gemini_futures = {}
+        if gemini_client is not None:
+            pool = _get_gemini_pool()
+            for index, ctx in contexts.items():
+                gemini_futures[index] = pool.submit(gemini_client.analyze_dental_image, ctx)
+
+        # 3. CNN: một lần forward cho cả batch
+        cnn_results = {}
+        if cnn_predictor and contexts:
+            indices = list(contexts)
+            for index, cnn_result in zip(indices, cnn_predictor.predict_batch([contexts[i] for i in indices])):
+                cnn_results[index] = cnn_result if cnn_result.get('success') else None
+
+        combined = {}
+        statuses = {}
+        for index, filename, data, _ in pending:
+            statuses[index] = []
+            if index in decode_errors:
+                combined[index] = {'filename': filename, 'success': False, 'error': 'Không đọc được file ảnh'}
+                continue
+            combined[index] = {
+                'filename': filename,
                 'success': True,
                 'gemini_analysis': '',
-                'cnn_prediction': None,
+                'cnn_prediction': cnn_results.get(index),
                 'yolo_detections': None,
                 'cv_detections': None,
                 'model': 'hybrid'
             }
+            future = cv_futures.get(index)
+            if future is None:
+                continue
+            try:
+                cv_result = future.result(timeout=config.REQUEST_TIMEOUT)
+            except Exception as e:
+                print(f"⚠️  CV Detection error ({filename}): {e}")
+                statuses[index].append(STATUS_ERROR)
+                continue
+            if cv_result['detections']:
+                combined[index]['cv_detections'] = {
+                    'num_detections': len(cv_result['detections']),
+                    'detections': cv_result['detections']
+                }
+                combined[index].update(publish_outputs(cv_result['annotated'], cv_result['suffix']))
 
-            # 1. Simple Tooth Detector (Best accuracy - detects individual teeth)
-            if SIMPLE_DETECTOR_AVAILABLE:
-                try:
-                    print("🦷 Running Simple tooth detector...")
-                    simple_detections = detect_individual_teeth(image_path)
-                    print(f"  Found {len(simple_detections)} teeth")
-                    
-                    if simple_detections:
-                        combined_result['cv_detections'] = {
-                            'num_detections': len(simple_detections),
-                            'detections': simple_detections
-                        }
-                        # Draw detections
-                        simple_annotated_path = draw_simple_detections(image_path, simple_detections)
-                        combined_result['annotated_image'] = os.path.basename(simple_annotated_path)
-                        print(f"  ✅ Simple detections saved to: {simple_annotated_path}")
-                    else:
-                        print("  ⚠️ Simple detector found 0 teeth")
-                except Exception as e:
-                    print(f"⚠️  Simple Detection error: {e}")
-                    import traceback
-                    traceback.print_exc()
-
-            # 2. Fallback: Computer Vision Detection
-            elif CV_DETECTOR_AVAILABLE:
-                try:
-                    print("🔬 Running CV tooth detector...")
-                    cv_detections = detect_damaged_teeth(image_path, sensitivity='medium')
-                    print(f"  Found {len(cv_detections)} damaged areas")
-                    
-                    if cv_detections:
-                        combined_result['cv_detections'] = {
-                            'num_detections': len(cv_detections),
-                            'detections': cv_detections
-                        }
-                        # Draw CV detections
-                        cv_annotated_path = cv_draw_detections(image_path, cv_detections)
-                        combined_result['annotated_image'] = os.path.basename(cv_annotated_path)
-                        print(f"  ✅ CV detections saved to: {cv_annotated_path}")
-                    else:
-                        print("  ⚠️ CV found 0 detections, will try YOLO as fallback")
-                except Exception as e:
-                    print(f"⚠️  CV Detection error: {e}")
-                    import traceback
-                    traceback.print_exc()
-
-            # 3. YOLO Detection (AI model - last resort)
-            # Use YOLO if both simple and CV failed
-            use_yolo = (yolo_model and 
-                       (not SIMPLE_DETECTOR_AVAILABLE and not CV_DETECTOR_AVAILABLE) or 
-                        combined_result.get('cv_detections') is None or 
-                        combined_result.get('cv_detections', {}).get('num_detections', 0) == 0)
-            
-            if use_yolo:
-                try:
-                    # Very low confidence to detect more smaller boxes
-                    results = yolo_model(image_path, conf=0.15, verbose=False)
-                    detections = []
-                    
-                    # 7 classes from training
-                    class_names = [
-                        'Data caries',
-                        'Mouth Ulcer',
-                        'Tooth Discoloration',
-                        'hypodontia',
-                        'Gingivitis',
-                        'Calculus',
-                        'Caries_Gingivitus_ToothDiscoloration_Ulcer'
-                    ]
-                    
-                    print(f"🔍 YOLO found {len(results[0].boxes)} detections")
-                    
-                    for box in results[0].boxes:
-                        print(f"  Raw box data: xyxy={box.xyxy}, xywh={box.xywh}")
-                        
-                        class_id = int(box.cls[0])
-                        
-                        # Get bbox coordinates correctly
-                        xyxy = box.xyxy[0].cpu().numpy()
-                        x1, y1, x2, y2 = int(xyxy[0]), int(xyxy[1]), int(xyxy[2]), int(xyxy[3])
-                        
-                        detection = {
-                            'class_id': class_id,
-                            'class_name': class_names[class_id] if class_id < len(class_names) else 'Unknown',
-                            'confidence': float(box.conf[0]),
-                            'bbox': {
-                                'x1': x1,
-                                'y1': y1,
-                                'x2': x2,
-                                'y2': y2
-                            }
-                        }
-                        detections.append(detection)
-                        print(f"  ✓ Detection: {detection['class_name']} ({detection['confidence']:.2%}) at ({x1},{y1})-({x2},{y2})")
-                    
-                    combined_result['yolo_detections'] = {
-                        'num_detections': len(detections),
-                        'detections': detections
-                    }
-                    
-                    # Draw YOLO annotations
-                    if detections:
-                        annotated_path = draw_yolo_annotations(image_path, detections)
-                        combined_result['annotated_image'] = os.path.basename(annotated_path)
-                        
-                except Exception as e:
-                    print(f"⚠️  YOLO error: {e}")
-
-            # 2. CNN Classification
-            if cnn_predictor:
-                try:
-                    cnn_result = cnn_predictor.predict(image_path)
-                    combined_result['cnn_prediction'] = cnn_result if cnn_result.get('success') else None
-                except Exception as e:
-                    print(f"⚠️  CNN error: {e}")
-
-            # 3. Gemini AI Analysis
+        # 4. YOLO: một lần gọi cho các ảnh mà detector CV không tìm thấy gì
+        if yolo_model is not None:
+            yolo_indices = [index for index in contexts if not combined[index]['cv_detections']]
             try:
-                gemini_result = gemini_client.analyze_dental_image(image_path)
-                combined_result['gemini_analysis'] = gemini_result.get('analysis', '')
+                yolo_outputs = run_yolo_detection_batch([contexts[i] for i in yolo_indices])
             except Exception as e:
-                print(f"⚠️  Gemini error: {e}")
+                print(f"⚠️  YOLO error: {e}")
+                yolo_outputs = []
+                for index in yolo_indices:
+                    statuses[index].append(STATUS_ERROR)
+            for index, detections in zip(yolo_indices, yolo_outputs):
+                combined[index]['yolo_detections'] = {
+                    'num_detections': len(detections),
+                    'detections': detections
+                }
+                if detections:
+                    combined[index].update(publish_annotated(contexts[index], detections, 'yolo', '_detected'))
 
-            return jsonify(combined_result)
-        except Exception as e:
-            print(f"❌ Error: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({'success': False, 'error': f'Lỗi server: {str(e)}'}), 500
+        for index, future in gemini_futures.items():
+            try:
+                gemini_result = future.result(timeout=config.STAGE_TIMEOUTS['gemini'])
+            except Exception as e:
+                # Lời gọi còn trong hàng đợi của pool thì không chạy nữa
+                future.cancel()
+                gemini_result = {'success': False, 'error': str(e)}
+            if gemini_result.get('success'):
+                combined[index]['gemini_analysis'] = gemini_result.get('analysis', '')
+            else:
+                print(f"⚠️  Gemini error: {gemini_result.get('error')}")
+                statuses[index].append(STATUS_ERROR)
+
+        for index, filename, data, cache_key in pending:
+            result = combined[index]
+            results[index] = result
+            if cache_key and result.get('success') and not statuses[index]:
+                payload = {k: v for k, v in result.items() if k != 'filename'}
+                result_cache.put(cache_key, payload, _annotated_blob(payload))
+
+        return jsonify({'success': True, 'num_images': len(items), 'results': results})
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': f'Lỗi server: {str(e)}'}), 500
 
 if __name__ == '__main__':
     app.run(port=5001, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Phần chạy trong process pool của endpoint /analyze/batch.
+Mỗi worker tự decode ảnh, chạy detector CV và vẽ ảnh kết quả, chỉ trả về
+detection và ảnh đã encode để tránh truyền mảng pixel giữa các process.
+"""
+import io
+import os
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import annotation_renderer
+from image_context import ImageContext
+
+try:
+    from simple_tooth_detector import detect_individual_teeth
+    SIMPLE_DETECTOR_AVAILABLE = True
+except ImportError:
+    SIMPLE_DETECTOR_AVAILABLE = False
+
+try:
+    from tooth_detector import detect_damaged_teeth
+    CV_DETECTOR_AVAILABLE = True
+except ImportError:
+    CV_DETECTOR_AVAILABLE = False
+
+# Đuôi file được nhận trong file zip
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def detect_cv(data, sensitivity='medium', render_options=None, detector_options=None, smoothing='bilateral'):
+    """
+    Chạy detector CV (simple, fallback sang color-based) trên một ảnh.
+
+    Args:
+        data: Bytes file ảnh
+        sensitivity: Độ nhạy của detect_damaged_teeth
+        render_options: Tham số của annotation_renderer.render_encoded
+            (fmt, quality, max_side, preview_side, thumb_side)
+        detector_options: Tham số chung của detector (max_side, color_ranges)
+        smoothing: Backend làm mịn của simple detector (xem smoothing.BACKENDS)
+
+    Returns:
+        dict: {'stage', 'detections', 'annotated' (kết quả encode_outputs hoặc None), 'suffix'}
+    """
+    ctx = ImageContext.from_bytes(data)
+    detector_options = detector_options or {}
+
+    if SIMPLE_DETECTOR_AVAILABLE:
+        stage, suffix = 'simple', '_simple_detected'
+        detections = detect_individual_teeth(ctx, smoothing=smoothing, **detector_options)
+    elif CV_DETECTOR_AVAILABLE:
+        stage, suffix = 'cv', '_cv_detected'
+        detections = detect_damaged_teeth(ctx, sensitivity=sensitivity, **detector_options)
+    else:
+        return {'stage': None, 'detections': [], 'annotated': None, 'suffix': None}
+
+    annotated = None
+    if detections:
+        annotated = annotation_renderer.render_encoded(ctx, detections, style=stage, **(render_options or {}))
+    return {'stage': stage, 'detections': detections, 'annotated': annotated, 'suffix': suffix}
+
+
+def create_cv_pool(max_workers=None):
+    """
+    Tạo process pool cho detector CV.
+    Dùng 'spawn' để process con không kế thừa thread của TensorFlow/PyTorch.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def read_batch_files(files, max_images, max_image_bytes=None, max_total_bytes=None):
+    """
+    Đọc danh sách ảnh từ multipart upload, mở rộng các file zip.
+
+    File trong zip được kiểm tra kích thước giải nén (khai báo trong zip; zipfile
+    không đọc quá kích thước này) trước khi đọc, nên zip bomb bị từ chối mà không
+    phải giải nén.
+
+    Args:
+        files: List FileStorage từ request.files
+        max_images: Số ảnh tối đa
+        max_image_bytes: Kích thước tối đa của một ảnh trong zip sau giải nén (None = không giới hạn)
+        max_total_bytes: Tổng kích thước tối đa của các ảnh giải nén từ zip (None = không giới hạn)
+
+    Returns:
+        list: [(filename, bytes), ...]
+
+    Raises:
+        ValueError: Nếu vượt quá số ảnh / dung lượng cho phép hoặc zip hỏng
+    """
+    items = []
+    extracted = 0
+    too_many = ValueError(f"Tối đa {max_images} ảnh mỗi lần")
+    for file in files:
+        if not file or file.filename == '':
+            continue
+        if len(items) >= max_images:
+            raise too_many
+        data = file.read()
+        if not file.filename.lower().endswith('.zip'):
+            items.append((file.filename, data))
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if info.is_dir() or os.path.basename(name).startswith('.'):
+                        continue
+                    if not name.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if len(items) >= max_images:
+                        raise too_many
+                    if max_image_bytes is not None and info.file_size > max_image_bytes:
+                        raise ValueError(f"Ảnh {name} trong {file.filename} vượt quá "
+                                         f"{max_image_bytes // (1024 * 1024)}MB sau giải nén")
+                    extracted += info.file_size
+                    if max_total_bytes is not None and extracted > max_total_bytes:
+                        raise ValueError(f"Tổng dung lượng ảnh giải nén từ zip vượt quá "
+                                         f"{max_total_bytes // (1024 * 1024)}MB")
+                    items.append((name, archive.read(info)))
+        except zipfile.BadZipFile:
+            raise ValueError(f"File zip không hợp lệ: {file.filename}")
+    return items
@@ -0,0 +1,378 @@
+"""
+Gộp box của nhiều detector / nhiều ô bằng NumPy.
+
+Box được giữ dạng struct-of-arrays (BoxSet: toạ độ (N, 4), score, nhãn, nguồn)
+thay vì list dict để các phép so sánh từng cặp chạy vector hoá:
+- iou_matrix / overlap_matrix: ma trận IoU, giao / box nhỏ hơn
+- nms: non-max suppression theo lớp
+- weighted_box_fusion: gộp box của nhiều detector thành box trung bình có trọng số
+- cluster_overlapping: nhóm box chồng nhau (gộp ô của tiling)
+- top_k: chọn k phần tử lớn nhất bằng argpartition, cùng kết quả với sort ổn định
+
+Các hàm *_detections nhận/trả list dict detection như phần còn lại của API.
+"""
+import numpy as np
+
+# Số hàng của ma trận cặp box tính một lần; khối nhỏ giúp sweep theo x1 cắt bớt nhiều cột hơn
+BLOCK = 64
+
+
+class BoxSet:
+    """Box dạng struct-of-arrays: xyxy (N, 4), scores (N,), labels (N,) chỉ số vào names, sources (N,)."""
+
+    def __init__(self, xyxy, scores=None, labels=None, names=(None,), sources=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        count = len(self.xyxy)
+        self.scores = np.zeros(count) if scores is None else np.asarray(scores, dtype=np.float64)
+        self.labels = np.zeros(count, dtype=np.int64) if labels is None else np.asarray(labels, dtype=np.int64)
+        self.sources = np.zeros(count, dtype=np.int64) if sources is None else np.asarray(sources, dtype=np.int64)
+        self.names = tuple(names)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    @property
+    def areas(self):
+        return areas(self.xyxy)
+
+    @classmethod
+    def from_detections(cls, detections, source=0):
+        """
+        Args:
+            detections: List detection có 'bbox' {'x1','y1','x2','y2'}, 'class_name', 'confidence'
+            source: Chỉ số nguồn (detector) gán cho mọi box
+        """
+        index = {}
+        labels = [index.setdefault(det.get('class_name'), len(index)) for det in detections]
+        xyxy = [(det['bbox']['x1'], det['bbox']['y1'], det['bbox']['x2'], det['bbox']['y2'])
+                for det in detections]
+        scores = [det.get('confidence', 0.0) for det in detections]
+        return cls(xyxy, scores, labels, tuple(index) or (None,), np.full(len(detections), source))
+
+    @classmethod
+    def concat(cls, sets):
+        """Nối nhiều BoxSet; nhãn cùng tên được đánh lại cùng một chỉ số."""
+        sets = [s for s in sets if len(s)]
+        if not sets:
+            return cls(np.empty((0, 4)))
+        index = {}
+        labels = []
+        for s in sets:
+            remap = np.array([index.setdefault(name, len(index)) for name in s.names], dtype=np.int64)
+            labels.append(remap[s.labels])
+        return cls(np.concatenate([s.xyxy for s in sets]), np.concatenate([s.scores for s in sets]),
+                   np.concatenate(labels), tuple(index), np.concatenate([s.sources for s in sets]))
+
+    def take(self, index):
+        return BoxSet(self.xyxy[index], self.scores[index], self.labels[index], self.names, self.sources[index])
+
+
+def areas(xyxy):
+    return np.maximum(xyxy[:, 2] - xyxy[:, 0], 0) * np.maximum(xyxy[:, 3] - xyxy[:, 1], 0)
+
+
+def _intersections(a, b):
+    iw = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    ih = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    return np.maximum(iw, 0) * np.maximum(ih, 0)
+
+
+def iou_matrix(a, b):
+    """IoU từng cặp giữa a (N, 4) và b (M, 4), kết quả (N, M)."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    inter = _intersections(a, b)
+    union = areas(a)[:, None] + areas(b)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def overlap_matrix(a, b):
+    """Diện tích giao / diện tích box nhỏ hơn từng cặp (box bị cắt ở mép ô nằm gọn trong box đầy đủ)."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    inter = _intersections(a, b)
+    smaller = np.minimum(areas(a)[:, None], areas(b)[None, :])
+    return np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+
+
+def top_k(values, k):
+    """
+    Chỉ số của k giá trị lớn nhất theo thứ tự giảm dần, giống np.argsort(-values, kind='stable')[:k]
+    (giá trị bằng nhau giữ thứ tự ban đầu) nhưng chỉ sắp xếp các ứng viên sau argpartition.
+    """
+    values = np.asarray(values)
+    if k <= 0 or not len(values):
+        return np.empty(0, dtype=np.int64)
+    if k >= len(values):
+        return np.argsort(-values, kind='stable')
+    kth = values[np.argpartition(-values, k - 1)[k - 1]]
+    # Mọi phần tử >= giá trị thứ k (kể cả bằng nhau) để giữ đúng thứ tự ổn định
+    candidates = np.flatnonzero(values >= kth)
+    return candidates[np.argsort(-values[candidates], kind='stable')][:k]
+
+
+def _label_offsets(xyxy, labels):
+    """Độ dời (N, 1) theo lớp để box khác lớp không bao giờ chồng nhau."""
+    if labels is None or not len(xyxy):
+        return np.zeros((len(xyxy), 1))
+    span = xyxy.max() - min(xyxy.min(), 0) + 1
+    return (np.asarray(labels) * span)[:, None].astype(np.float64)
+
+
+def nms(xyxy, scores, labels=None, iou_threshold=0.5, max_output=0):
+    """
+    Non-max suppression: giữ box score cao nhất, bỏ các box cùng lớp có IoU > iou_threshold với nó.
+
+    Args:
+        xyxy: (N, 4)
+        scores: (N,)
+        labels: (N,) hoặc None (không phân lớp)
+        max_output: Số box giữ tối đa (0 = không giới hạn)
+
+    Returns:
+        Chỉ số box được giữ, theo score giảm dần
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float64)
+    xyxy = xyxy + _label_offsets(xyxy, labels)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    box_areas = areas(xyxy)
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        if max_output and len(keep) >= max_output:
+            break
+        inter = _intersections(xyxy[best:best + 1], xyxy[rest])[0]
+        union = box_areas[best] + box_areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def weighted_box_fusion(boxes, iou_threshold=0.55, skip_threshold=0.0, weights=None, num_sources=None):
+    """
+    Weighted box fusion: box của các nguồn (detector) cùng lớp có IoU > iou_threshold với
+    một cụm được gộp vào cụm đó; toạ độ cụm là trung bình theo score, score cụm là score trung
+    bình nhân tỉ lệ số nguồn đồng ý (cụm chỉ một detector thấy bị giảm tin cậy).
+
+    Args:
+        boxes: BoxSet (sources là chỉ số detector)
+        skip_threshold: Bỏ box có score thấp hơn
+        weights: Trọng số theo nguồn, không âm và có ít nhất một số dương (mặc định bằng nhau)
+        num_sources: Số nguồn (mặc định max(sources) + 1)
+
+    Returns:
+        tuple (BoxSet các cụm theo score giảm dần, mảng cụm của từng box đầu vào, -1 nếu bị bỏ)
+
+    Raises:
+        ValueError: Nếu weights có số âm hoặc không có số dương nào
+    """
+    count = len(boxes)
+    num_sources = num_sources or (int(boxes.sources.max()) + 1 if count else 1)
+    weights = np.ones(num_sources) if weights is None else np.asarray(weights, dtype=np.float64)
+    if not (weights >= 0).all() or not weights.max() > 0:
+        raise ValueError(f"Trọng số nguồn phải không âm và có ít nhất một số dương: {weights.tolist()}")
+    scores = boxes.scores * weights[boxes.sources] / weights.max()
+    assignment = np.full(count, -1, dtype=np.int64)
+
+    order = np.argsort(-scores, kind='stable')
+    order = order[scores[order] >= skip_threshold]
+    offsets = _label_offsets(boxes.xyxy, boxes.labels)
+    shifted = boxes.xyxy + offsets
+    # Tổng toạ độ * score, tổng score của từng cụm và box đầu tiên (score cao nhất) của cụm;
+    # cấp phát tối đa một cụm mỗi box
+    weighted = np.zeros((len(order), 4))
+    totals = np.zeros(len(order))
+    fused = np.zeros((len(order), 4))
+    first = np.zeros(len(order), dtype=np.int64)
+    clusters = 0
+    for index in order:
+        if clusters:
+            iou = iou_matrix(shifted[index:index + 1], fused[:clusters])[0]
+            best = int(np.argmax(iou))
+            if iou[best] <= iou_threshold:
+                best = clusters
+        else:
+            best = 0
+        if best == clusters:
+            first[best] = index
+            clusters += 1
+        assignment[index] = best
+        weighted[best] += shifted[index] * scores[index]
+        totals[best] += scores[index]
+        fused[best] = weighted[best] / totals[best] if totals[best] > 0 else shifted[index]
+
+    kept = assignment >= 0
+    members = np.bincount(assignment[kept], minlength=clusters)[:clusters]
+    # Số nguồn khác nhau trong mỗi cụm
+    pairs = np.unique(assignment[kept] * num_sources + boxes.sources[kept])
+    agreeing = np.bincount(pairs // num_sources, minlength=clusters)[:clusters]
+    cluster_scores = np.divide(totals[:clusters], members, out=np.zeros(clusters), where=members > 0)
+    cluster_scores *= np.minimum(agreeing, num_sources) / num_sources
+
+    # Nhãn / nguồn của cụm = của box score cao nhất
+    first = first[:clusters]
+    labels = boxes.labels[first]
+    xyxy = fused[:clusters] - offsets[first]
+
+    rank = np.argsort(-cluster_scores, kind='stable')
+    remap = np.empty(clusters, dtype=np.int64)
+    remap[rank] = np.arange(clusters)
+    assignment[kept] = remap[assignment[kept]]
+    result = BoxSet(xyxy[rank], cluster_scores[rank], labels[rank], boxes.names, boxes.sources[first][rank])
+    return result, assignment
+
+
+def _candidate_pairs(xyxy, labels, min_overlap):
+    """
+    Cặp (i, j) cùng lớp có giao / box nhỏ hơn >= min_overlap (mỗi cặp một lần).
+
+    Box được sắp theo x1 (sweep and prune): một khối BLOCK hàng chỉ cần so với các box
+    có x1 nhỏ hơn x2 lớn nhất của khối, nên chi phí gần tuyến tính khi box trải đều trên ảnh.
+    """
+    order = np.argsort(xyxy[:, 0], kind='stable')
+    boxes = xyxy[order]
+    sorted_labels = None if labels is None else labels[order]
+    rows, cols = [], []
+    for start in range(0, len(boxes), BLOCK):
+        stop = min(start + BLOCK, len(boxes))
+        end = max(stop, int(np.searchsorted(boxes[:, 0], boxes[start:stop, 2].max(), side='left')))
+        block = overlap_matrix(boxes[start:stop], boxes[start:end]) >= min_overlap
+        if sorted_labels is not None:
+            block &= sorted_labels[start:stop, None] == sorted_labels[None, start:end]
+        i, j = np.nonzero(block)
+        i += start
+        j += start
+        upper = i < j
+        rows.append(order[i[upper]])
+        cols.append(order[j[upper]])
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _components(count, rows, cols):
+    """Thành phần liên thông của đồ thị cạnh (rows, cols): nhãn = chỉ số nhỏ nhất của thành phần."""
+    parent = np.arange(count)
+    while True:
+        low = np.minimum(parent[rows], parent[cols])
+        high = np.maximum(parent[rows], parent[cols])
+        linked = low != high
+        if not linked.any():
+            return parent
+        # Gắn gốc lớn vào gốc nhỏ rồi nhảy con trỏ tới gốc
+        np.minimum.at(parent, high[linked], low[linked])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def cluster_overlapping(xyxy, labels=None, min_overlap=0.6):
+    """
+    Nhóm box cùng lớp chồng nhau (giao >= min_overlap box nhỏ hơn) rồi hợp mỗi nhóm thành
+    box bao cả nhóm; lặp tới khi không còn nhóm nào chồng nhau vì box hợp có thể chạm box khác.
+
+    Returns:
+        tuple (xyxy của các nhóm, mảng nhóm của từng box đầu vào)
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float64)
+    labels = None if labels is None else np.asarray(labels)
+    groups = np.arange(len(xyxy))
+    current, current_labels = xyxy, labels
+    while len(current) > 1:
+        rows, cols = _candidate_pairs(current, current_labels, min_overlap)
+        if not len(rows):
+            break
+        _, dense = np.unique(_components(len(current), rows, cols), return_inverse=True)
+        merged = np.empty((dense.max() + 1, 4))
+        merged[:, :2] = np.inf
+        merged[:, 2:] = -np.inf
+        np.minimum.at(merged[:, 0], dense, current[:, 0])
+        np.minimum.at(merged[:, 1], dense, current[:, 1])
+        np.maximum.at(merged[:, 2], dense, current[:, 2])
+        np.maximum.at(merged[:, 3], dense, current[:, 3])
+        if current_labels is not None:
+            group_labels = np.empty(len(merged), dtype=current_labels.dtype)
+            group_labels[dense] = current_labels
+            current_labels = group_labels
+        groups = dense[groups]
+        current = merged
+    return current, groups
+
+
+def _bbox(row):
+    return {'x1': int(round(row[0])), 'y1': int(round(row[1])), 'x2': int(round(row[2])), 'y2': int(round(row[3]))}
+
+
+def merge_overlapping_detections(detections, min_overlap=0.6):
+    """
+    Gộp detection cùng class_name chồng nhau (xem cluster_overlapping): bbox bao cả nhóm,
+    confidence và area lớn nhất; các trường khác lấy theo box lớn nhất của nhóm.
+
+    Returns:
+        List detection đã gộp (theo confidence giảm dần)
+    """
+    if not detections:
+        return []
+    boxes = BoxSet.from_detections(detections)
+    merged, groups = cluster_overlapping(boxes.xyxy, boxes.labels, min_overlap)
+    sizes = np.bincount(groups, minlength=len(merged))
+    confidence = np.full(len(merged), -np.inf)
+    np.maximum.at(confidence, groups, boxes.scores)
+    det_areas = np.array([det.get('area', np.nan) for det in detections], dtype=np.float64)
+    max_area = np.full(len(merged), np.nan)
+    np.fmax.at(max_area, groups, det_areas)
+    # Đại diện của nhóm: box lớn nhất, box đứng trước nếu bằng nhau
+    order = np.lexsort((np.arange(len(boxes)), -boxes.areas, groups))
+    _, starts = np.unique(groups[order], return_index=True)
+    representative = order[starts]
+
+    results = []
+    for group, index in enumerate(representative):
+        det = dict(detections[index])
+        if sizes[group] > 1:
+            det['bbox'] = _bbox(merged[group])
+            det['confidence'] = float(confidence[group])
+            if not np.isnan(max_area[group]):
+                det['area'] = float(max_area[group])
+        results.append(det)
+    results.sort(key=lambda d: d.get('confidence', 0), reverse=True)
+    return results
+
+
+def fuse_detections(sources, iou_threshold=0.55, skip_threshold=0.0, weights=None, class_aware=True):
+    """
+    Weighted box fusion trên detection của nhiều detector.
+
+    Args:
+        sources: dict tên detector -> list detection
+        weights: dict tên detector -> trọng số (mặc định 1)
+        class_aware: False = gộp cả box khác class_name (detector dùng tên lớp khác nhau)
+
+    Returns:
+        List detection đã gộp (theo confidence giảm dần); mỗi detection lấy các trường của
+        box score cao nhất trong cụm, bbox/confidence là kết quả gộp, 'sources' là các
+        detector đã thấy vùng đó
+    """
+    names = list(sources)
+    flat = [det for name in names for det in sources[name]]
+    if not flat:
+        return []
+    boxes = BoxSet.concat([BoxSet.from_detections(sources[name], source=i) for i, name in enumerate(names)])
+    if not class_aware:
+        boxes.labels[:] = 0
+    weights = [(weights or {}).get(name, 1.0) for name in names]
+    fused, assignment = weighted_box_fusion(boxes, iou_threshold, skip_threshold, weights, len(names))
+
+    results = [None] * len(fused)
+    seen = [set() for _ in range(len(fused))]
+    for index in np.argsort(-boxes.scores, kind='stable'):
+        cluster = assignment[index]
+        if cluster < 0:
+            continue
+        seen[cluster].add(names[boxes.sources[index]])
+        if results[cluster] is None:
+            results[cluster] = dict(flat[index])
+    for cluster, det in enumerate(results):
+        det['bbox'] = _bbox(fused.xyxy[cluster])
+        det['confidence'] = round(float(fused.scores[cluster]), 4)
+        det['sources'] = [name for name in names if name in seen[cluster]]
+    return results
@@ -0,0 +1,142 @@
+"""
+Phân loại màu pixel bằng bảng tra (lookup table) 3 chiều trên BGR.
+
+Thay cho việc đổi ảnh sang HSV rồi gọi cv2.inRange nhiều lần (cao răng, sâu răng,
+vết ố, lợi, men răng...) và OR các mask lại: mỗi màu BGR 24-bit được tính trước
+một bitmask các lớp, nên cả ảnh chỉ cần một lượt tra bảng để ra ảnh nhãn uint8.
+Bảng được dựng từ chính cv2.cvtColor + cv2.inRange nên kết quả trùng khớp với
+cách cũ. Ngưỡng HSV có thể ghi đè; bảng được dựng lại và cache theo bộ ngưỡng.
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from image_context import ImageContext
+
+# Ngưỡng HSV mặc định (H: 0-179) của từng lớp: danh sách (lower, upper)
+DEFAULT_RANGES = {
+    'calculus': [((15, 40, 60), (35, 255, 200))],       # Cao răng (vàng/nâu)
+    'cavity': [((0, 0, 0), (180, 255, 80))],            # Sâu răng (đen/nâu đậm)
+    'stain': [((10, 30, 40), (30, 200, 180))],          # Răng đổi màu (ố vàng/nâu)
+    'gum': [((0, 100, 100), (10, 255, 255)),            # Viêm lợi (đỏ, hai đầu dải H)
+            ((160, 100, 100), (180, 255, 255))],
+    'white': [((0, 0, 150), (180, 30, 255))],           # Răng khỏe mạnh (trắng)
+    'teeth': [((0, 0, 140), (180, 40, 255))],           # Vùng răng (trắng nhạt)
+    'tooth_stain': [((10, 30, 30), (30, 255, 200))],    # Vết ố của simple detector
+}
+
+# Bit của từng lớp trong ảnh nhãn (tối đa 8 lớp với uint8)
+CLASS_BITS = {name: 1 << i for i, name in enumerate(DEFAULT_RANGES)}
+
+# Mọi màu 24-bit xếp thành ảnh vuông 4096 x 4096 = 2^24 pixel
+_CUBE_SIDE = 4096
+
+
+def normalize_ranges(overrides=None):
+    """
+    Gộp ngưỡng ghi đè vào ngưỡng mặc định thành một key hashable (dùng để cache bảng).
+
+    Args:
+        overrides: dict {tên lớp: [(lower, upper), ...]} (có thể là list lồng từ JSON)
+
+    Returns:
+        tuple ((tên lớp, ((lower, upper), ...)), ...) theo thứ tự CLASS_BITS
+
+    Raises:
+        ValueError: Nếu tên lớp hoặc ngưỡng không hợp lệ
+    """
+    ranges = dict(DEFAULT_RANGES)
+    for name, value in (overrides or {}).items():
+        if name not in CLASS_BITS:
+            raise ValueError(f"Lớp màu không hỗ trợ: {name}")
+        ranges[name] = value
+
+    key = []
+    for name in CLASS_BITS:
+        pairs = []
+        for pair in ranges[name]:
+            try:
+                lower, upper = (tuple(int(v) for v in bound) for bound in pair)
+            except (TypeError, ValueError):
+                raise ValueError(f"Ngưỡng không hợp lệ cho lớp {name}: {pair}") from None
+            if len(lower) != 3 or len(upper) != 3:
+                raise ValueError(f"Ngưỡng HSV của lớp {name} phải có 3 giá trị: {pair}")
+            pairs.append((lower, upper))
+        key.append((name, tuple(pairs)))
+    return tuple(key)
+
+
+@lru_cache(maxsize=4)
+def _build_table(key):
+    """
+    Dựng bảng 2^24 phần tử: index (R << 16) | (G << 8) | B -> bitmask lớp.
+    Mất khoảng nửa giây và 16MB bộ nhớ, nên cache theo bộ ngưỡng.
+    """
+    # Byte thấp nhất của index là B
+    cube = np.arange(1 << 24, dtype='<u4').view(np.uint8).reshape(_CUBE_SIDE, _CUBE_SIDE, 4)
+    hsv = cv2.cvtColor(cv2.cvtColor(cube, cv2.COLOR_BGRA2BGR), cv2.COLOR_BGR2HSV)
+    del cube
+
+    table = np.zeros((_CUBE_SIDE, _CUBE_SIDE), dtype=np.uint8)
+    for name, pairs in key:
+        bit = CLASS_BITS[name]
+        for lower, upper in pairs:
+            hit = cv2.inRange(hsv, np.array(lower), np.array(upper))
+            cv2.bitwise_or(table, bit, dst=table, mask=hit)
+    table = table.ravel()
+    table.flags.writeable = False
+    return table
+
+
+def lookup_table(color_ranges=None):
+    """Bảng tra cho bộ ngưỡng (mặc định hoặc ghi đè), dựng lần đầu rồi cache."""
+    return _build_table(normalize_ranges(color_ranges))
+
+
+def classify(bgr, color_ranges=None):
+    """
+    Gán bitmask lớp màu cho từng pixel trong một lượt tra bảng.
+
+    Args:
+        bgr: Ảnh BGR uint8 (H, W, 3)
+        color_ranges: Ngưỡng HSV ghi đè (xem normalize_ranges)
+
+    Returns:
+        Ảnh nhãn uint8 (H, W); bit theo CLASS_BITS
+    """
+    table = lookup_table(color_ranges)
+    # BGRA xem như uint32 little-endian = (A << 24) | (R << 16) | (G << 8) | B
+    bgra = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA)
+    index = bgra.view('<u4')[..., 0]
+    index &= 0xFFFFFF
+    return np.take(table, index)
+
+
+def labels_for(image, color_ranges=None):
+    """
+    Ảnh nhãn màu của một ImageContext, tính một lần và dùng chung giữa các detector.
+
+    Args:
+        image: ImageContext (hoặc đường dẫn ảnh / mảng BGR)
+        color_ranges: Ngưỡng HSV ghi đè
+    """
+    ctx = ImageContext.ensure(image)
+    key = ('color_labels', normalize_ranges(color_ranges))
+    return ctx.cached(key, lambda: classify(ctx.bgr, color_ranges))
+
+
+def mask(labels, *names, value=255):
+    """
+    Mask uint8 (0/value) của các pixel thuộc ít nhất một trong các lớp names.
+
+    Args:
+        labels: Ảnh nhãn từ classify / labels_for (hoặc một vùng cắt của nó)
+        names: Tên lớp trong CLASS_BITS
+        value: Giá trị của pixel thuộc lớp (255 như cv2.inRange, 1 để đếm pixel)
+    """
+    bits = 0
+    for name in names:
+        bits |= CLASS_BITS[name]
+    hit = cv2.compare(cv2.bitwise_and(labels, bits), 0, cv2.CMP_GT)
+    return hit if value == 255 else cv2.min(hit, value)
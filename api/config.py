@@ -0,0 +1,254 @@
+"""
+Cấu hình runtime cho API.
+Mọi giá trị đều đọc từ biến môi trường (hoặc tệp .env) để có thể chỉnh khi deploy
+mà không cần sửa code.
+"""
+import json
+import os
+from dotenv import load_dotenv
+
+# Tải các biến môi trường từ tệp .env
+load_dotenv()
+
+
+def _env_int(name, default):
+    """Đọc biến môi trường kiểu int, trả về default nếu không có hoặc sai định dạng."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    """Đọc biến môi trường kiểu float, trả về default nếu không có hoặc sai định dạng."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name, default):
+    """Đọc biến môi trường kiểu bool ('1', 'true', 'yes', 'on' là True)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_json(name, default):
+    """Đọc biến môi trường dạng JSON, trả về default nếu không có hoặc sai định dạng."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        print(f"⚠️  {name} không phải JSON hợp lệ, dùng giá trị mặc định")
+        return default
+
+
+def _env_weights(name):
+    """Đọc biến môi trường JSON {tên: trọng số}; bỏ trọng số không phải số dương (dùng 1)."""
+    weights = _env_json(name, {})
+    if not isinstance(weights, dict):
+        print(f"⚠️  {name} phải là JSON object, bỏ qua")
+        return {}
+    valid = {}
+    for key, value in weights.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            valid[key] = float(value)
+        else:
+            print(f"⚠️  {name}: trọng số của {key} phải là số dương, dùng 1")
+    return valid
+
+
+# ---------------------------------------------------------------------------
+# Stage executor (/analyze)
+# ---------------------------------------------------------------------------
+
+# Số thread tối đa dùng chung cho các stage của mọi request
+STAGE_WORKERS = _env_int('DENTAL_STAGE_WORKERS', 8)
+
+# Timeout riêng cho từng stage (giây)
+STAGE_TIMEOUTS = {
+    'simple': _env_float('DENTAL_TIMEOUT_SIMPLE', 5.0),
+    'cv': _env_float('DENTAL_TIMEOUT_CV', 5.0),
+    'yolo': _env_float('DENTAL_TIMEOUT_YOLO', 10.0),
+    'cnn': _env_float('DENTAL_TIMEOUT_CNN', 10.0),
+    'gemini': _env_float('DENTAL_TIMEOUT_GEMINI', 25.0),
+}
+
+# Thời gian tối đa cho toàn bộ request (frontend tự huỷ sau 30s)
+REQUEST_TIMEOUT = _env_float('DENTAL_REQUEST_TIMEOUT', 28.0)
+
+# ---------------------------------------------------------------------------
+# Detector CV
+# ---------------------------------------------------------------------------
+
+# Detector CV chạy trên ảnh thu nhỏ có cạnh dài nhất N px (0 = độ phân giải gốc);
+# bbox được chiếu về toạ độ ảnh gốc
+DETECTOR_WORKING_SIDE = _env_int('DENTAL_DETECTOR_WORKING_SIDE', 1280)
+
+# Ghi đè ngưỡng HSV của các lớp màu, vd {"calculus": [[[15, 40, 60], [35, 255, 200]]]};
+# bảng tra màu được dựng lại theo bộ ngưỡng mới (xem color_lut.DEFAULT_RANGES)
+COLOR_RANGES = _env_json('DENTAL_COLOR_RANGES', {})
+
+# Ảnh rất lớn (scanner, X-quang toàn cảnh): xử lý theo ô tối đa TILE_SIZE px chồng nhau
+# TILE_OVERLAP px, tối đa TILE_WORKERS ô song song (0 = tắt). Áp dụng cho detector CV
+# (trên ảnh làm việc, nên thường đi kèm DENTAL_DETECTOR_WORKING_SIDE=0) và YOLO.
+# TILE_OVERLAP nên lớn hơn chiều rộng một răng để răng nằm trên đường nối không bị mất
+TILE_SIZE = _env_int('DENTAL_TILE_SIZE', 0)
+TILE_OVERLAP = _env_int('DENTAL_TILE_OVERLAP', 768)
+TILE_WORKERS = _env_int('DENTAL_TILE_WORKERS', 1)
+
+# Làm mịn của simple tooth detector trước khi threshold: bilateral (tham chiếu) |
+# guided (guided filter từ box filter) | bilateral_lowres (bilateral trên ảnh thu nhỏ +
+# guided upsampling). Xem smoothing.py và benchmarks/smoothing_parity.py
+SMOOTHING = os.getenv('DENTAL_SMOOTHING', 'bilateral')
+
+# ---------------------------------------------------------------------------
+# Cascade detector (xem detector_cascade.py)
+# ---------------------------------------------------------------------------
+
+# Chế độ mặc định khi request không gửi mode: fast | standard | full
+CASCADE_MODE = os.getenv('DENTAL_CASCADE_MODE', 'standard')
+
+# Ngân sách tính toán (ms) mỗi request của mode standard và fast (0 = không giới hạn);
+# request có thể gửi budget_ms để ghi đè
+CASCADE_BUDGET_MS = _env_float('DENTAL_CASCADE_BUDGET_MS', 0)
+CASCADE_FAST_BUDGET_MS = _env_float('DENTAL_CASCADE_FAST_BUDGET_MS', 250)
+
+# Kết quả của một detector được coi là đủ (không leo thang sang detector đắt hơn)
+# khi có ít nhất MIN_DETECTIONS vùng với confidence trung bình >= MIN_CONFIDENCE
+CASCADE_MIN_CONFIDENCE = _env_float('DENTAL_CASCADE_MIN_CONFIDENCE', 0.3)
+CASCADE_MIN_DETECTIONS = _env_int('DENTAL_CASCADE_MIN_DETECTIONS', 1)
+
+# Chi phí dự kiến (ms/ảnh) của từng detector trước khi có số đo thực tế; cũng quyết
+# định thứ tự leo thang (rẻ trước)
+DETECTOR_COSTS = {
+    'simple': _env_float('DENTAL_COST_SIMPLE', 60.0),
+    'cv': _env_float('DENTAL_COST_CV', 120.0),
+    'yolo': _env_float('DENTAL_COST_YOLO', 400.0),
+    'cnn': _env_float('DENTAL_COST_CNN', 150.0),
+}
+
+# Khi nhiều detector cùng có kết quả (vd mode full), box của chúng được gộp bằng
+# weighted box fusion thành fused_detections (xem box_fusion.py): box có IoU >
+# FUSION_IOU được gộp; FUSION_CLASS_AWARE=false gộp cả box khác lớp;
+# FUSION_WEIGHTS là trọng số (số dương) theo detector, vd {"yolo": 2}
+FUSION_IOU = _env_float('DENTAL_FUSION_IOU', 0.55)
+FUSION_CLASS_AWARE = _env_bool('DENTAL_FUSION_CLASS_AWARE', True)
+FUSION_WEIGHTS = _env_weights('DENTAL_FUSION_WEIGHTS')
+
+# ---------------------------------------------------------------------------
+# Upload & kết quả
+# ---------------------------------------------------------------------------
+
+# Lưu ảnh upload và ảnh kết quả vào thư mục uploads/ (tắt = xử lý hoàn toàn trong bộ nhớ)
+PERSIST_UPLOADS = _env_bool('DENTAL_PERSIST_UPLOADS', False)
+
+# Thư mục kho upload (mặc định <project>/uploads), tổng dung lượng tối đa (MB) và
+# chu kỳ dọn file ít dùng nhất khi vượt quota (giây)
+UPLOAD_DIR = os.getenv('DENTAL_UPLOAD_DIR', '')
+UPLOAD_QUOTA_MB = _env_int('DENTAL_UPLOAD_QUOTA_MB', 2048)
+UPLOAD_EVICT_INTERVAL = _env_float('DENTAL_UPLOAD_EVICT_INTERVAL', 60.0)
+
+# Dung lượng upload tối đa (MB); body được giữ trong bộ nhớ khi không lưu file
+MAX_UPLOAD_MB = _env_int('DENTAL_MAX_UPLOAD_MB', 20)
+
+# Kho ảnh kết quả trong bộ nhớ
+RESULT_TTL = _env_int('DENTAL_RESULT_TTL', 600)
+RESULT_STORE_MAX_ITEMS = _env_int('DENTAL_RESULT_STORE_MAX_ITEMS', 256)
+RESULT_STORE_MAX_MB = _env_int('DENTAL_RESULT_STORE_MAX_MB', 256)
+
+# Ảnh kết quả: định dạng ('jpeg' hoặc 'webp') và chất lượng (1-100)
+ANNOTATED_FORMAT = os.getenv('DENTAL_ANNOTATED_FORMAT', 'jpeg').lower()
+ANNOTATED_QUALITY = _env_int('DENTAL_ANNOTATED_QUALITY', _env_int('DENTAL_ANNOTATED_JPEG_QUALITY', 90))
+
+# Cạnh dài tối đa (px) của ảnh kết quả, bản preview và thumbnail; 0 = tắt
+ANNOTATED_MAX_SIDE = _env_int('DENTAL_ANNOTATED_MAX_SIDE', 0)
+ANNOTATED_PREVIEW_SIDE = _env_int('DENTAL_ANNOTATED_PREVIEW_SIDE', 0)
+ANNOTATED_THUMB_SIDE = _env_int('DENTAL_ANNOTATED_THUMB_SIDE', 0)
+
+# ---------------------------------------------------------------------------
+# Cache kết quả /analyze
+# ---------------------------------------------------------------------------
+
+RESULT_CACHE_ENABLED = _env_bool('DENTAL_RESULT_CACHE', True)
+RESULT_CACHE_MAX_ITEMS = _env_int('DENTAL_RESULT_CACHE_MAX_ITEMS', 512)
+RESULT_CACHE_TTL = _env_int('DENTAL_RESULT_CACHE_TTL', 86400)
+
+# Tầng đĩa (SQLite); để trống để tắt
+RESULT_CACHE_DISK_PATH = os.getenv('DENTAL_RESULT_CACHE_DISK_PATH', '')
+RESULT_CACHE_DISK_TTL = _env_int('DENTAL_RESULT_CACHE_DISK_TTL', 7 * 86400)
+
+# ---------------------------------------------------------------------------
+# /analyze/batch
+# ---------------------------------------------------------------------------
+
+BATCH_MAX_IMAGES = _env_int('DENTAL_BATCH_MAX_IMAGES', 50)
+BATCH_MAX_UPLOAD_MB = _env_int('DENTAL_BATCH_MAX_UPLOAD_MB', 200)
+
+# Số process cho detector CV; 0 = số core
+BATCH_CV_WORKERS = _env_int('DENTAL_BATCH_CV_WORKERS', 0)
+
+# Số lời gọi Gemini chạy cùng lúc cho mọi request batch (pool riêng, không chiếm
+# thread của các stage /analyze)
+BATCH_GEMINI_WORKERS = _env_int('DENTAL_BATCH_GEMINI_WORKERS', 4)
+
+# ---------------------------------------------------------------------------
+# Micro-batching cho CNN và YOLO
+# ---------------------------------------------------------------------------
+
+INFER_BATCHING = _env_bool('DENTAL_INFER_BATCHING', True)
+INFER_MAX_BATCH = _env_int('DENTAL_INFER_MAX_BATCH', 16)
+INFER_MAX_WAIT_MS = _env_float('DENTAL_INFER_MAX_WAIT_MS', 5.0)
+INFER_MAX_QUEUE = _env_int('DENTAL_INFER_MAX_QUEUE', 256)
+
+# ---------------------------------------------------------------------------
+# Job bất đồng bộ (/jobs)
+# ---------------------------------------------------------------------------
+
+JOB_WORKERS = _env_int('DENTAL_JOB_WORKERS', 4)
+JOB_MAX_QUEUE = _env_int('DENTAL_JOB_MAX_QUEUE', 64)
+JOB_TTL = _env_int('DENTAL_JOB_TTL', 600)
+
+# ---------------------------------------------------------------------------
+# Load model & readiness
+# ---------------------------------------------------------------------------
+
+# Chạy một lần inference giả sau khi load model (lần gọi thật đầu tiên không bị chậm)
+MODEL_WARMUP = _env_bool('DENTAL_MODEL_WARMUP', True)
+
+# Số thread TensorFlow của CNN: intra-op (trong một phép tính) và inter-op (các phép
+# tính song song); 0 = mặc định của TF. Khi chạy nhiều web worker trên cùng máy nên
+# đặt intra-op ~ số core / số worker (hoặc dùng model server)
+TF_INTRA_OP_THREADS = _env_int('DENTAL_TF_INTRA_OP_THREADS', 0)
+TF_INTER_OP_THREADS = _env_int('DENTAL_TF_INTER_OP_THREADS', 0)
+
+# Runtime của CNN: keras (mô hình .h5 gốc) | tflite | onnx (file lượng tử hoá do
+# export_cnn.py tạo, chạy trên CPU; số thread theo TF_INTRA_OP_THREADS). So sánh độ
+# chính xác / độ trễ trước khi đổi: benchmarks/cnn_runtime_report.py
+CNN_RUNTIME = os.getenv('DENTAL_CNN_RUNTIME', 'keras')
+# File mô hình của runtime; để trống = file mặc định trong models/ (xem model_loaders.CNN_RUNTIME_PATHS)
+CNN_MODEL_PATH = os.getenv('DENTAL_CNN_MODEL_PATH', '')
+
+# Các model phải sẵn sàng thì /readyz mới trả 200 (vd 'cnn,yolo');
+# để trống = chỉ cần detector CV, phục vụ ngay khi khởi động
+READY_REQUIRES = [name.strip() for name in os.getenv('DENTAL_READY_REQUIRES', '').split(',') if name.strip()]
+
+# ---------------------------------------------------------------------------
+# Model server (một process giữ CNN/YOLO cho mọi web worker)
+# ---------------------------------------------------------------------------
+
+# Unix socket của api/model_server.py; để trống = load model trong từng worker.
+# Job và ảnh /results vẫn nằm trong bộ nhớ của từng worker: chạy nhiều worker cần
+# định tuyến sticky theo client (xem api/model_server.py)
+MODEL_SERVER_SOCKET = os.getenv('DENTAL_MODEL_SERVER_SOCKET', '')
+
+# Ring buffer shared memory của mỗi worker: số slot và kích thước mỗi slot (MB)
+MODEL_SERVER_SLOTS = _env_int('DENTAL_MODEL_SERVER_SLOTS', 8)
+MODEL_SERVER_SLOT_MB = _env_int('DENTAL_MODEL_SERVER_SLOT_MB', 8)
+
+# Thời gian chờ tối đa cho một lần gọi model server (giây)
+MODEL_SERVER_TIMEOUT = _env_float('DENTAL_MODEL_SERVER_TIMEOUT', 30.0)
@@ -0,0 +1,226 @@
+"""
+Cascade detector theo chi phí cho pipeline /analyze.
+
+Mỗi detector (simple, color-based, YOLO) và classifier (CNN) khai báo chi phí
+dự kiến (ms). Các detector được xếp thành chuỗi từ rẻ tới đắt: detector sau chỉ
+chạy khi kết quả của các detector trước chưa đủ tin cậy (quá ít vùng hoặc
+confidence trung bình thấp) và chi phí dự kiến còn nằm trong ngân sách của request.
+
+Chế độ (mode):
+- fast: ngân sách mặc định DENTAL_CASCADE_FAST_BUDGET_MS, không gọi Gemini (sàng lọc nhanh)
+- standard: leo thang khi chưa đủ tin cậy, ngân sách DENTAL_CASCADE_BUDGET_MS (0 = không giới hạn)
+- full: chạy mọi detector, không giới hạn ngân sách; detector chạy sau một detector
+  cùng result_key đã đủ tin cậy không vẽ ảnh kết quả và không ghi đè kết quả đó
+  (kết quả của từng detector vẫn có trong detections_by_detector của response)
+
+Chuỗi được dựng thành các Stage của StageExecutor: mỗi detector phụ thuộc các
+detector trước nó, quyết định chạy/bỏ qua nằm trong condition của stage.
+"""
+import threading
+import time
+
+from stage_executor import Stage, STATUS_OK, STATUS_SKIPPED
+
+MODE_FAST = 'fast'
+MODE_STANDARD = 'standard'
+MODE_FULL = 'full'
+MODES = (MODE_FAST, MODE_STANDARD, MODE_FULL)
+
+KIND_DETECTOR = 'detector'
+KIND_CLASSIFIER = 'classifier'
+
+# Lý do một detector không chạy (trả về trong response)
+SKIP_SUFFICIENT = 'sufficient'
+SKIP_BUDGET = 'budget'
+SKIP_MODE = 'mode'  # Gemini ở mode fast
+
+
+class Detector:
+    """Một detector/classifier trong cascade."""
+
+    # Trọng số của lần đo mới trong trung bình trượt của chi phí
+    _SMOOTHING = 0.2
+
+    def __init__(self, name, run, cost_ms, kind=KIND_DETECTOR, result_key=None, available=None):
+        """
+        Args:
+            name: Tên (cũng là tên stage)
+            run: Hàm run(ctx, publish, timeout) -> dict gộp vào combined_result; publish=False
+                khi một detector rẻ hơn đã cho kết quả đủ tin cậy (không vẽ ảnh kết quả);
+                timeout là số giây còn lại của stage (None = không giới hạn), dùng khi
+                chờ hàng đợi micro-batching
+            cost_ms: Chi phí dự kiến (ms) cho một ảnh, trước khi có số đo thực tế
+            kind: KIND_DETECTOR (tham gia chuỗi leo thang) hoặc KIND_CLASSIFIER (chạy song song)
+            result_key: Key trong dict kết quả chứa {'detections': [...]} để đánh giá độ tin cậy;
+                các detector cùng result_key là các cách khác nhau cho cùng một kết quả
+            available: Hàm available() -> bool (model đã load, thư viện có cài...)
+        """
+        self.name = name
+        self.run = run
+        self.cost_ms = float(cost_ms)
+        self.kind = kind
+        self.result_key = result_key
+        self.available = available
+        self._observed_ms = None
+        self._runs = 0
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return self.available() if self.available is not None else True
+
+    @property
+    def expected_ms(self):
+        """Chi phí dự kiến: trung bình trượt của thời gian chạy thực tế, bắt đầu từ cost_ms."""
+        observed = self._observed_ms
+        return observed if observed is not None else self.cost_ms
+
+    def observe(self, seconds):
+        """
+        Ghi nhận thời gian chạy thực tế của một lần chạy.
+        Lần chạy đầu bị bỏ qua vì gồm cả phần khởi tạo (bảng tra màu, graph của model).
+        """
+        with self._lock:
+            self._runs += 1
+            if self._runs == 1:
+                return
+            current = self.expected_ms
+            self._observed_ms = current + self._SMOOTHING * (seconds * 1000 - current)
+
+    def detections(self, value):
+        """List detection trong kết quả của detector (rỗng nếu không tìm thấy gì)."""
+        section = (value or {}).get(self.result_key) if self.result_key else None
+        return (section or {}).get('detections') or []
+
+    def to_dict(self):
+        return {'kind': self.kind, 'cost_ms': self.cost_ms, 'expected_ms': round(self.expected_ms, 1),
+                'runs': self._runs}
+
+
+class CascadePolicy:
+    """Quyết định detector nào chạy cho một request."""
+
+    def __init__(self, mode=MODE_STANDARD, budget_ms=None, min_confidence=0.3, min_detections=1):
+        """
+        Args:
+            mode: MODE_FAST, MODE_STANDARD hoặc MODE_FULL
+            budget_ms: Ngân sách tính toán (ms) cho detector + classifier, None = không giới hạn.
+                Detector rẻ nhất luôn chạy để request có kết quả
+            min_confidence: Confidence trung bình tối thiểu để coi kết quả là đủ
+            min_detections: Số vùng tối thiểu để coi kết quả là đủ
+
+        Raises:
+            ValueError: Nếu mode hoặc budget_ms không hợp lệ
+        """
+        if mode not in MODES:
+            raise ValueError(f"Mode không hợp lệ: {mode} (chọn {', '.join(MODES)})")
+        if budget_ms is not None and budget_ms < 0:
+            raise ValueError("budget_ms phải >= 0")
+        self.mode = mode
+        self.budget_ms = budget_ms
+        self.min_confidence = min_confidence
+        self.min_detections = min_detections
+        self.skipped = {}
+
+    @property
+    def include_gemini(self):
+        """Gemini là lời gọi API bên ngoài (vài giây), không dùng khi sàng lọc nhanh."""
+        return self.mode != MODE_FAST
+
+    def cache_options(self):
+        """Phần tuỳ chọn ảnh hưởng tới kết quả, đưa vào key cache."""
+        return {'mode': self.mode, 'budget_ms': self.budget_ms,
+                'min_confidence': self.min_confidence, 'min_detections': self.min_detections}
+
+    def is_sufficient(self, detections):
+        """Kết quả đủ tin cậy: đủ số vùng và confidence trung bình đạt ngưỡng."""
+        if len(detections) < max(1, self.min_detections):
+            return False
+        mean = sum(det.get('confidence', 0.0) for det in detections) / len(detections)
+        return mean >= self.min_confidence
+
+    def _fits(self, detector, spent_ms):
+        return self.budget_ms is None or spent_ms + detector.expected_ms <= self.budget_ms
+
+    def build_stages(self, ctx, detectors, timeouts=None):
+        """
+        Dựng các Stage cho một request.
+
+        Args:
+            ctx: ImageContext truyền cho Detector.run
+            detectors: List Detector (cả detector và classifier)
+            timeouts: dict tên -> timeout (giây) của stage
+
+        Returns:
+            list Stage: chuỗi detector (rẻ trước) rồi tới các classifier vừa ngân sách
+        """
+        timeouts = timeouts or {}
+        available = [d for d in detectors if d.is_available()]
+        chain = sorted((d for d in available if d.kind == KIND_DETECTOR), key=lambda d: d.expected_ms)
+        by_name = {d.name: d for d in chain}
+        stages = []
+
+        # Classifier chạy song song với chuỗi; được giữ chỗ trong ngân sách sau detector rẻ nhất
+        classifiers = []
+        classifier_ms = 0.0
+        cheapest_ms = chain[0].expected_ms if chain else 0.0
+        for detector in available:
+            if detector.kind != KIND_CLASSIFIER:
+                continue
+            if not self._fits(detector, cheapest_ms + classifier_ms):
+                self.skipped[detector.name] = SKIP_BUDGET
+                continue
+            classifier_ms += detector.expected_ms
+            classifiers.append(Stage(detector.name,
+                                     lambda inputs, detector=detector: self._run(detector, ctx, True, inputs),
+                                     timeout=timeouts.get(detector.name)))
+
+        def sufficient_before(results):
+            """Detector đã chạy trước đó có kết quả đủ tin cậy (None nếu chưa có)."""
+            for name, result in results.items():
+                if result.status == STATUS_OK and self.is_sufficient(by_name[name].detections(result.value)):
+                    return by_name[name]
+            return None
+
+        for index, detector in enumerate(chain):
+            previous = [d.name for d in chain[:index]]
+
+            def condition(results, detector=detector):
+                covered = sufficient_before(results)
+                if covered is not None and self.mode != MODE_FULL:
+                    self.skipped[detector.name] = SKIP_SUFFICIENT
+                    return False
+                spent_ms = sum(r.elapsed for r in results.values() if r.status != STATUS_SKIPPED) * 1000
+                if not self._fits(detector, spent_ms + classifier_ms):
+                    self.skipped[detector.name] = SKIP_BUDGET
+                    return False
+                return True
+
+            def func(inputs, detector=detector):
+                # Chỉ khi mode full: detector rẻ hơn đã đủ, giữ ảnh kết quả của nó
+                publish = sufficient_before(inputs.results) is None
+                return self._run(detector, ctx, publish, inputs)
+
+            # Detector rẻ nhất luôn chạy
+            stages.append(Stage(detector.name, func, depends_on=previous,
+                                condition=condition if index else None,
+                                timeout=timeouts.get(detector.name)))
+
+        return stages + classifiers
+
+    @staticmethod
+    def _run(detector, ctx, publish, inputs):
+        started = time.perf_counter()
+        value = detector.run(ctx, publish, inputs.remaining())
+        detector.observe(time.perf_counter() - started)
+        return value
+
+    def summary(self, results):
+        """Tóm tắt cho response: mode, ngân sách, thời gian đã dùng và detector bị bỏ qua."""
+        spent = sum(r.elapsed for name, r in results.items()
+                    if r.status != STATUS_SKIPPED and name != 'gemini')
+        return {
+            'mode': self.mode,
+            'budget_ms': self.budget_ms,
+            'spent_ms': round(spent * 1000, 1),
+            'skipped': dict(self.skipped),
+        }
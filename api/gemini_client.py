@@ -6,7 +6,6 @@ import os
 import re
 import json
 from dotenv import load_dotenv
-import google.generativeai as genai
 from PIL import Image
 
 # Tải các biến môi trường từ tệp .env
@@ -28,6 +27,9 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("Không tìm thấy GEMINI_API_KEY trong tệp .env hoặc biến môi trường!")
         
+        # Import khi cần: google.generativeai nặng, không làm chậm lúc khởi động server
+        import google.generativeai as genai
+
         # Cấu hình API key cho thư viện
         genai.configure(api_key=self.api_key)
         
@@ -40,13 +42,20 @@ class GeminiClient:
         Phân tích ảnh răng miệng bằng cách gửi ảnh và prompt đến Gemini.
         
         Args:
-            image_path (str or PIL.Image): Đường dẫn đến tệp ảnh hoặc đối tượng ảnh PIL.
+            image_path (str, PIL.Image or ImageContext): Đường dẫn đến tệp ảnh,
+                đối tượng ảnh PIL hoặc ImageContext đã decode sẵn.
             
         Returns:
             dict: Một dictionary chứa kết quả phân tích hoặc thông báo lỗi.
         """
         try:
-            img = Image.open(image_path) if isinstance(image_path, str) else image_path
+            if isinstance(image_path, str):
+                img = Image.open(image_path)
+            elif hasattr(image_path, 'pil'):
+                # ImageContext: dùng lại ảnh đã decode
+                img = image_path.pil
+            else:
+                img = image_path
             
             # Đảm bảo ảnh ở chế độ RGB
             if img.mode != 'RGB':
@@ -82,17 +91,27 @@ class GeminiClient:
             }
         except Exception as e:
             error_message = str(e)
+            error_type = 'other'
             if "API key not valid" in error_message:
                 error_message = f"API Key không hợp lệ hoặc không có quyền truy cập model '{self.model_name}'."
+                error_type = 'api_key'
             elif "Không nhận được phản hồi từ AI" in error_message:
                 error_message = "AI không thể phân tích ảnh này. Vui lòng thử lại với ảnh khác hoặc chụp lại rõ hơn."
+                error_type = 'empty_response'
             elif "Phản hồi từ AI không đúng định dạng" in error_message:
                 error_message = "Có lỗi trong quá trình phân tích. Vui lòng thử lại."
+                error_type = 'bad_format'
             elif "could not convert string to float" in error_message:
                 error_message = "Lỗi xử lý dữ liệu. Vui lòng thử lại."
+                error_type = 'parse'
+            elif "429" in error_message or "quota" in error_message.lower():
+                error_type = 'quota'
+            elif "deadline" in error_message.lower() or "timed out" in error_message.lower():
+                error_type = 'timeout'
             return {
                 'success': False,
-                'error': error_message
+                'error': error_message,
+                'error_type': error_type
             }
 
     def _create_analysis_prompt(self):
@@ -0,0 +1,212 @@
+"""
+Ngữ cảnh ảnh cho một request.
+Ảnh upload chỉ được decode một lần thành mảng BGR; các dạng khác (RGB, gray, HSV,
+PIL, input 224x224 cho CNN) được tạo lười khi có stage cần và dùng chung cho mọi
+detector, hàm vẽ và model client.
+"""
+import os
+import threading
+import cv2
+import numpy as np
+
+# Kích thước input của CNN (xem DentalCNNModel.input_shape)
+CNN_INPUT_SIZE = (224, 224)
+
+
+def _lazy_view(func):
+    """
+    Decorator cho property tính lười và cache theo từng instance.
+    Có khoá để các stage chạy song song không tính trùng cùng một view.
+    """
+    name = func.__name__
+
+    def getter(self):
+        cache = self._views
+        if name in cache:
+            return cache[name]
+        with self._lock:
+            if name not in cache:
+                cache[name] = func(self)
+            return cache[name]
+
+    getter.__doc__ = func.__doc__
+    return property(getter)
+
+
+def scale_pixels(value, scale, odd=False, minimum=1):
+    """
+    Quy đổi một hằng số tính bằng pixel (kích thước kernel, lề) sang ảnh làm việc.
+
+    Args:
+        value: Giá trị trên ảnh gốc
+        scale: Tỉ lệ ảnh làm việc / ảnh gốc
+        odd: Làm tròn lên số lẻ (kernel của bilateral, adaptiveThreshold)
+        minimum: Giá trị nhỏ nhất
+    """
+    if scale == 1.0:
+        return value
+    scaled = max(minimum, int(round(value * scale)))
+    if odd and scaled % 2 == 0:
+        scaled += 1
+    return scaled
+
+
+class ImageContext:
+    """
+    Ảnh đã decode của một request cùng các view dẫn xuất.
+
+    Mảng BGR gốc và các view được dùng chung giữa các thread nên phải coi là
+    read-only; hàm nào cần vẽ lên ảnh phải copy trước.
+    """
+
+    def __init__(self, bgr, source=None, scale=1.0):
+        """
+        Args:
+            bgr: Ảnh BGR uint8 (H, W, 3) như cv2.imread trả về
+            source: Đường dẫn file gốc (nếu có), dùng để đặt tên file kết quả
+            scale: Tỉ lệ so với ảnh gốc (< 1 với ảnh làm việc, xem working)
+        """
+        if bgr is None or bgr.ndim != 3 or bgr.shape[2] != 3:
+            raise ValueError("Ảnh không hợp lệ: cần mảng BGR (H, W, 3)")
+        self.bgr = bgr
+        self.source = source
+        self.scale = scale
+        self._views = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_path(cls, image_path):
+        """Decode ảnh từ file."""
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"Không thể đọc ảnh: {image_path}")
+        return cls(img, source=image_path)
+
+    @classmethod
+    def from_bytes(cls, data, source=None):
+        """
+        Decode ảnh trực tiếp từ bộ nhớ (không ghi ra đĩa).
+
+        Args:
+            data: Nội dung file ảnh (bytes, bytearray hoặc memoryview)
+            source: Đường dẫn file gốc nếu ảnh cũng được lưu ra đĩa
+        """
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        img = cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+        if img is None:
+            raise ValueError("Không thể decode ảnh từ dữ liệu upload")
+        return cls(img, source=source)
+
+    @classmethod
+    def ensure(cls, image):
+        """
+        Chuyển đầu vào về ImageContext.
+
+        Args:
+            image: ImageContext, đường dẫn file hoặc mảng BGR
+
+        Returns:
+            ImageContext, hoặc None nếu không đọc được ảnh
+        """
+        if isinstance(image, cls):
+            return image
+        if isinstance(image, np.ndarray):
+            return cls(image)
+        if isinstance(image, (str, os.PathLike)):
+            try:
+                return cls.from_path(os.fspath(image))
+            except ValueError:
+                return None
+        raise TypeError(f"Kiểu ảnh không hỗ trợ: {type(image).__name__}")
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    @_lazy_view
+    def rgb(self):
+        """Ảnh RGB (cho CNN, Gemini)."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+
+    @_lazy_view
+    def gray(self):
+        """Ảnh grayscale."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @_lazy_view
+    def hsv(self):
+        """Ảnh HSV (H: 0-179)."""
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+
+    @_lazy_view
+    def pil(self):
+        """PIL Image chế độ RGB (cho Gemini)."""
+        from PIL import Image
+        return Image.fromarray(self.rgb)
+
+    @_lazy_view
+    def cnn_input(self):
+        """Ảnh RGB uint8 đã resize về kích thước input của CNN."""
+        return cv2.resize(self.rgb, CNN_INPUT_SIZE, interpolation=cv2.INTER_LINEAR)
+
+    def cached(self, key, factory):
+        """
+        View dẫn xuất tuỳ ý (vd ảnh nhãn màu), tính một lần theo key và dùng chung.
+
+        Args:
+            key: Key hashable, không trùng tên các view có sẵn
+            factory: Hàm không tham số tạo view
+        """
+        cache = self._views
+        if key in cache:
+            return cache[key]
+        with self._lock:
+            if key not in cache:
+                cache[key] = factory()
+            return cache[key]
+
+    def working(self, max_side):
+        """
+        Ảnh làm việc có cạnh dài nhất không quá max_side, cache theo max_side.
+
+        Detector CV chạy trên ảnh này thay cho ảnh 12-48MP gốc; toạ độ trên ảnh
+        làm việc chia cho .scale để về toạ độ gốc (xem project_bbox).
+
+        Args:
+            max_side: Cạnh dài tối đa (px); 0/None = dùng chính ảnh gốc
+
+        Returns:
+            ImageContext (chính nó nếu ảnh đã đủ nhỏ)
+        """
+        longest = max(self.height, self.width)
+        if not max_side or longest <= max_side:
+            return self
+        key = f'working_{max_side}'
+        with self._lock:
+            if key not in self._views:
+                scale = max_side / longest
+                size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+                small = cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA)
+                # Tỉ lệ thực theo chiều rộng sau khi làm tròn
+                self._views[key] = ImageContext(small, source=self.source,
+                                                scale=self.scale * size[0] / self.width)
+            return self._views[key]
+
+    def project_bbox(self, x, y, w, h, original):
+        """
+        Chiếu bbox (x, y, w, h) trên ảnh này về toạ độ của ảnh gốc original.
+
+        Returns:
+            dict {'x1', 'y1', 'x2', 'y2'} (int, đã kẹp trong ảnh gốc)
+        """
+        factor = original.scale / self.scale
+        return {
+            'x1': max(0, int(round(x * factor))),
+            'y1': max(0, int(round(y * factor))),
+            'x2': min(original.width, int(round((x + w) * factor))),
+            'y2': min(original.height, int(round((y + h) * factor))),
+        }
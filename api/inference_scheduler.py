@@ -0,0 +1,180 @@
+"""
+Micro-batching cho model inference.
+Gom các request đang chờ thành một batch và gọi model một lần, vì mỗi lần gọi
+model.predict / YOLO có chi phí cố định lớn hơn nhiều so với thêm một ảnh vào batch.
+Batch được xả khi đủ kích thước tối đa hoặc khi request đầu tiên đã chờ đủ lâu.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class QueueFullError(RuntimeError):
+    """Hàng đợi inference đã đầy."""
+
+
+class _Pending:
+    __slots__ = ('item', 'future', 'enqueued_at')
+
+    def __init__(self, item):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Scheduler gom request thành batch cho một hàm batch_fn(items) -> results.
+    Mỗi model có một thread worker riêng nên các lần gọi model không chồng lên nhau.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=16, max_wait_ms=5.0, max_queue=256,
+                 on_batch=None):
+        """
+        Args:
+            name: Tên scheduler (dùng trong log và thống kê)
+            batch_fn: Hàm nhận list item, trả về list kết quả cùng thứ tự
+            max_batch_size: Số item tối đa mỗi batch
+            max_wait_ms: Thời gian chờ tối đa (ms) tính từ item đầu tiên của batch
+            max_queue: Số item tối đa đang chờ; vượt quá thì submit báo lỗi
+            on_batch: Callback on_batch(batch_size, queue_waits, elapsed) sau mỗi batch
+        """
+        self.name = name
+        self.batch_fn = batch_fn
+        self.on_batch = on_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'rejected': 0,
+            'errors': 0,
+            'max_batch_size_seen': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'inference_total': 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name=f'batcher-{name}', daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """
+        Đưa item vào hàng đợi.
+
+        Returns:
+            Future chứa kết quả của item
+
+        Raises:
+            QueueFullError: Nếu hàng đợi đã đầy
+        """
+        pending = _Pending(item)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            raise QueueFullError(f"Hàng đợi inference '{self.name}' đã đầy")
+        return pending.future
+
+    def queue_depth(self):
+        """Số item đang chờ trong hàng đợi."""
+        return self._queue.qsize()
+
+    def __call__(self, item, timeout=None):
+        """
+        Submit item và chờ kết quả.
+
+        Args:
+            timeout: Thời gian chờ tối đa (giây); hết thời gian thì item bị huỷ (nếu
+                chưa vào batch thì không chạy model nữa) và báo TimeoutError
+
+        Raises:
+            QueueFullError: Nếu hàng đợi đã đầy
+            TimeoutError: Nếu hết timeout trước khi có kết quả
+        """
+        future = self.submit(item)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Hết {timeout:.2f}s chờ inference '{self.name}'")
+
+    def stats(self):
+        """Thống kê: số request, kích thước batch đạt được, thời gian chờ trong hàng đợi."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        requests = stats['requests']
+        batches = stats['batches']
+        return {
+            'requests': requests,
+            'batches': batches,
+            'rejected': stats['rejected'],
+            'errors': stats['errors'],
+            'queue_depth': self.queue_depth(),
+            'avg_batch_size': requests / batches if batches else 0.0,
+            'max_batch_size_seen': stats['max_batch_size_seen'],
+            'avg_queue_wait_ms': stats['queue_wait_total'] / requests * 1000 if requests else 0.0,
+            'max_queue_wait_ms': stats['queue_wait_max'] * 1000,
+            'avg_inference_ms': stats['inference_total'] / batches * 1000 if batches else 0.0,
+            'config': {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_queue': self._queue.maxsize,
+            },
+        }
+
+    def _collect(self):
+        """Chờ item đầu tiên rồi gom thêm tới khi đủ batch hoặc hết thời gian chờ."""
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Bỏ các item đã bị huỷ (hết timeout của stage trong __call__) trước khi chạy model
+            batch = [p for p in batch if p.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            waits = [started - p.enqueued_at for p in batch]
+            try:
+                results = self.batch_fn([p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch_fn trả về {len(results)} kết quả cho {len(batch)} item")
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                for p in batch:
+                    p.future.set_exception(e)
+            else:
+                for p, result in zip(batch, results):
+                    p.future.set_result(result)
+            elapsed = time.monotonic() - started
+
+            with self._stats_lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], len(batch))
+                self._stats['queue_wait_total'] += sum(waits)
+                self._stats['queue_wait_max'] = max(self._stats['queue_wait_max'], max(waits))
+                self._stats['inference_total'] += elapsed
+
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(len(batch), waits, elapsed)
+                except Exception as e:
+                    print(f"⚠️  Batcher callback error ({self.name}): {e}")
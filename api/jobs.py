@@ -0,0 +1,202 @@
+"""
+Job bất đồng bộ cho phân tích ảnh.
+POST /jobs trả về job id ngay; job chạy trên worker pool với hàng đợi giới hạn,
+kết quả từng stage được lưu vào job và đẩy tới client qua Server-Sent Events
+ngay khi stage đó xong.
+"""
+import json
+import queue
+import threading
+import time
+import uuid
+
+# Trạng thái job
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class JobQueueFullError(RuntimeError):
+    """Hàng đợi job đã đầy."""
+
+
+class Job:
+    """Một job phân tích cùng kết quả từng phần và danh sách event."""
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self._events = []
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def emit(self, event, data):
+        """Ghi nhận một event và đánh thức các client đang chờ."""
+        with self._cond:
+            self._events.append((len(self._events) + 1, event, data))
+            self._cond.notify_all()
+
+    def stage_done(self, name, status, elapsed_ms, output):
+        """Lưu kết quả một stage và đẩy event 'stage'."""
+        stage = {'status': status, 'elapsed_ms': elapsed_ms, 'output': output}
+        with self._cond:
+            self.stages[name] = stage
+        self.emit('stage', {'stage': name, **stage})
+
+    def set_running(self):
+        self.status = JOB_RUNNING
+        self.emit('status', {'status': JOB_RUNNING})
+
+    def set_done(self, result):
+        # Trạng thái và event cuối đổi cùng lúc: client thấy job xong thì event 'done' đã có
+        with self._cond:
+            self.result = result
+            self.finished_at = time.time()
+            self.status = JOB_DONE
+            self.emit('done', result)
+
+    def set_failed(self, error):
+        with self._cond:
+            self.error = error
+            self.finished_at = time.time()
+            self.status = JOB_FAILED
+            self.emit('error', {'error': error})
+
+    def to_dict(self):
+        """Trạng thái hiện tại của job, gồm kết quả từng phần."""
+        with self._cond:
+            stages = dict(self.stages)
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'stages': stages,
+            'result': self.result,
+            'error': self.error,
+        }
+
+    def wait_events(self, after, timeout):
+        """
+        Chờ các event có id lớn hơn after.
+
+        Returns:
+            List (id, event, data); rỗng nếu hết thời gian chờ. Job đã xong mà
+            không còn event sau after (client kết nối lại sau event cuối) thì trả
+            về event cuối ('done' hoặc 'error') để client biết job đã kết thúc.
+        """
+        with self._cond:
+            if len(self._events) <= after and not self.finished:
+                self._cond.wait(timeout)
+            if self.finished and len(self._events) <= after:
+                return self._events[-1:]
+            return self._events[after:]
+
+
+class JobManager:
+    """Hàng đợi job giới hạn và worker pool chạy hàm runner(job)."""
+
+    def __init__(self, runner, workers=4, max_queue=64, ttl=600):
+        """
+        Args:
+            runner: Hàm runner(job) -> kết quả cuối; dùng job.stage_done để báo từng stage
+            workers: Số worker thread
+            max_queue: Số job tối đa đang chờ
+            ttl: Thời gian giữ job đã xong (giây)
+        """
+        self.runner = runner
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, payload):
+        """
+        Tạo job mới và đưa vào hàng đợi.
+
+        Raises:
+            JobQueueFullError: Nếu hàng đợi đã đầy
+        """
+        self._purge()
+        job = Job(payload)
+        job.emit('status', {'status': JOB_QUEUED})
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFullError('Hệ thống đang quá tải, vui lòng thử lại sau')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'queue_depth': self._queue.qsize(), 'jobs': counts}
+
+    def stream(self, job, last_event_id=0, heartbeat=15.0):
+        """
+        Generator các chuỗi Server-Sent Events cho một job.
+        Kết thúc sau event 'done' hoặc 'error' (gửi lại event này nếu client kết
+        nối lại với Last-Event-ID từ event cuối trở về sau).
+        """
+        after = last_event_id
+        while True:
+            events = job.wait_events(after, heartbeat)
+            if not events:
+                # Giữ kết nối qua proxy
+                yield ': keep-alive\n\n'
+                continue
+            for event_id, event, data in events:
+                after = event_id
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if event in ('done', 'error'):
+                    return
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.set_running()
+            try:
+                result = self.runner(job)
+            except Exception as e:
+                print(f"❌ Job {job.id} failed: {e}")
+                job.set_failed(str(e))
+            else:
+                job.set_done(result)
+            finally:
+                # Không giữ bytes ảnh sau khi xử lý xong
+                job.payload = None
+
+    def _purge(self):
+        """Xoá job đã xong quá ttl."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at + self.ttl < now]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,107 @@
+"""
+Đo bộ nhớ (RSS) của process để ước lượng kích thước container.
+
+Trên Linux đọc /proc/self/status (VmRSS, VmHWM) và reset đỉnh RSS qua
+/proc/self/clear_refs; nơi khác dùng resource.getrusage (chỉ có đỉnh từ lúc
+process chạy, không reset được).
+"""
+import sys
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _status_kb(field):
+    """Giá trị (kB) của một dòng trong /proc/self/status, None nếu không đọc được."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _rusage_peak():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về kB, macOS trả về byte
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    """RSS hiện tại (byte)."""
+    kb = _status_kb('VmRSS')
+    return kb * 1024 if kb is not None else _rusage_peak()
+
+
+def peak_rss():
+    """Đỉnh RSS (byte) kể từ lúc process chạy hoặc lần reset_peak gần nhất."""
+    kb = _status_kb('VmHWM')
+    return kb * 1024 if kb is not None else _rusage_peak()
+
+
+def reset_peak():
+    """Đặt lại đỉnh RSS về RSS hiện tại (Linux >= 4.0); trả về False nếu không hỗ trợ."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class PeakTracker:
+    """
+    Đỉnh RSS trong lúc xử lý request.
+
+    RSS là của cả process nên khi nhiều request chạy chồng nhau, mỗi request
+    nhận đỉnh của cả khoảng thời gian đó (giá trị cần để chọn cỡ container).
+    Đỉnh chỉ được reset khi không còn request nào đang đo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._started = 0
+        self.resettable = None  # None = chưa thử
+
+    @contextmanager
+    def track(self):
+        """
+        Context manager; dict trả về được điền sau khi thoát:
+        {'peak_rss': byte, 'start_rss': byte, 'overlapped': có request khác chạy cùng}
+        """
+        usage = {'peak_rss': 0, 'start_rss': current_rss(), 'overlapped': False}
+        with self._lock:
+            if self._active == 0 and self.resettable is not False:
+                self.resettable = reset_peak()
+            usage['overlapped'] = self._active > 0
+            self._active += 1
+            self._started += 1
+            started = self._started
+        try:
+            yield usage
+        finally:
+            with self._lock:
+                # Đọc trước khi request khác có thể reset đỉnh
+                usage['peak_rss'] = peak_rss()
+                self._active -= 1
+                # Có request khác bắt đầu sau hoặc vẫn đang chạy
+                usage['overlapped'] = (usage['overlapped'] or self._active > 0
+                                       or self._started != started)
+
+
+def format_mb(num_bytes):
+    """Byte -> MB (làm tròn 1 chữ số)."""
+    return round(num_bytes / (1024 * 1024), 1)
+
+
+# Dùng chung trong process
+TRACKER = PeakTracker()
@@ -0,0 +1,306 @@
+"""
+Metrics registry kiểu Prometheus, không cần service ngoài.
+Mỗi thread ghi vào shard riêng (không lock trên đường nóng); khi /metrics được
+gọi, các shard mới được cộng lại và xuất theo text exposition format. Shard của
+thread đã kết thúc (server tạo một thread cho mỗi request) được gộp vào một bộ
+cộng dồn chung, nên số shard chỉ bằng số thread còn sống.
+"""
+import abc
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket mặc định cho latency (giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Bucket cho kích thước upload (byte)
+SIZE_BUCKETS = (64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6)
+
+# Bucket cho bộ nhớ process (byte)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (256, 512, 768, 1024, 1536, 2048, 3072, 4096, 6144, 8192))
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    """Cơ sở cho metric có shard theo thread."""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # [(thread, shard)] của các thread đã ghi; shard của thread đã chết gộp vào _base
+        self._shards = []
+        self._base = {}
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            # Chỉ lock một lần cho mỗi thread
+            with self._shards_lock:
+                self._prune()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _prune(self):
+        """Gộp shard của các thread đã kết thúc vào _base (gọi khi giữ _shards_lock)."""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                # Thread đã chết không còn ghi vào shard, đọc không cần copy
+                self._merge(self._base, shard)
+        self._shards = alive
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần đúng các label {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _snapshots(self):
+        with self._shards_lock:
+            self._prune()
+            base = self._merge({}, self._base)
+            shards = [shard for _, shard in self._shards]
+        # dict(...) là thao tác nguyên tử dưới GIL
+        return [base] + [dict(shard) for shard in shards]
+
+    @abc.abstractmethod
+    def _merge(self, into, snapshot):
+        """Cộng các giá trị của snapshot vào into (tạo giá trị mới nếu chưa có), trả về into."""
+
+    @abc.abstractmethod
+    def collect(self):
+        """Trả về các dòng text exposition của metric."""
+
+
+class Counter(_Metric):
+    """
+    Bộ đếm chỉ tăng.
+    Có thể gắn hàm tính giá trị khi scrape bằng set_function (vd bộ đếm có sẵn của cache).
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set_function(self, func, **labels):
+        """Giá trị của label này được tính bằng func() mỗi lần scrape."""
+        self._functions[self._key(labels)] = func
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = self._key(labels)
+        return sum(s.get(key, 0) for s in self._snapshots())
+
+    def _merge(self, into, snapshot):
+        for key, value in snapshot.items():
+            into[key] = into.get(key, 0) + value
+        return into
+
+    def collect(self):
+        totals = {}
+        for snapshot in self._snapshots():
+            self._merge(totals, snapshot)
+        for key, func in self._functions.items():
+            try:
+                value = func()
+            except Exception:
+                continue
+            if value is not None:
+                totals[key] = totals.get(key, 0) + value
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(totals.items())]
+
+
+class Gauge(Counter):
+    """Giá trị tăng/giảm (vd số request đang xử lý)."""
+
+    type_name = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Tăng gauge khi vào block, giảm khi ra."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Histogram với bucket cố định."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # [đếm theo bucket..., +Inf], tổng, số lần
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            shard[key] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian chạy của block (giây)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _merge(self, into, snapshot):
+        for key, (counts, total, count) in snapshot.items():
+            acc = into.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            for i, c in enumerate(list(counts)):
+                acc[0][i] += c
+            acc[1] += total
+            acc[2] += count
+        return into
+
+    def collect(self):
+        merged = {}
+        for snapshot in self._snapshots():
+            self._merge(merged, snapshot)
+
+        lines = []
+        for key, (counts, total, count) in sorted(merged.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = ('le', _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Tập hợp metric và xuất text cho /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        out = []
+        for metric in metrics:
+            out.append(f"# HELP {metric.name} {metric.documentation}")
+            out.append(f"# TYPE {metric.name} {metric.type_name}")
+            out.extend(metric.collect())
+        return '\n'.join(out) + '\n'
+
+
+# Content-Type của /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Registry dùng chung cho toàn bộ API
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'dental_stage_duration_seconds',
+    'Thời gian chạy từng stage của pipeline phân tích',
+    ('stage',))
+REQUESTS = REGISTRY.counter(
+    'dental_requests_total',
+    'Số request theo endpoint và kết quả',
+    ('endpoint', 'outcome'))
+GEMINI_ERRORS = REGISTRY.counter(
+    'dental_gemini_errors_total',
+    'Số lỗi Gemini theo loại',
+    ('type',))
+UPLOAD_BYTES = REGISTRY.histogram(
+    'dental_upload_bytes',
+    'Kích thước file ảnh upload (byte)',
+    ('endpoint',),
+    buckets=SIZE_BUCKETS)
+IN_FLIGHT = REGISTRY.gauge(
+    'dental_in_flight_requests',
+    'Số request đang xử lý',
+    ('endpoint',))
+QUEUE_DEPTH = REGISTRY.gauge(
+    'dental_queue_depth',
+    'Số item đang chờ trong các hàng đợi nội bộ',
+    ('queue',))
+CACHE_LOOKUPS = REGISTRY.counter(
+    'dental_result_cache_lookups_total',
+    'Số lần tra cache kết quả theo kết quả (memory_hit, disk_hit, miss)',
+    ('result',))
+INFER_BATCH_SIZE = REGISTRY.histogram(
+    'dental_inference_batch_size',
+    'Kích thước batch đạt được của micro-batching',
+    ('model',),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+INFER_QUEUE_WAIT = REGISTRY.histogram(
+    'dental_inference_queue_wait_seconds',
+    'Thời gian request chờ trong hàng đợi micro-batching',
+    ('model',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+UPLOAD_STORE_BYTES = REGISTRY.gauge(
+    'dental_upload_store_bytes',
+    'Tổng dung lượng file trong kho upload')
+REQUEST_PEAK_RSS = REGISTRY.histogram(
+    'dental_request_peak_rss_bytes',
+    'Đỉnh RSS của process trong lúc xử lý một request phân tích',
+    ('endpoint',),
+    buckets=MEMORY_BUCKETS)
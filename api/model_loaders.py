@@ -0,0 +1,151 @@
+"""
+Load và chạy các model nặng (CNN, YOLO).
+Dùng chung cho app.py (model trong cùng process) và model_server.py (một process
+giữ model cho nhiều web worker). TensorFlow và ultralytics chỉ được import khi
+load model.
+"""
+import importlib.util
+import os
+
+import numpy as np
+
+import config
+from image_context import CNN_INPUT_SIZE
+from src.models.cnn_runtime import RUNTIMES, exported_path, runtime_available
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CNN_MODEL_PATH = os.path.join(PROJECT_ROOT, 'models', 'dental_model_final.h5')
+YOLO_MODEL_PATH = os.path.join(PROJECT_ROOT, 'models', 'dental_detection_yolo.pt')
+
+# File mô hình mặc định của từng runtime CNN (bản export do export_cnn.py tạo)
+CNN_RUNTIME_PATHS = {
+    'keras': CNN_MODEL_PATH,
+    'tflite': exported_path(CNN_MODEL_PATH, 'tflite_dynamic'),
+    'onnx': exported_path(CNN_MODEL_PATH, 'onnx'),
+}
+# File mô hình CNN đang phục vụ
+CNN_SERVING_PATH = config.CNN_MODEL_PATH or CNN_RUNTIME_PATHS.get(config.CNN_RUNTIME, CNN_MODEL_PATH)
+
+# Chỉ kiểm tra thư viện đã cài hay chưa, không import
+CNN_AVAILABLE = runtime_available(config.CNN_RUNTIME)
+YOLO_AVAILABLE = importlib.util.find_spec('ultralytics') is not None
+
+# 7 classes from YOLO training
+YOLO_CLASS_NAMES = [
+    'Data caries',
+    'Mouth Ulcer',
+    'Tooth Discoloration',
+    'hypodontia',
+    'Gingivitis',
+    'Calculus',
+    'Caries_Gingivitus_ToothDiscoloration_Ulcer'
+]
+
+# Very low confidence to detect more smaller boxes
+YOLO_CONF = 0.15
+
+
+def load_cnn():
+    """
+    Load CNN predictor với runtime DENTAL_CNN_RUNTIME, None nếu chưa cài thư viện của
+    runtime hoặc không có file mô hình.
+    """
+    if config.CNN_RUNTIME not in RUNTIMES:
+        raise ValueError(f"DENTAL_CNN_RUNTIME không hợp lệ: {config.CNN_RUNTIME} (chọn {', '.join(RUNTIMES)})")
+    if not CNN_AVAILABLE or not os.path.exists(CNN_SERVING_PATH):
+        return None
+    if config.CNN_RUNTIME == 'keras':
+        from src.models.cnn_model import configure_threads
+        configure_threads(config.TF_INTRA_OP_THREADS, config.TF_INTER_OP_THREADS)
+    from src.ai.dental_predictor import DentalPredictor
+    predictor = DentalPredictor(CNN_SERVING_PATH, runtime=config.CNN_RUNTIME,
+                                num_threads=config.TF_INTRA_OP_THREADS)
+    print(f"✅ CNN model loaded ({config.CNN_RUNTIME}): {CNN_SERVING_PATH}")
+    return predictor
+
+
+def warmup_cnn(predictor):
+    """
+    Lần gọi đầu tiên trace tf.function của CNN (hoặc cấp phát tensor của TFLite /
+    onnxruntime), chậm hơn nhiều lần sau; chạy thử với batch 1 và batch tối đa của
+    micro-batching.
+    """
+    predictor.model.warmup(sorted({1, max(1, config.INFER_MAX_BATCH)}))
+    result = predictor.predict_batch([np.zeros((*CNN_INPUT_SIZE, 3), dtype=np.uint8)])[0]
+    if not result.get('success'):
+        raise RuntimeError(result.get('error'))
+
+
+def yolo_result_to_detections(result):
+    """
+    Chuyển kết quả YOLO của một ảnh về dạng list detection.
+
+    Returns:
+        List các detection: [{'class_id', 'class_name', 'confidence', 'bbox'}]
+    """
+    detections = []
+
+    print(f"🔍 YOLO found {len(result.boxes)} detections")
+
+    for box in result.boxes:
+        class_id = int(box.cls[0])
+
+        # Get bbox coordinates correctly
+        xyxy = box.xyxy[0].cpu().numpy()
+        x1, y1, x2, y2 = int(xyxy[0]), int(xyxy[1]), int(xyxy[2]), int(xyxy[3])
+
+        detection = {
+            'class_id': class_id,
+            'class_name': YOLO_CLASS_NAMES[class_id] if class_id < len(YOLO_CLASS_NAMES) else 'Unknown',
+            'confidence': float(box.conf[0]),
+            'bbox': {
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2
+            }
+        }
+        detections.append(detection)
+        print(f"  ✓ Detection: {detection['class_name']} ({detection['confidence']:.2%}) at ({x1},{y1})-({x2},{y2})")
+
+    return detections
+
+
+class YoloDetector:
+    """YOLO model kèm chuyển kết quả về list detection."""
+
+    def __init__(self, model, conf=YOLO_CONF):
+        self.model = model
+        self.conf = conf
+
+    def detect_batch(self, images):
+        """
+        Chạy YOLO một lần cho nhiều ảnh.
+
+        Args:
+            images: List ảnh BGR (numpy array)
+
+        Returns:
+            List detection cho từng ảnh, cùng thứ tự đầu vào
+        """
+        if not images:
+            return []
+        results = self.model(list(images), conf=self.conf, verbose=False)
+        return [yolo_result_to_detections(result) for result in results]
+
+
+def load_yolo():
+    """Load YOLO detection model, None nếu chưa cài ultralytics hoặc không có file weights."""
+    if not YOLO_AVAILABLE:
+        return None
+    if not os.path.exists(YOLO_MODEL_PATH):
+        print(f"ℹ️  YOLO model not found: {YOLO_MODEL_PATH}")
+        return None
+    from ultralytics import YOLO
+    model = YOLO(YOLO_MODEL_PATH)
+    print(f"✅ YOLO Detection model loaded: {YOLO_MODEL_PATH}")
+    return YoloDetector(model)
+
+
+def warmup_yolo(detector):
+    detector.detect_batch([np.zeros((640, 640, 3), dtype=np.uint8)])
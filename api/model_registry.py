@@ -0,0 +1,130 @@
+"""
+Load model nặng (CNN, YOLO, Gemini client) ở background.
+Server nhận request ngay khi khởi động; stage nào có model chưa sẵn sàng thì
+được bỏ qua, các stage CV vẫn phục vụ bình thường.
+"""
+import threading
+import time
+
+# Trạng thái của một model
+MODEL_PENDING = 'pending'
+MODEL_LOADING = 'loading'
+MODEL_READY = 'ready'
+MODEL_FAILED = 'failed'
+MODEL_UNAVAILABLE = 'unavailable'
+
+
+class ModelSlot:
+    """Một model được đăng ký cùng hàm load và warm-up."""
+
+    def __init__(self, name, loader, warmup=None, on_ready=None):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.on_ready = on_ready
+        self.status = MODEL_PENDING
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+        }
+
+
+class ModelRegistry:
+    """Danh sách model và thread load chúng ở background."""
+
+    def __init__(self):
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._thread = None
+
+    def register(self, name, loader, warmup=None, on_ready=None):
+        """
+        Đăng ký model.
+
+        Args:
+            name: Tên model
+            loader: Hàm loader() -> model; trả về None nếu model không có (thiếu file,
+                thiếu thư viện), raise nếu load lỗi
+            warmup: Hàm warmup(model) chạy một lần inference giả sau khi load
+            on_ready: Callback on_ready(model) khi model sẵn sàng
+        """
+        with self._lock:
+            self._slots[name] = ModelSlot(name, loader, warmup, on_ready)
+
+    def start(self):
+        """Bắt đầu load tất cả model trên một thread nền (gọi nhiều lần cũng chỉ chạy một lần)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load_all, name='model-loader', daemon=True)
+        self._thread.start()
+
+    def get(self, name):
+        """Model nếu đã sẵn sàng, ngược lại None (không chờ)."""
+        slot = self._slots.get(name)
+        if slot is None or slot.status != MODEL_READY:
+            return None
+        return slot.value
+
+    def is_ready(self, name):
+        return self.get(name) is not None
+
+    def is_settled(self, name):
+        """True nếu model đã load xong (thành công, lỗi hoặc không có)."""
+        slot = self._slots.get(name)
+        return slot is None or slot.status in (MODEL_READY, MODEL_FAILED, MODEL_UNAVAILABLE)
+
+    def wait(self, name, timeout=None):
+        """Chờ tới khi model load xong; trả về model hoặc None."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._ready:
+            while not self.is_settled(name):
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+        return self.get(name)
+
+    def status(self):
+        """Trạng thái từng model."""
+        with self._lock:
+            return {name: slot.to_dict() for name, slot in self._slots.items()}
+
+    def _load_all(self):
+        for slot in list(self._slots.values()):
+            self._load(slot)
+
+    def _load(self, slot):
+        slot.status = MODEL_LOADING
+        started = time.perf_counter()
+        try:
+            value = slot.loader()
+            if value is None:
+                status = MODEL_UNAVAILABLE
+            else:
+                slot.load_seconds = round(time.perf_counter() - started, 3)
+                if slot.warmup is not None:
+                    warm_started = time.perf_counter()
+                    slot.warmup(value)
+                    slot.warmup_seconds = round(time.perf_counter() - warm_started, 3)
+                slot.value = value
+                if slot.on_ready is not None:
+                    slot.on_ready(value)
+                status = MODEL_READY
+                print(f"✅ {slot.name} ready in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            slot.error = str(e)
+            status = MODEL_FAILED
+            print(f"⚠️  {slot.name} failed to load: {e}")
+        with self._ready:
+            slot.status = status
+            self._ready.notify_all()
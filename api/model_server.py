@@ -0,0 +1,512 @@
+"""
+Process riêng giữ model CNN và YOLO cho nhiều web worker.
+
+Mỗi web worker load một bản TensorFlow/YOLO thì bộ nhớ tăng theo số worker. Với
+DENTAL_MODEL_SERVER_SOCKET, các worker gửi ảnh đã decode tới process này:
+- Pixel được chép vào vùng shared memory (ring buffer gồm nhiều slot) của worker,
+  không pickle mảng ảnh
+- Qua Unix socket chỉ gửi header JSON nhỏ (slot, shape, dtype) và nhận kết quả JSON
+- Server gom request của mọi worker thành batch (MicroBatcher) trước khi gọi model
+- Client hết thời gian chờ (thời gian còn lại của stage) thì gửi 'cancel': ảnh còn
+  trong hàng đợi không chạy model nữa và slot được trả sớm
+
+Chạy server:
+    python api/model_server.py --socket /tmp/dental-model.sock
+
+Nhiều web worker: job (/jobs/<id>, /jobs/<id>/events) và ảnh kết quả trong bộ nhớ
+(/results/<key>) vẫn nằm trong process của worker đã tạo ra chúng, nên request tiếp
+theo phải tới đúng worker đó: đặt load balancer định tuyến cố định theo client
+(sticky, vd nginx ip_hash hoặc cookie) hoặc chạy một worker nhiều thread. Với
+DENTAL_PERSIST_UPLOADS, ảnh kết quả nằm trên đĩa (/uploads/<tên>, quota dùng chung
+giữa các worker) nên worker nào cũng phục vụ được.
+"""
+import argparse
+import atexit
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeoutError
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import config
+from inference_scheduler import MicroBatcher
+from model_registry import MODEL_FAILED, MODEL_READY, MODEL_UNAVAILABLE, ModelRegistry
+import model_loaders
+
+_HEADER = struct.Struct('!I')
+
+
+def _send(sock, message):
+    """Gửi một message JSON có tiền tố độ dài."""
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv(sock):
+    """Nhận một message JSON, None khi kết nối đã đóng."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+class ModelServerError(RuntimeError):
+    """Lỗi khi gọi model server."""
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class _Connection:
+    """Một web worker đang kết nối; mỗi kết nối có một vùng shared memory riêng."""
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.shm = None
+        self._send_lock = threading.Lock()
+        # id -> futures của request đang chạy (để huỷ khi client hết thời gian chờ)
+        self._requests = {}
+        self._requests_lock = threading.Lock()
+
+    def reply(self, message):
+        with self._send_lock:
+            try:
+                _send(self.sock, message)
+            except OSError:
+                pass
+
+    def serve(self):
+        try:
+            while True:
+                message = _recv(self.sock)
+                if message is None:
+                    break
+                self.handle(message)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Model server connection error: {e}")
+        finally:
+            self.sock.close()
+            if self.shm is not None:
+                try:
+                    self.shm.close()
+                except BufferError:
+                    # Còn batch đang đọc vùng nhớ; để GC đóng sau
+                    pass
+
+    def handle(self, message):
+        op = message.get('op')
+        request_id = message.get('id')
+        if op == 'hello':
+            self.shm = shared_memory.SharedMemory(name=message['shm'])
+            # Vùng nhớ thuộc về web worker; không để resource tracker của server xoá nó
+            try:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+        elif op == 'status':
+            self.reply({'id': request_id, 'ok': True, 'models': self.server.registry.status()})
+        elif op in ('cnn', 'yolo'):
+            self.infer(op, request_id, message.get('items', []))
+        elif op == 'cancel':
+            self.cancel(request_id)
+        else:
+            self.reply({'id': request_id, 'ok': False, 'error': f'Không hỗ trợ op: {op}'})
+
+    def infer(self, op, request_id, items):
+        batcher = self.server.batchers.get(op)
+        if batcher is None or self.shm is None:
+            self.reply({'id': request_id, 'ok': False, 'error': f'Model {op} chưa sẵn sàng'})
+            return
+        try:
+            arrays = []
+            for item in items:
+                dtype = np.dtype(item['dtype'])
+                shape = tuple(item['shape'])
+                nbytes = int(np.prod(shape)) * dtype.itemsize
+                if item['offset'] < 0 or item['offset'] + nbytes > self.shm.size:
+                    raise ValueError('Vùng ảnh nằm ngoài shared memory')
+                # View trực tiếp lên shared memory, không chép
+                arrays.append(np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=item['offset']))
+            futures = [batcher.submit(array) for array in arrays]
+        except Exception as e:
+            self.reply({'id': request_id, 'ok': False, 'error': str(e)})
+            return
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            with self._requests_lock:
+                self._requests.pop(request_id, None)
+            try:
+                results = [future.result() for future in futures]
+            except CancelledError:
+                self.reply({'id': request_id, 'ok': False, 'error': 'Đã huỷ: client hết thời gian chờ'})
+            except Exception as e:
+                self.reply({'id': request_id, 'ok': False, 'error': str(e)})
+            else:
+                self.reply({'id': request_id, 'ok': True, 'results': results})
+
+        if not futures:
+            self.reply({'id': request_id, 'ok': True, 'results': []})
+            return
+        with self._requests_lock:
+            self._requests[request_id] = futures
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def cancel(self, request_id):
+        """
+        Huỷ các ảnh của request còn trong hàng đợi (ảnh đã vào batch vẫn chạy xong).
+        Response của request được gửi khi mọi ảnh kết thúc, lúc đó client mới trả slot.
+        """
+        with self._requests_lock:
+            futures = self._requests.get(request_id, ())
+        for future in futures:
+            future.cancel()
+
+
+class ModelServer:
+    """Giữ model trong một process và phục vụ các web worker qua Unix socket."""
+
+    def __init__(self, address, registry):
+        self.address = address
+        self.registry = registry
+        # Tạo khi model tương ứng load xong
+        self.batchers = {}
+
+    def add_batcher(self, name, batch_fn):
+        self.batchers[name] = MicroBatcher(name, batch_fn,
+                                           max_batch_size=config.INFER_MAX_BATCH,
+                                           max_wait_ms=config.INFER_MAX_WAIT_MS,
+                                           max_queue=config.INFER_MAX_QUEUE)
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.address)
+        listener.listen()
+        print(f"🚀 Model server listening on {self.address}")
+        try:
+            while True:
+                sock, _ = listener.accept()
+                connection = _Connection(self, sock)
+                threading.Thread(target=connection.serve, name='model-conn', daemon=True).start()
+        finally:
+            listener.close()
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+
+# ---------------------------------------------------------------------------
+# Client (chạy trong web worker)
+# ---------------------------------------------------------------------------
+
+class ModelServerClient:
+    """
+    Kết nối từ một web worker tới model server.
+    An toàn khi gọi từ nhiều thread; tự kết nối lại khi server khởi động lại.
+    """
+
+    def __init__(self, address, slots=8, slot_bytes=8 * 1024 * 1024, timeout=30.0):
+        """
+        Args:
+            address: Đường dẫn Unix socket của server
+            slots: Số slot trong ring buffer (số ảnh đang gửi cùng lúc tối đa)
+            slot_bytes: Kích thước mỗi slot (byte)
+            timeout: Thời gian chờ tối đa cho một request (giây)
+        """
+        self.address = address
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        atexit.register(self.close)
+        self._free = list(range(slots))
+        self._slots_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sock = None
+        self._next_id = 0
+        # id -> (Future, các slot đang dùng)
+        self._pending = {}
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        try:
+            self._shm.close()
+            self._shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+    def _connect(self):
+        """Kết nối (nếu chưa), trả về socket."""
+        with self._lock:
+            if self._sock is not None:
+                return self._sock
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.address)
+            _send(sock, {'op': 'hello', 'shm': self._shm.name})
+            self._sock = sock
+            threading.Thread(target=self._read, args=(sock,), name='model-client', daemon=True).start()
+            return sock
+
+    def _read(self, sock):
+        """Nhận response và trả kết quả cho Future tương ứng."""
+        try:
+            while True:
+                message = _recv(sock)
+                if message is None:
+                    break
+                self._finish(message.get('id'), message)
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = list(self._pending)
+        for request_id in pending:
+            self._finish(request_id, {'ok': False, 'error': 'Mất kết nối tới model server'})
+
+    def _finish(self, request_id, message):
+        with self._lock:
+            future, slots = self._pending.pop(request_id, (None, ()))
+        # Chỉ trả slot khi server đã trả lời (server không còn đọc vùng nhớ đó)
+        if slots:
+            with self._slots_cond:
+                self._free.extend(slots)
+                self._slots_cond.notify_all()
+        if future is None:
+            return
+        if message.get('ok'):
+            future.set_result(message)
+        else:
+            future.set_exception(ModelServerError(message.get('error', 'Model server error')))
+
+    def _acquire_slots(self, count, deadline):
+        with self._slots_cond:
+            while len(self._free) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ModelServerError('Hết slot shared memory')
+                self._slots_cond.wait(remaining)
+            slots, self._free = self._free[:count], self._free[count:]
+            return slots
+
+    def _call(self, message, slots=(), deadline=None):
+        """
+        Gửi message và chờ response tới deadline (time.monotonic(); None = self.timeout).
+
+        Raises:
+            TimeoutError: Hết thời gian chờ; server được báo huỷ request. Slot chỉ được
+                trả khi server trả lời (server có thể vẫn đang đọc vùng nhớ)
+        """
+        sock = self._connect()
+        future = Future()
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = (future, tuple(slots))
+        message['id'] = request_id
+        try:
+            with self._send_lock:
+                _send(sock, message)
+        except OSError as e:
+            self._finish(request_id, {'ok': False, 'error': str(e)})
+        timeout = self.timeout if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            try:
+                with self._send_lock:
+                    _send(sock, {'op': 'cancel', 'id': request_id})
+            except OSError:
+                pass
+            raise TimeoutError(f"Hết {timeout:.2f}s chờ model server ({message.get('op')})")
+
+    def status(self):
+        """Trạng thái các model trên server."""
+        return self._call({'op': 'status'})['models']
+
+    def infer(self, op, arrays, timeout=None):
+        """
+        Gửi các ảnh tới server qua shared memory và chờ kết quả.
+
+        Args:
+            op: 'cnn' hoặc 'yolo'
+            arrays: List numpy array (mỗi ảnh vừa một slot)
+            timeout: Thời gian chờ tối đa cho cả lần gọi (giây), vd thời gian còn lại của
+                stage; không vượt quá self.timeout
+
+        Returns:
+            List kết quả cùng thứ tự đầu vào
+
+        Raises:
+            TimeoutError: Nếu hết thời gian chờ
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else min(timeout, self.timeout))
+        results = []
+        # Chia nhỏ để không giữ nhiều slot hơn ring buffer có
+        for start in range(0, len(arrays), self.slots):
+            chunk = [np.ascontiguousarray(a) for a in arrays[start:start + self.slots]]
+            for array in chunk:
+                if array.nbytes > self.slot_bytes:
+                    raise ModelServerError(f'Ảnh {array.shape} lớn hơn slot shared memory')
+            slots = self._acquire_slots(len(chunk), deadline)
+            items = []
+            try:
+                for slot, array in zip(slots, chunk):
+                    offset = slot * self.slot_bytes
+                    target = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf, offset=offset)
+                    target[...] = array
+                    items.append({'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str})
+            except Exception:
+                with self._slots_cond:
+                    self._free.extend(slots)
+                    self._slots_cond.notify_all()
+                raise
+            results.extend(self._call({'op': op, 'items': items}, slots, deadline)['results'])
+        return results
+
+    def wait_model(self, name, poll=0.5):
+        """
+        Chờ server load xong model name (chạy trong thread load model của web worker).
+
+        Returns:
+            True nếu model sẵn sàng, False nếu server không có model đó
+
+        Raises:
+            ModelServerError: Nếu server load model lỗi
+        """
+        logged = False
+        while True:
+            try:
+                info = self.status().get(name, {})
+            except (OSError, ModelServerError) as e:
+                if not logged:
+                    print(f"⏳ Waiting for model server at {self.address}: {e}")
+                    logged = True
+                time.sleep(poll)
+                continue
+            status = info.get('status')
+            if status == MODEL_READY:
+                return True
+            if status == MODEL_UNAVAILABLE or status is None:
+                return False
+            if status == MODEL_FAILED:
+                raise ModelServerError(info.get('error') or f'Model server không load được {name}')
+            time.sleep(poll)
+
+
+class RemoteCNN:
+    """CNN predictor chạy trên model server, cùng giao diện với DentalPredictor."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def predict(self, image, timeout=None):
+        return self.predict_batch([image], timeout=timeout)[0]
+
+    def predict_batch(self, images, timeout=None):
+        # Chỉ gửi ảnh đã resize về kích thước đầu vào CNN
+        arrays = [image.cnn_input if hasattr(image, 'cnn_input') else np.asarray(image) for image in images]
+        try:
+            return self.client.infer('cnn', arrays, timeout=timeout)
+        except Exception as e:
+            error = {'success': False, 'error': f'Lỗi khi dự đoán: {str(e)}'}
+            return [dict(error) for _ in images]
+
+
+class RemoteYolo:
+    """YOLO chạy trên model server, cùng giao diện với model_loaders.YoloDetector."""
+
+    def __init__(self, client, max_side=1280):
+        """
+        Args:
+            client: ModelServerClient
+            max_side: Ảnh lớn hơn được thu nhỏ trước khi gửi (YOLO tự resize về 640,
+                nên không mất độ chính xác); bbox được scale lại theo ảnh gốc
+        """
+        self.client = client
+        self.max_side = max_side
+
+    def detect_batch(self, images, timeout=None):
+        arrays = []
+        scales = []
+        for image in images:
+            height, width = image.shape[:2]
+            scale = min(1.0, self.max_side / max(height, width))
+            if scale < 1.0:
+                image = cv2.resize(image, (round(width * scale), round(height * scale)),
+                                   interpolation=cv2.INTER_AREA)
+            arrays.append(image)
+            scales.append(scale)
+        outputs = self.client.infer('yolo', arrays, timeout=timeout)
+        for detections, scale in zip(outputs, scales):
+            if scale == 1.0:
+                continue
+            for det in detections:
+                det['bbox'] = {k: int(round(v / scale)) for k, v in det['bbox'].items()}
+        return outputs
+
+
+def create_client():
+    """Client tới model server theo config (một client cho mỗi web worker)."""
+    return ModelServerClient(config.MODEL_SERVER_SOCKET,
+                             slots=config.MODEL_SERVER_SLOTS,
+                             slot_bytes=config.MODEL_SERVER_SLOT_MB * 1024 * 1024,
+                             timeout=config.MODEL_SERVER_TIMEOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Model server cho Dental AI API')
+    parser.add_argument('--socket', default=config.MODEL_SERVER_SOCKET or '/tmp/dental-model.sock',
+                        help='Đường dẫn Unix socket')
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    server = ModelServer(args.socket, registry)
+    registry.register('cnn', model_loaders.load_cnn,
+                      warmup=model_loaders.warmup_cnn if config.MODEL_WARMUP else None,
+                      on_ready=lambda predictor: server.add_batcher('cnn', predictor.predict_batch))
+    registry.register('yolo', model_loaders.load_yolo,
+                      warmup=model_loaders.warmup_yolo if config.MODEL_WARMUP else None,
+                      on_ready=lambda detector: server.add_batcher('yolo', detector.detect_batch))
+    registry.start()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+Chạy detector offline trên cả kho ảnh (audit, chạy lại sau khi đổi ngưỡng/model).
+
+- Danh sách ảnh lấy từ một thư mục (đệ quy) hoặc manifest (.txt, .csv, .jsonl)
+- Ảnh được chia thành từng nhóm nhỏ cho process pool; mỗi worker tự load YOLO/CNN
+  một lần lúc khởi động và chạy chúng theo batch trên cả nhóm
+- Kết quả được ghi ngay khi một nhóm xong (JSONL hoặc Parquet); chính file kết
+  quả là checkpoint: chạy lại cùng lệnh sẽ bỏ qua ảnh đã có kết quả
+
+CLI: batch_detect.py ở thư mục gốc.
+"""
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+import color_lut
+import tiling
+from image_context import ImageContext
+
+# Detector có thể chọn: CV (simple, cv) và model (yolo, cnn)
+DETECTORS = ('simple', 'cv', 'yolo', 'cnn')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def list_images(source):
+    """
+    Danh sách ảnh cần xử lý.
+
+    Args:
+        source: Thư mục (quét đệ quy theo đuôi file) hoặc manifest:
+            .txt (mỗi dòng một đường dẫn), .csv (cột 'path' hoặc cột đầu tiên),
+            .jsonl (mỗi dòng {"path": ...}). Đường dẫn tương đối tính theo thư mục
+            chứa manifest.
+
+    Returns:
+        list (key, đường dẫn đầy đủ); key là đường dẫn tương đối dùng trong kết quả
+    """
+    if os.path.isdir(source):
+        items = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    items.append((os.path.relpath(path, source), path))
+        return items
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='', encoding='utf-8') as f:
+        if source.lower().endswith('.jsonl'):
+            keys = [json.loads(line)['path'] for line in f if line.strip()]
+        elif source.lower().endswith('.csv'):
+            rows = list(csv.reader(f))
+            column = rows[0].index('path') if rows and 'path' in rows[0] else 0
+            start = 1 if rows and 'path' in rows[0] else 0
+            keys = [row[column] for row in rows[start:] if row]
+        else:
+            keys = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [(key, key if os.path.isabs(key) else os.path.join(base, key)) for key in keys]
+
+
+# ---- Worker ----
+
+# Trạng thái của từng worker process (set trong init_worker)
+_worker = {}
+
+
+def init_worker(options):
+    """
+    Khởi tạo worker: load model được chọn và dựng sẵn bảng tra màu.
+    Model không có (thiếu thư viện/file) chỉ bị bỏ qua kèm cảnh báo.
+    """
+    _worker.clear()
+    _worker['options'] = options
+    # Mỗi process đã là một luồng song song; tránh OpenCV tự mở thêm thread
+    if options['workers'] > 1:
+        cv2.setNumThreads(1)
+
+    detectors = options['detectors']
+    if 'simple' in detectors or 'cv' in detectors:
+        color_lut.lookup_table(options['detector']['color_ranges'])
+    if 'yolo' in detectors or 'cnn' in detectors:
+        from model_loaders import load_cnn, load_yolo
+        with _quiet(options['verbose']):
+            _worker['yolo'] = load_yolo() if 'yolo' in detectors else None
+            _worker['cnn'] = load_cnn() if 'cnn' in detectors else None
+        for name in ('yolo', 'cnn'):
+            if name in detectors and _worker[name] is None:
+                print(f"⚠️  [pid {os.getpid()}] {name} không có, bỏ qua")
+
+
+def _quiet(verbose):
+    """Ẩn log chi tiết của detector (mỗi ảnh vài chục dòng) trừ khi bật verbose."""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def process_chunk(items):
+    """
+    Chạy các detector được chọn trên một nhóm ảnh.
+
+    Args:
+        items: List (key, đường dẫn)
+
+    Returns:
+        List record, mỗi ảnh một record:
+        {'path', 'width', 'height', 'seconds', 'error', <detector>: kết quả}
+    """
+    options = _worker['options']
+    detectors = options['detectors']
+    detector_options = options['detector']
+    records, ctxs = [], []
+    # Chỉ giữ ảnh đã decode tới cuối nhóm khi còn model cần chạy
+    keep = _worker.get('yolo') is not None or _worker.get('cnn') is not None
+
+    with _quiet(options['verbose']):
+        for key, path in items:
+            started = time.perf_counter()
+            record = {'path': key, 'width': None, 'height': None, 'seconds': 0.0, 'error': None}
+            try:
+                ctx = ImageContext.from_path(path)
+                record['width'], record['height'] = ctx.width, ctx.height
+                if 'simple' in detectors:
+                    from simple_tooth_detector import detect_individual_teeth
+                    record['simple'] = detect_individual_teeth(ctx, smoothing=options['smoothing'],
+                                                               **detector_options)
+                if 'cv' in detectors:
+                    from tooth_detector import detect_damaged_teeth
+                    record['cv'] = detect_damaged_teeth(ctx, sensitivity=options['sensitivity'],
+                                                        **detector_options)
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {e}"
+                ctx = None
+            record['seconds'] = time.perf_counter() - started
+            records.append(record)
+            ctxs.append(ctx if keep else None)
+
+        # Model chạy theo batch trên các ảnh đọc được của nhóm
+        ready = [(record, ctx) for record, ctx in zip(records, ctxs) if ctx is not None]
+        if ready:
+            _run_models(ready, options)
+
+    for record in records:
+        record['seconds'] = round(record['seconds'], 4)
+    return records
+
+
+def _run_models(ready, options):
+    """Chạy YOLO và CNN trên cả nhóm, chia đều thời gian cho từng ảnh."""
+    ctxs = [ctx for _, ctx in ready]
+    jobs = []
+    if _worker.get('yolo') is not None:
+        jobs.append(('yolo', lambda: tiling.detect_batched(
+            _worker['yolo'].detect_batch, [ctx.bgr for ctx in ctxs],
+            tile_size=options['detector']['tile_size'], overlap=options['detector']['tile_overlap'],
+            max_batch=options['max_batch'])))
+    if _worker.get('cnn') is not None:
+        jobs.append(('cnn', lambda: [result for start in range(0, len(ctxs), options['max_batch'])
+                                     for result in _worker['cnn'].predict_batch(
+                                         ctxs[start:start + options['max_batch']])]))
+
+    for name, run in jobs:
+        started = time.perf_counter()
+        try:
+            outputs = run()
+        except Exception as e:
+            for record, _ in ready:
+                record['error'] = record['error'] or f"{name}: {type(e).__name__}: {e}"
+            continue
+        share = (time.perf_counter() - started) / len(ready)
+        for (record, _), output in zip(ready, outputs):
+            record[name] = output
+            record['seconds'] += share
+
+
+# ---- Ghi kết quả ----
+
+class JsonlWriter:
+    """Ghi mỗi record một dòng JSON, flush sau mỗi nhóm."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def completed(self):
+        """
+        Record đã có trong file: {path: error}.
+        Dòng cuối bị cắt dở (process bị dừng giữa chừng) được xoá.
+        """
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'rb+') as f:
+            valid = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                done[record['path']] = record.get('error')
+                valid += len(line)
+            f.truncate(valid)
+        return done
+
+    def write(self, records):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetWriter:
+    """
+    Ghi Parquet vào một thư mục gồm nhiều file part-NNNNN.parquet (đọc được như một
+    dataset bằng pandas/pyarrow). Mỗi part chứa tối đa rows_per_part record; kết quả
+    của detector được lưu dạng chuỗi JSON. Cần pyarrow.
+    """
+
+    COLUMNS = ('path', 'width', 'height', 'seconds', 'error')
+
+    def __init__(self, path, rows_per_part=1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Ghi Parquet cần cài pyarrow (pip install pyarrow)") from None
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.rows_per_part = max(1, rows_per_part)
+        self._pending = []
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.path)
+                      if name.startswith('part-') and name.endswith('.parquet'))
+
+    def completed(self):
+        """Record đã có trong các part đã ghi xong: {path: error}."""
+        done = {}
+        for name in self._parts():
+            table = self._pq.read_table(os.path.join(self.path, name), columns=['path', 'error'])
+            done.update(zip(table.column('path').to_pylist(), table.column('error').to_pylist()))
+        return done
+
+    def write(self, records):
+        self._pending.extend(records)
+        while len(self._pending) >= self.rows_per_part:
+            self._flush(self._pending[:self.rows_per_part])
+            self._pending = self._pending[self.rows_per_part:]
+
+    def _flush(self, records):
+        if not records:
+            return
+        columns = {name: [record.get(name) for record in records] for name in self.COLUMNS}
+        for name in DETECTORS:
+            columns[name] = [json.dumps(record[name], ensure_ascii=False) if name in record else None
+                             for record in records]
+        table = self._pa.table(columns, schema=self._pa.schema(
+            [('path', self._pa.string()), ('width', self._pa.int32()), ('height', self._pa.int32()),
+             ('seconds', self._pa.float64()), ('error', self._pa.string())] +
+            [(name, self._pa.string()) for name in DETECTORS]))
+        # Ghi ra file tạm rồi đổi tên để part dở dang không bị đọc khi resume
+        parts = self._parts()
+        index = int(parts[-1][5:10]) + 1 if parts else 0
+        final = os.path.join(self.path, f'part-{index:05d}.parquet')
+        self._pq.write_table(table, final + '.tmp')
+        os.replace(final + '.tmp', final)
+
+    def close(self):
+        self._flush(self._pending)
+        self._pending = []
+
+
+def open_writer(path, fmt=None, rows_per_part=1000):
+    """Writer theo định dạng (mặc định đoán theo đuôi: .jsonl hoặc .parquet)."""
+    fmt = fmt or ('parquet' if path.rstrip('/').lower().endswith('.parquet') else 'jsonl')
+    if fmt == 'parquet':
+        return ParquetWriter(path, rows_per_part)
+    if fmt == 'jsonl':
+        return JsonlWriter(path)
+    raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+
+
+# ---- Chạy ----
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run(items, writer, options, progress_every=10.0):
+    """
+    Chạy các nhóm ảnh trên process pool và ghi kết quả ngay khi mỗi nhóm xong.
+
+    Args:
+        items: List (key, đường dẫn) cần xử lý (đã bỏ ảnh có sẵn kết quả)
+        writer: JsonlWriter / ParquetWriter
+        options: {'detectors', 'detector' (tham số detector CV), 'sensitivity', 'smoothing',
+            'workers', 'chunk_size', 'max_batch', 'verbose'}
+        progress_every: Số giây giữa hai dòng báo tiến độ
+
+    Returns:
+        dict: {'images', 'errors', 'seconds', 'images_per_second'}
+    """
+    workers = max(1, options['workers'])
+    chunks = list(_chunks(items, max(1, options['chunk_size'])))
+    total, done, errors = len(items), 0, 0
+    started = last_report = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else 0.0
+        print(f"{'✅' if final else '⏳'} {done}/{total} ảnh, {errors} lỗi, "
+              f"{rate:.2f} ảnh/s" + ('' if final else f", còn ~{eta / 60:.1f} phút"), flush=True)
+
+    # 'spawn' như process pool của /analyze/batch: không kế thừa thread của TF/PyTorch
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(options,)) as pool:
+            pending, queue = set(), iter(chunks)
+            # Giữ tối đa 2 nhóm mỗi worker trong hàng đợi để không giữ cả kho trong bộ nhớ
+            for chunk in queue:
+                pending.add(pool.submit(process_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    records = future.result()
+                    writer.write(records)
+                    done += len(records)
+                    errors += sum(1 for record in records if record['error'])
+                    chunk = next(queue, None)
+                    if chunk is not None:
+                        pending.add(pool.submit(process_chunk, chunk))
+                if time.perf_counter() - last_report >= progress_every:
+                    last_report = time.perf_counter()
+                    report()
+    finally:
+        # Ghi nốt record đã nhận để lần chạy sau tiếp tục từ đó
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    report(final=True)
+    return {'images': done, 'errors': errors, 'seconds': round(elapsed, 3),
+            'images_per_second': round(done / elapsed, 3) if elapsed > 0 else 0.0}
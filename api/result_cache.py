@@ -0,0 +1,194 @@
+"""
+Cache kết quả /analyze theo nội dung ảnh.
+Key là hash của bytes ảnh cộng phiên bản model và tuỳ chọn stage, nên cùng một
+ảnh upload lại (retry, nhiều người xem) không phải chạy lại detector và Gemini.
+
+Hai tầng:
+- Bộ nhớ: giới hạn số item, loại bỏ theo LRU, có TTL
+- Đĩa (tuỳ chọn): SQLite, có TTL, dùng chung giữa các lần khởi động lại
+
+Lỗi SQLite (đĩa đầy, file bị khoá / hỏng) không làm request lỗi: lần đọc/ghi đó
+chỉ dùng tầng bộ nhớ và được đếm trong stats()['disk_errors'].
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(data, versions=None, options=None):
+    """
+    Tạo key cache.
+
+    Args:
+        data: Bytes của ảnh upload
+        versions: dict phiên bản các model (thay model -> key mới)
+        options: dict tuỳ chọn stage ảnh hưởng tới kết quả
+
+    Returns:
+        str: Key dạng hex sha256
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(data).digest())
+    digest.update(json.dumps({'versions': versions or {}, 'options': options or {}},
+                             sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Cache 2 tầng (LRU trong bộ nhớ + SQLite tuỳ chọn) cho payload kết quả."""
+
+    def __init__(self, max_items=512, ttl=86400, disk_path=None, disk_ttl=7 * 86400):
+        """
+        Args:
+            max_items: Số item tối đa trong bộ nhớ
+            ttl: Thời gian sống trong bộ nhớ (giây)
+            disk_path: Đường dẫn file SQLite; None = tắt tầng đĩa
+            disk_ttl: Thời gian sống trên đĩa (giây)
+        """
+        self.max_items = max_items
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'puts': 0,
+            'evictions': 0,
+            'expired': 0,
+            'disk_errors': 0,
+        }
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._puts_since_purge = 0
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' payload TEXT NOT NULL,'
+                    ' blob BLOB,'
+                    ' expires_at REAL NOT NULL)'
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Không mở được cache trên đĩa {disk_path}, chỉ dùng bộ nhớ: {e}")
+                self._db = None
+
+    def get(self, key):
+        """
+        Lấy item theo key.
+
+        Returns:
+            tuple (payload, blob) hoặc None nếu không có / đã hết hạn
+        """
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                expires_at, payload, blob = item
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return payload, blob
+                del self._memory[key]
+                self._stats['expired'] += 1
+
+        item = self._disk_get(key, now)
+        if item is not None:
+            payload, blob = item
+            self._memory_put(key, payload, blob, now)
+            with self._lock:
+                self._stats['disk_hits'] += 1
+            return payload, blob
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, payload, blob=None):
+        """
+        Lưu item.
+
+        Args:
+            key: Key từ make_cache_key
+            payload: dict JSON-serializable (vd combined_result)
+            blob: Dữ liệu nhị phân đi kèm (vd ảnh kết quả đã encode)
+        """
+        now = time.time()
+        self._memory_put(key, payload, blob, now)
+        with self._lock:
+            self._stats['puts'] += 1
+        self._disk_put(key, payload, blob, now)
+
+    def stats(self):
+        """Bộ đếm hit/miss và kích thước hiện tại."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_enabled'] = self._db is not None
+        return stats
+
+    def _memory_put(self, key, payload, blob, now):
+        with self._lock:
+            self._memory[key] = (now + self.ttl, payload, blob)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            try:
+                row = self._db.execute(
+                    'SELECT payload, blob, expires_at FROM results WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[2] <= now:
+                    self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._db.commit()
+                    return None
+            except sqlite3.Error as e:
+                self._disk_error('đọc', e)
+                return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_put(self, key, payload, blob, now):
+        if self._db is None:
+            return
+        with self._db_lock:
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO results (key, payload, blob, expires_at) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(payload), blob, now + self.disk_ttl)
+                )
+                self._puts_since_purge += 1
+                # Dọn item hết hạn định kỳ thay vì mỗi lần ghi
+                if self._puts_since_purge >= 100:
+                    self._db.execute('DELETE FROM results WHERE expires_at <= ?', (now,))
+                    self._puts_since_purge = 0
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._disk_error('ghi', e)
+
+    def _disk_error(self, action, error):
+        """Lỗi SQLite: huỷ transaction dở dang, item vẫn nằm trong bộ nhớ. Gọi khi giữ _db_lock."""
+        print(f"⚠️ Lỗi {action} cache trên đĩa, chỉ dùng bộ nhớ: {error}")
+        with self._lock:
+            self._stats['disk_errors'] += 1
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
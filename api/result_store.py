@@ -0,0 +1,87 @@
+"""
+Kho lưu tạm kết quả (ảnh đã vẽ) trong bộ nhớ, tự hết hạn.
+Dùng thay cho việc ghi ảnh kết quả ra thư mục uploads/ khi tắt chế độ lưu file.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class ExpiringStore:
+    """
+    Kho key -> bytes trong bộ nhớ, giới hạn theo thời gian sống, số item và tổng dung lượng.
+    Item cũ nhất bị loại trước khi vượt giới hạn.
+    """
+
+    def __init__(self, ttl=600, max_items=256, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            ttl: Thời gian sống của mỗi item (giây)
+            max_items: Số item tối đa
+            max_bytes: Tổng dung lượng tối đa (byte)
+        """
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, data, mimetype='application/octet-stream', key=None, suffix=''):
+        """
+        Lưu dữ liệu và trả về key để lấy lại.
+
+        Args:
+            data: Nội dung (bytes)
+            mimetype: MIME type khi phục vụ qua HTTP
+            key: Key tuỳ chọn; mặc định sinh ngẫu nhiên
+            suffix: Hậu tố gắn vào key sinh ngẫu nhiên (vd '.jpg')
+
+        Returns:
+            str: Key của item
+        """
+        key = key or f"{uuid.uuid4().hex}{suffix}"
+        data = bytes(data)
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (time.monotonic() + self.ttl, data, mimetype)
+            self._bytes += len(data)
+            self._evict()
+        return key
+
+    def get(self, key):
+        """
+        Lấy item theo key.
+
+        Returns:
+            tuple (bytes, mimetype) hoặc None nếu không có / đã hết hạn
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, data, mimetype = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            return data, mimetype
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[1])
+
+    def _evict(self):
+        now = time.monotonic()
+        # Item được thêm theo thứ tự thời gian nên item hết hạn luôn nằm đầu
+        while self._items:
+            key, (expires_at, data, _) = next(iter(self._items.items()))
+            over_limit = len(self._items) > self.max_items or self._bytes > self.max_bytes
+            if expires_at > now and not over_limit:
+                break
+            self._remove(key)
@@ -4,24 +4,80 @@ Simpler approach than color-based detection
 """
 import cv2
 import numpy as np
+import annotation_renderer
+import box_fusion
+import color_lut
+import smoothing as smoothing_backends
+import tiling
+from image_context import ImageContext, scale_pixels
 
-def detect_individual_teeth(image_path):
+def detect_individual_teeth(image, max_side=0, color_ranges=None,
+                            tile_size=0, tile_overlap=768, tile_workers=1, smoothing='bilateral'):
     """
     Phát hiện từng răng riêng lẻ bằng edge detection
+
+    Args:
+        image: ImageContext (hoặc đường dẫn ảnh)
+        max_side: Chạy trên ảnh làm việc có cạnh dài nhất max_side px
+            (0 = độ phân giải gốc); bbox trả về luôn theo toạ độ ảnh gốc
+        color_ranges: Ngưỡng HSV ghi đè cho các lớp màu (xem color_lut.DEFAULT_RANGES)
+        tile_size: Ảnh làm việc lớn hơn tile_size px được xử lý theo từng ô
+            (0 = không chia ô, xem tiling)
+        tile_overlap: Độ chồng giữa các ô (px)
+        tile_workers: Số ô xử lý song song
+        smoothing: Backend làm mịn trước khi threshold (xem smoothing.BACKENDS)
     """
-    img = cv2.imread(image_path)
-    if img is None:
+    ctx = ImageContext.ensure(image)
+    if ctx is None:
         return []
     
-    height, width = img.shape[:2]
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    work = ctx.working(max_side)
+    scale = work.scale / ctx.scale
+    height, width = work.height, work.width
+    tiles = None
+    if tile_size and max(width, height) > tile_size:
+        tiles = tiling.tile_grid(width, height, tile_size, tile_overlap)
+    
+    # Filter by size relative to the whole image (also when tiled)
+    min_area = (width * height) * 0.0005  # 0.05% of image
+    max_area = (width * height) * 0.03    # 3% of image
+    
+    def find(region, x, y):
+        # Center region where teeth should be
+        center_box = (width * 0.25 - x, height * 0.35 - y, width * 0.75 - x, height * 0.65 - y)
+        return _find_teeth(region, scale, center_box, min_area, max_area, color_ranges, smoothing)
+    
+    detections = tiling.detect(work, find, tiles, tile_workers)
+    
+    # Back to original image coordinates
+    for det in detections:
+        box = det['bbox']
+        det['bbox'] = work.project_bbox(box['x1'], box['y1'], box['x2'] - box['x1'], box['y2'] - box['y1'], ctx)
+        det['area'] = det['area'] / (scale * scale)
+    
+    # First 8 teeth from left to right (visible teeth in image)
+    x1 = np.array([det['bbox']['x1'] for det in detections])
+    return [detections[i] for i in box_fusion.top_k(-x1, 8)]
+
+
+def _find_teeth(region, scale, center_box, min_area, max_area, color_ranges=None, smoothing='bilateral'):
+    """
+    Răng trong region (cả ảnh làm việc hoặc một ô).
+
+    Args:
+        center_box: Vùng trung tâm (x_min, y_min, x_max, y_max) theo toạ độ region
+
+    Returns:
+        List detection với bbox và area theo toạ độ của region
+    """
+    gray = region.gray
     
-    # Apply bilateral filter to reduce noise while keeping edges sharp
-    bilateral = cv2.bilateralFilter(gray, 9, 75, 75)
+    # Reduce noise while keeping edges sharp (bilateral by default)
+    smoothed = smoothing_backends.smooth(gray, scale, smoothing)
     
     # Apply adaptive thresholding to get teeth regions
-    adaptive = cv2.adaptiveThreshold(bilateral, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                     cv2.THRESH_BINARY, 11, 2)
+    adaptive = cv2.adaptiveThreshold(smoothed, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                     cv2.THRESH_BINARY, scale_pixels(11, scale, odd=True, minimum=3), 2)
     
     # Invert (teeth should be white)
     adaptive_inv = cv2.bitwise_not(adaptive)
@@ -30,14 +86,8 @@ def detect_individual_teeth(image_path):
     contours, _ = cv2.findContours(adaptive_inv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     detections = []
-    min_area = (width * height) * 0.0005  # 0.05% of image
-    max_area = (width * height) * 0.03    # 3% of image
-    
-    # Center region where teeth should be
-    center_x_min = width * 0.25
-    center_x_max = width * 0.75
-    center_y_min = height * 0.35
-    center_y_max = height * 0.65
+    labels = None
+    center_x_min, center_y_min, center_x_max, center_y_max = center_box
     
     for contour in contours:
         area = cv2.contourArea(contour)
@@ -63,15 +113,11 @@ def detect_individual_teeth(image_path):
             avg_brightness = np.mean(roi)
             
             if avg_brightness > 100:  # Bright enough to be a tooth
-                # Check for yellow/brown stains
-                roi_color = img[y:y+h, x:x+w]
-                hsv_roi = cv2.cvtColor(roi_color, cv2.COLOR_BGR2HSV)
-                
-                # Yellow/brown range
-                lower_stain = np.array([10, 30, 30])
-                upper_stain = np.array([30, 255, 200])
-                stain_mask = cv2.inRange(hsv_roi, lower_stain, upper_stain)
-                stain_ratio = np.sum(stain_mask > 0) / (w * h)
+                # Check for yellow/brown stains (ảnh nhãn màu tính một lần cho cả vùng)
+                if labels is None:
+                    labels = color_lut.labels_for(region, color_ranges)
+                stain_mask = color_lut.mask(labels[y:y+h, x:x+w], 'tooth_stain', value=1)
+                stain_ratio = cv2.countNonZero(stain_mask) / (w * h)
                 
                 # Classify
                 if stain_ratio > 0.15:
@@ -82,58 +128,25 @@ def detect_individual_teeth(image_path):
                     confidence = 0.85
                 
                 detection = {
-                    'bbox': {
-                        'x1': int(x),
-                        'y1': int(y),
-                        'x2': int(x + w),
-                        'y2': int(y + h)
-                    },
+                    'bbox': {'x1': x, 'y1': y, 'x2': x + w, 'y2': y + h},
                     'class_name': class_name,
                     'confidence': float(confidence),
                     'area': float(area)
                 }
                 detections.append(detection)
     
-    # Sort by x position (left to right)
-    detections.sort(key=lambda d: d['bbox']['x1'])
-    
-    # Limit to 8 teeth (visible teeth in image)
-    return detections[:8]
+    return detections
 
 
-def draw_simple_detections(image_path, detections):
+def render_simple_detections(image, detections):
     """
-    Vẽ bounding boxes đơn giản
+    Vẽ bounding boxes đơn giản lên bản sao của ảnh (không ghi file)
+
+    Args:
+        image: ImageContext (hoặc đường dẫn ảnh)
+        detections: List detection từ detect_individual_teeth
+
+    Returns:
+        Ảnh BGR đã vẽ, hoặc None nếu không đọc được ảnh
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return image_path
-    
-    for det in detections:
-        bbox = det['bbox']
-        x1, y1 = bbox['x1'], bbox['y1']
-        x2, y2 = bbox['x2'], bbox['y2']
-        
-        class_name = det['class_name']
-        confidence = det['confidence']
-        
-        # Color based on class
-        if class_name == 'Răng khỏe mạnh':
-            color = (0, 255, 0)  # Green
-        else:
-            color = (0, 255, 255)  # Yellow for calculus
-        
-        # Draw rectangle
-        cv2.rectangle(img, (x1, y1), (x2, y2), color, 3)
-        
-        # Draw label
-        label = f"{class_name} {confidence:.0%}"
-        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-        cv2.rectangle(img, (x1, y1-25), (x1+w+10, y1), color, -1)
-        cv2.putText(img, label, (x1+5, y1-8),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-    
-    # Save
-    output_path = image_path.replace('.', '_simple_detected.')
-    cv2.imwrite(output_path, img)
-    return output_path
+    return annotation_renderer.render(image, detections, style='simple')
@@ -0,0 +1,140 @@
+"""
+Làm mịn giữ biên cho simple tooth detector.
+
+Bilateral filter (9px) là bước đắt nhất của detect_individual_teeth và chi phí
+tăng theo diện tích ảnh nhân với diện tích kernel. Các backend:
+- bilateral: cv2.bilateralFilter, bản tham chiếu
+- guided: guided filter tự dẫn (He et al.) chỉ gồm các box filter, chi phí không
+  phụ thuộc bán kính; hệ số tính trên ảnh thu nhỏ GUIDED_SUBSAMPLE lần
+- bilateral_lowres: bilateral trên ảnh thu nhỏ, sau đó phóng về độ phân giải gốc
+  bằng guided upsampling (hệ số tuyến tính tính ở ảnh nhỏ, áp lên ảnh gốc làm guide)
+  để biên vẫn sắc như ảnh gốc
+
+Khi kernel đã nhỏ (ảnh làm việc thu nhỏ mạnh) mọi backend dùng bilateral vì khi đó
+bilateral rẻ hơn.
+
+Kiểm tra độ khớp với bản tham chiếu: benchmarks/smoothing_parity.py.
+"""
+import cv2
+import numpy as np
+
+from image_context import scale_pixels
+
+BACKENDS = ('bilateral', 'guided', 'bilateral_lowres')
+
+# Tham số bilateral của bản tham chiếu (ở ảnh ~1MP)
+BILATERAL_DIAMETER = 9
+BILATERAL_SIGMA = 75
+
+# eps của guided filter theo thang độ sáng 0-255: vùng có độ lệch chuẩn nhỏ hơn
+# sqrt(eps) bị làm phẳng, biên mạnh hơn được giữ lại (chỉnh theo smoothing_parity)
+GUIDED_EPS = 30.0 ** 2
+# Hệ số thu nhỏ khi tính hệ số của guided filter (fast guided filter)
+GUIDED_SUBSAMPLE = 2
+
+# Hệ số thu nhỏ của bilateral_lowres và eps của bước guided upsampling
+# (nhỏ: bám sát kết quả bilateral ở ảnh nhỏ, chỉ mượn biên từ ảnh gốc)
+LOWRES_FACTOR = 2
+LOWRES_EPS = 3.0 ** 2
+
+# Kernel bilateral từ chừng này px trở xuống thì bilateral rẻ hơn các backend khác
+MIN_FAST_DIAMETER = 5
+
+
+def _box(img, radius):
+    return cv2.boxFilter(img, -1, (2 * radius + 1, 2 * radius + 1), borderType=cv2.BORDER_REFLECT)
+
+
+def _coefficients(guide, src, radius, eps):
+    """Hệ số (a, b) đã lấy trung bình của guided filter, cùng độ phân giải với guide."""
+    mean_i = _box(guide, radius)
+    var_i = _box(guide * guide, radius) - mean_i * mean_i
+    if src is guide:
+        mean_p, cov_ip = mean_i, var_i
+    else:
+        mean_p = _box(src, radius)
+        cov_ip = _box(guide * src, radius) - mean_i * mean_p
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return _box(a, radius), _box(b, radius)
+
+
+def _apply(a, b, gray):
+    """q = a * gray + b (a, b được phóng về kích thước gray nếu cần), trả về uint8."""
+    size = (gray.shape[1], gray.shape[0])
+    if a.shape[:2] != gray.shape[:2]:
+        a = cv2.resize(a, size, interpolation=cv2.INTER_LINEAR)
+        b = cv2.resize(b, size, interpolation=cv2.INTER_LINEAR)
+    out = cv2.multiply(a, gray, dtype=cv2.CV_32F)
+    cv2.add(out, b, dst=out)
+    # Sau khi kẹp về [0, 255], convertScaleAbs chỉ còn làm tròn + đổi sang uint8
+    np.clip(out, 0, 255, out=out)
+    return cv2.convertScaleAbs(out)
+
+
+def guided_filter(guide, src, radius, eps, subsample=1):
+    """
+    Guided filter (He et al.): q = a * guide + b, với a, b tuyến tính cục bộ trong
+    cửa sổ bán kính radius.
+
+    Args:
+        guide: Ảnh dẫn (uint8, 1 kênh)
+        src: Ảnh cần lọc (cùng kích thước với guide; truyền chính guide để lọc tự dẫn)
+        radius: Bán kính cửa sổ (px, ở độ phân giải gốc)
+        eps: Hệ số làm mịn (thang 0-255 bình phương)
+        subsample: Tính a, b trên ảnh thu nhỏ subsample lần rồi phóng lại
+            (fast guided filter, ~subsample^2 lần ít phép tính hơn)
+
+    Returns:
+        Ảnh uint8 cùng kích thước với guide
+    """
+    small_guide, small_src = guide, src
+    if subsample > 1:
+        size = (max(1, guide.shape[1] // subsample), max(1, guide.shape[0] // subsample))
+        small_guide = cv2.resize(guide, size, interpolation=cv2.INTER_AREA)
+        small_src = small_guide if src is guide else cv2.resize(src, size, interpolation=cv2.INTER_AREA)
+        radius = max(1, round(radius / subsample))
+    guide_f = small_guide.astype(np.float32)
+    src_f = guide_f if small_src is small_guide else small_src.astype(np.float32)
+    a, b = _coefficients(guide_f, src_f, radius, eps)
+    return _apply(a, b, guide)
+
+
+def smooth(gray, scale=1.0, backend='bilateral'):
+    """
+    Làm mịn ảnh xám, giữ biên.
+
+    Args:
+        gray: Ảnh xám uint8
+        scale: Tỉ lệ ảnh so với ảnh ~1MP mà tham số được chỉnh (xem scale_pixels)
+        backend: Một trong BACKENDS
+
+    Returns:
+        Ảnh xám uint8 cùng kích thước
+
+    Raises:
+        ValueError: Nếu backend không hỗ trợ
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend làm mịn không hỗ trợ: {backend} (chọn {', '.join(BACKENDS)})")
+    diameter = scale_pixels(BILATERAL_DIAMETER, scale, odd=True)
+    if backend in ('guided', 'bilateral_lowres') and diameter <= MIN_FAST_DIAMETER:
+        # Kernel nhỏ (ảnh làm việc đã thu nhỏ): bilateral đã rẻ hơn các bước box filter
+        backend = 'bilateral'
+
+    if backend == 'bilateral':
+        return cv2.bilateralFilter(gray, diameter, BILATERAL_SIGMA, BILATERAL_SIGMA)
+
+    if backend == 'guided':
+        return guided_filter(gray, gray, diameter // 2, GUIDED_EPS, subsample=GUIDED_SUBSAMPLE)
+
+    # bilateral_lowres
+    factor = LOWRES_FACTOR
+    size = (max(1, gray.shape[1] // factor), max(1, gray.shape[0] // factor))
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    filtered = cv2.bilateralFilter(small, scale_pixels(BILATERAL_DIAMETER, scale / factor, odd=True),
+                                   BILATERAL_SIGMA, BILATERAL_SIGMA)
+    # Guided upsampling: a, b ánh xạ ảnh nhỏ -> ảnh nhỏ đã lọc, áp lên ảnh gốc
+    small_f = small.astype(np.float32)
+    a, b = _coefficients(small_f, filtered.astype(np.float32), 1, LOWRES_EPS)
+    return _apply(a, b, gray)
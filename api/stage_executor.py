@@ -0,0 +1,237 @@
+"""
+Stage executor cho pipeline phân tích ảnh.
+Chạy song song các stage độc lập (detector, CNN, Gemini) trên một thread pool
+giới hạn, mỗi stage có timeout và cờ huỷ riêng. Quan hệ phụ thuộc giữa các stage
+(ví dụ YOLO chỉ chạy khi detector CV không tìm thấy gì) được khai báo tường minh.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Trạng thái kết thúc của một stage
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+STATUS_SKIPPED = 'skipped'
+STATUS_CANCELLED = 'cancelled'
+
+
+class Stage:
+    """Mô tả một stage trong pipeline."""
+
+    def __init__(self, name, func, depends_on=(), condition=None, timeout=None):
+        """
+        Args:
+            name: Tên stage (duy nhất trong một lần chạy)
+            func: Hàm func(inputs) -> giá trị, với inputs là StageInputs
+            depends_on: Tên các stage phải kết thúc trước khi stage này chạy
+            condition: Hàm condition(results) -> bool, quyết định có chạy stage
+                hay bỏ qua sau khi các phụ thuộc đã kết thúc
+            timeout: Thời gian tối đa (giây) kể từ khi stage bắt đầu chạy
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.condition = condition
+        self.timeout = timeout
+
+
+class StageResult:
+    """Kết quả của một stage."""
+
+    def __init__(self, name, status, value=None, error=None, elapsed=0.0):
+        self.name = name
+        self.status = status
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status == STATUS_OK
+
+    def __repr__(self):
+        return f"StageResult({self.name!r}, {self.status!r}, elapsed={self.elapsed:.3f}s)"
+
+
+class StageInputs:
+    """Dữ liệu truyền vào hàm của stage."""
+
+    def __init__(self, results, cancel_event, deadline=None):
+        # Kết quả của các stage phụ thuộc (tên -> StageResult)
+        self.results = results
+        # Được set khi stage bị timeout/huỷ; stage chạy lâu nên kiểm tra định kỳ
+        self.cancel_event = cancel_event
+        # Mốc time.monotonic() stage bị timeout (timeout của stage hoặc của cả request), None = không giới hạn
+        self.deadline = deadline
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def remaining(self):
+        """Số giây còn lại trước khi stage bị timeout (None = không giới hạn, tối thiểu 0)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class _Running:
+    """Trạng thái nội bộ của một stage đã được submit."""
+
+    def __init__(self, stage, cancel_event):
+        self.stage = stage
+        self.cancel_event = cancel_event
+        self.future = None
+        self.started_at = None
+
+
+class StageExecutor:
+    """
+    Thực thi một tập stage theo đồ thị phụ thuộc trên thread pool dùng chung.
+
+    Dùng thread (không phải process) vì các stage nặng đều nhả GIL: OpenCV,
+    TensorFlow/PyTorch và lời gọi HTTP tới Gemini.
+    """
+
+    def __init__(self, max_workers=8, thread_name_prefix='stage'):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix=thread_name_prefix)
+
+    def run(self, stages, timeout=None, on_complete=None):
+        """
+        Chạy các stage và chờ tới khi tất cả kết thúc hoặc hết thời gian.
+
+        Args:
+            stages: List các Stage
+            timeout: Thời gian tối đa cho cả lần chạy (giây), None = không giới hạn
+            on_complete: Callback on_complete(StageResult) gọi ngay khi một stage kết thúc
+
+        Returns:
+            dict: tên stage -> StageResult
+        """
+        by_name = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.depends_on:
+                if dep not in by_name:
+                    raise ValueError(f"Stage '{stage.name}' phụ thuộc stage không tồn tại: '{dep}'")
+
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        results = {}
+        pending = list(stages)
+        running = {}
+
+        def finish(result):
+            results[result.name] = result
+            if on_complete is not None:
+                try:
+                    on_complete(result)
+                except Exception as e:
+                    print(f"⚠️  Stage callback error ({result.name}): {e}")
+
+        while pending or running:
+            # Submit các stage đã đủ phụ thuộc
+            progressed = True
+            while progressed:
+                progressed = False
+                for stage in list(pending):
+                    if not all(dep in results for dep in stage.depends_on):
+                        continue
+                    pending.remove(stage)
+                    progressed = True
+                    dep_results = {dep: results[dep] for dep in stage.depends_on}
+                    if stage.condition is not None and not stage.condition(dep_results):
+                        finish(StageResult(stage.name, STATUS_SKIPPED))
+                        continue
+                    running[stage.name] = self._submit(stage, dep_results, deadline)
+
+            if not running:
+                if pending:
+                    # Phụ thuộc vòng: không thể chạy tiếp
+                    for stage in pending:
+                        finish(StageResult(stage.name, STATUS_SKIPPED,
+                                           error='Phụ thuộc vòng giữa các stage'))
+                break
+
+            now = time.monotonic()
+            wait_for = self._next_wakeup(running.values(), now, deadline)
+            done, _ = wait([r.future for r in running.values()],
+                           timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for name, item in list(running.items()):
+                elapsed = now - item.started_at if item.started_at else 0.0
+                if item.future in done:
+                    del running[name]
+                    try:
+                        value = item.future.result()
+                        finish(StageResult(name, STATUS_OK, value=value, elapsed=elapsed))
+                    except Exception as e:
+                        finish(StageResult(name, STATUS_ERROR, error=str(e), elapsed=elapsed))
+                elif deadline is not None and now >= deadline:
+                    del running[name]
+                    self._cancel(item)
+                    finish(StageResult(name, STATUS_CANCELLED,
+                                       error='Hết thời gian xử lý request', elapsed=elapsed))
+                elif (item.stage.timeout is not None and item.started_at is not None
+                      and elapsed >= item.stage.timeout):
+                    del running[name]
+                    self._cancel(item)
+                    finish(StageResult(name, STATUS_TIMEOUT,
+                                       error=f'Quá {item.stage.timeout}s', elapsed=elapsed))
+
+            if deadline is not None and time.monotonic() >= deadline:
+                for stage in pending:
+                    finish(StageResult(stage.name, STATUS_CANCELLED,
+                                       error='Hết thời gian xử lý request'))
+                pending = []
+
+        return results
+
+    def _submit(self, stage, dep_results, run_deadline=None):
+        item = _Running(stage, threading.Event())
+
+        def call():
+            item.started_at = time.monotonic()
+            if item.cancel_event.is_set():
+                raise RuntimeError('Stage đã bị huỷ')
+            deadlines = [d for d in (run_deadline, stage.timeout and item.started_at + stage.timeout)
+                         if d is not None]
+            return stage.func(StageInputs(dep_results, item.cancel_event, min(deadlines, default=None)))
+
+        item.future = self._pool.submit(call)
+        return item
+
+    @staticmethod
+    def _cancel(item):
+        # Huỷ nếu stage còn trong hàng đợi; nếu đang chạy thì chỉ báo cờ huỷ,
+        # kết quả trả về sau đó sẽ bị bỏ qua.
+        item.cancel_event.set()
+        item.future.cancel()
+
+    @staticmethod
+    def _next_wakeup(running, now, deadline):
+        """Thời gian chờ tới mốc timeout gần nhất (None = chờ tới khi có stage xong)."""
+        candidates = []
+        if deadline is not None:
+            candidates.append(deadline - now)
+        for item in running:
+            if item.stage.timeout is None:
+                continue
+            if item.started_at is None:
+                # Stage còn trong hàng đợi: kiểm tra lại sau một chút
+                candidates.append(0.05)
+            else:
+                candidates.append(item.started_at + item.stage.timeout - now)
+        if not candidates:
+            return None
+        return max(0.0, min(candidates))
+
+    def submit(self, func, *args, **kwargs):
+        """Chạy một tác vụ đơn lẻ trên thread pool dùng chung, trả về Future."""
+        return self._pool.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
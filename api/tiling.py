@@ -0,0 +1,144 @@
+"""
+Xử lý ảnh rất lớn (ảnh scanner trong miệng, X-quang toàn cảnh) theo từng ô.
+
+Ảnh được chia thành các ô chồng lên nhau; detector chạy trên từng ô nên bộ nhớ
+tạm (mask, ảnh nhãn, gray...) chỉ tỉ lệ với kích thước ô thay vì cả ảnh. Detection
+của các ô được dời về toạ độ ảnh và gộp lại: một vùng nằm trên đường nối giữa hai
+ô xuất hiện ở cả hai (thường bị cắt ở một bên) nên được hợp thành một box.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import box_fusion
+from image_context import ImageContext
+
+
+def tile_grid(width, height, tile_size, overlap=768):
+    """
+    Chia ảnh thành ít ô nhất có cạnh không quá tile_size, chồng nhau ít nhất
+    overlap px. Các ô có cùng kích thước theo mỗi chiều (chia đều) để không tốn
+    thêm công cho một ô cuối chồng gần hết lên ô trước.
+
+    Returns:
+        list (x, y, w, h)
+    """
+    overlap = max(0, min(overlap, tile_size // 2))
+
+    def spans(length):
+        if length <= tile_size:
+            return [(0, length)]
+        count = math.ceil((length - overlap) / (tile_size - overlap))
+        size = math.ceil((length + (count - 1) * overlap) / count)
+        step = size - overlap
+        return [(min(i * step, length - size), size) for i in range(count)]
+
+    return [(x, y, w, h) for y, h in spans(height) for x, w in spans(width)]
+
+
+def merge_detections(detections, min_overlap=0.6):
+    """
+    Gộp detection trùng nhau ở vùng chồng giữa các ô (cùng class_name).
+
+    Hai box cùng lớp có diện tích giao >= min_overlap diện tích box nhỏ hơn được
+    hợp thành box bao cả hai, giữ confidence và area lớn nhất; các mảnh bị cắt ở
+    mép ô gộp vào box đầy đủ (box lớn nhất giữ các trường còn lại). Xem
+    box_fusion.merge_overlapping_detections.
+
+    Args:
+        detections: List detection có 'bbox' {'x1','y1','x2','y2'}, 'class_name', 'confidence'
+        min_overlap: Ngưỡng giao / box nhỏ hơn
+
+    Returns:
+        List detection đã gộp (theo confidence giảm dần)
+    """
+    return box_fusion.merge_overlapping_detections(detections, min_overlap)
+
+
+def offset_detections(detections, dx, dy):
+    """Dời bbox của detection (toạ độ trong ô) về toạ độ ảnh."""
+    for det in detections:
+        box = det['bbox']
+        det['bbox'] = {'x1': box['x1'] + dx, 'y1': box['y1'] + dy,
+                       'x2': box['x2'] + dx, 'y2': box['y2'] + dy}
+    return detections
+
+
+def run_tiled(tiles, detect_tile, workers=1):
+    """
+    Chạy detect_tile(x, y, w, h) trên từng ô, song song tối đa workers ô một lúc.
+    Các hàm OpenCV nhả GIL nên thread là đủ; bộ nhớ tạm tỉ lệ với workers x ô.
+
+    Returns:
+        List kết quả theo thứ tự tiles
+    """
+    if workers <= 1 or len(tiles) <= 1:
+        return [detect_tile(*tile) for tile in tiles]
+    with ThreadPoolExecutor(max_workers=min(workers, len(tiles)), thread_name_prefix='tile') as pool:
+        return list(pool.map(lambda tile: detect_tile(*tile), tiles))
+
+
+def detect(view, find, tiles=None, workers=1):
+    """
+    Chạy detector trên cả view hoặc trên từng ô rồi gộp kết quả.
+
+    Args:
+        view: ImageContext (ảnh làm việc)
+        find: Hàm find(region, x, y) -> list detection theo toạ độ của region;
+            region là ImageContext của ô (view con, không copy pixel) có góc trên
+            trái tại (x, y) trong view. Tham số tính theo cả ảnh (vùng răng,
+            vùng trung tâm...) phải được dời đi (x, y) trong find
+        tiles: Kết quả tile_grid, None = không chia ô
+        workers: Số ô chạy song song
+
+    Returns:
+        List detection theo toạ độ của view
+    """
+    if not tiles:
+        return find(view, 0, 0)
+
+    def detect_tile(x, y, w, h):
+        region = ImageContext(view.bgr[y:y + h, x:x + w], source=view.source, scale=view.scale)
+        return offset_detections(find(region, x, y), x, y)
+
+    per_tile = run_tiled(tiles, detect_tile, workers)
+    return merge_detections([det for found in per_tile for det in found])
+
+
+def detect_batched(detect_batch, images, tile_size=0, overlap=768, max_batch=16):
+    """
+    Chạy detector theo batch (YOLO) trên nhiều ảnh, chia ô ảnh lớn hơn tile_size.
+
+    Các ô (view, không copy) chạy chung batch với ảnh khác; detection của các ô
+    được dời về toạ độ ảnh và gộp lại theo từng ảnh.
+
+    Args:
+        detect_batch: Hàm detect_batch(list ảnh BGR) -> list detection cho từng ảnh
+        images: List ảnh BGR
+        tile_size: Cạnh tối đa của một ô (0 = không chia ô)
+        overlap: Độ chồng giữa các ô (px)
+        max_batch: Số ảnh/ô tối đa mỗi lần gọi detect_batch
+
+    Returns:
+        List detection cho từng ảnh, cùng thứ tự đầu vào
+    """
+    crops, owners, tiled = [], [], set()
+    for index, image in enumerate(images):
+        height, width = image.shape[:2]
+        if tile_size and max(width, height) > tile_size:
+            tiles = tile_grid(width, height, tile_size, overlap)
+            tiled.add(index)
+        else:
+            tiles = [(0, 0, width, height)]
+        for x, y, w, h in tiles:
+            crops.append(image[y:y + h, x:x + w])
+            owners.append((index, x, y))
+
+    detections = [[] for _ in images]
+    # Chia nhỏ để số ô của một ảnh lớn không làm batch vượt giới hạn
+    step = max(1, max_batch)
+    for start in range(0, len(crops), step):
+        outputs = detect_batch(crops[start:start + step])
+        for (index, x, y), found in zip(owners[start:start + step], outputs):
+            detections[index].extend(offset_detections(found, x, y) if index in tiled else found)
+    return [merge_detections(found) if index in tiled else found
+            for index, found in enumerate(detections)]
@@ -4,44 +4,115 @@ Dựa vào màu sắc và texture để tìm vùng bất thường
 """
 import cv2
 import numpy as np
+import annotation_renderer
+import box_fusion
+import color_lut
+import tiling
+from image_context import ImageContext, scale_pixels
 
-def detect_damaged_teeth(image_path, sensitivity='medium'):
+def detect_damaged_teeth(image, sensitivity='medium', max_side=0, color_ranges=None,
+                         tile_size=0, tile_overlap=768, tile_workers=1):
     """
     Phát hiện răng hư dựa trên màu sắc và contrast
     
     Args:
-        image_path: Đường dẫn ảnh
+        image: ImageContext (hoặc đường dẫn ảnh)
         sensitivity: 'low', 'medium', 'high' - độ nhạy phát hiện
+        max_side: Chạy trên ảnh làm việc có cạnh dài nhất max_side px
+            (0 = độ phân giải gốc); bbox trả về luôn theo toạ độ ảnh gốc
+        color_ranges: Ngưỡng HSV ghi đè cho các lớp màu (xem color_lut.DEFAULT_RANGES)
+        tile_size: Ảnh làm việc lớn hơn tile_size px được xử lý theo từng ô
+            (0 = không chia ô, xem tiling)
+        tile_overlap: Độ chồng giữa các ô (px)
+        tile_workers: Số ô xử lý song song
     
     Returns:
         List các vùng phát hiện: [{'bbox': (x1,y1,x2,y2), 'type': 'cavity/calculus/decay', 'severity': 0-1}]
     """
-    img = cv2.imread(image_path)
-    if img is None:
+    ctx = ImageContext.ensure(image)
+    if ctx is None:
         return []
     
-    # Convert to different color spaces
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    height, width = img.shape[:2]
-    detections = []
+    # Color spaces are derived once per request and shared
+    work = ctx.working(max_side)
+    scale = work.scale / ctx.scale
+    height, width = work.height, work.width
+    tiles = None
+    if tile_size and max(width, height) > tile_size:
+        tiles = tiling.tile_grid(width, height, tile_size, tile_overlap)
     
     # STEP 1: Detect teeth region (using edge detection + white color)
+    if tiles is None:
+        teeth_bbox = _find_teeth_region(work, scale, color_ranges)
+    else:
+        # Vùng răng là thông tin của cả ảnh: tìm trên ảnh thu nhỏ rồi chiếu lên ảnh làm việc
+        overview = work.working(tile_size)
+        factor = work.scale / overview.scale
+        teeth_bbox = tuple(int(round(v * factor))
+                           for v in _find_teeth_region(overview, overview.scale / ctx.scale, color_ranges))
+    
+    teeth_x1, teeth_y1, teeth_x2, teeth_y2 = teeth_bbox
+    region = work.project_bbox(teeth_x1, teeth_y1, teeth_x2 - teeth_x1, teeth_y2 - teeth_y1, ctx)
+    print(f"  Teeth region: ({region['x1']},{region['y1']})-({region['x2']},{region['y2']})")
+    
+    # Filter by size relative to the whole image (also when tiled)
+    min_area = (width * height) * 0.0003  # At least 0.03% of image
+    max_area = (width * height) * 0.12    # At most 12% of image
+    
+    def find_lesions(region, x, y):
+        bbox = (teeth_x1 - x, teeth_y1 - y, teeth_x2 - x, teeth_y2 - y)
+        return _find_lesions(region, scale, bbox, min_area, max_area, color_ranges)
+    
+    def find_healthy(region, x, y):
+        bbox = (teeth_x1 - x, teeth_y1 - y, teeth_x2 - x, teeth_y2 - y)
+        return _find_healthy(region, scale, bbox, min_area, max_area, color_ranges)
+    
+    detections = tiling.detect(work, find_lesions, tiles, tile_workers)
+    
+    # If no damaged teeth found, detect healthy teeth (white regions)
+    if len(detections) == 0:
+        print("  No damaged teeth found, detecting healthy teeth...")
+        detections = tiling.detect(work, find_healthy, tiles, tile_workers)
+    
+    # Back to original image coordinates
+    for det in detections:
+        box = det['bbox']
+        det['bbox'] = work.project_bbox(box['x1'], box['y1'], box['x2'] - box['x1'], box['y2'] - box['y1'], ctx)
+        det['area'] = det['area'] / (scale * scale)
+    
+    # Top 5 detections by area (largest first)
+    areas = np.array([det['area'] for det in detections])
+    return [detections[i] for i in box_fusion.top_k(areas, 5)]
+
+
+def _find_teeth_region(view, scale, color_ranges=None):
+    """
+    Vùng chứa răng: vùng trắng có cạnh lớn nhất (>= 5% ảnh), mở rộng thêm lề;
+    không tìm thấy thì lấy giữa ảnh.
+
+    Args:
+        view: ImageContext để tìm (ảnh làm việc hoặc ảnh thu nhỏ)
+        scale: Tỉ lệ view / ảnh gốc (cho kích thước kernel)
+
+    Returns:
+        tuple (x1, y1, x2, y2) theo toạ độ của view
+    """
+    height, width = view.height, view.width
+    # Mọi lớp màu (răng, cao răng, sâu răng, vết ố, lợi...) trong một lượt tra bảng
+    labels = color_lut.labels_for(view, color_ranges)
+    
     # Find edges
-    edges = cv2.Canny(gray, 50, 150)
+    edges = cv2.Canny(view.gray, 50, 150)
     
     # Find white regions (teeth are white)
-    lower_teeth = np.array([0, 0, 140])  # White-ish
-    upper_teeth = np.array([180, 40, 255])
-    teeth_mask = cv2.inRange(hsv, lower_teeth, upper_teeth)
+    teeth_mask = color_lut.mask(labels, 'teeth')
     
     # Combine with edges
-    teeth_region = cv2.bitwise_and(teeth_mask, teeth_mask, mask=cv2.dilate(edges, None, iterations=2))
+    teeth_region = cv2.bitwise_and(teeth_mask, teeth_mask,
+                                   mask=cv2.dilate(edges, None, iterations=scale_pixels(2, scale)))
     
     # Morphological operations to find teeth area
-    kernel_large = cv2.getStructuringElement(cv2.MORPH_RECT, (20, 10))
+    kernel_large = cv2.getStructuringElement(cv2.MORPH_RECT, (scale_pixels(20, scale), scale_pixels(10, scale)))
     teeth_area = cv2.morphologyEx(teeth_region, cv2.MORPH_CLOSE, kernel_large)
     teeth_area = cv2.dilate(teeth_area, kernel_large, iterations=2)
     
@@ -58,10 +129,10 @@ def detect_damaged_teeth(image_path, sensitivity='medium'):
             x, y, w, h = cv2.boundingRect(contour)
             # Expand bbox slightly
             teeth_bbox = (
-                max(0, x - 20),
-                max(0, y - 20),
-                min(width, x + w + 40),
-                min(height, y + h + 40)
+                max(0, x - scale_pixels(20, scale)),
+                max(0, y - scale_pixels(20, scale)),
+                min(width, x + w + scale_pixels(40, scale)),
+                min(height, y + h + scale_pixels(40, scale))
             )
     
     # If no teeth region found, use center of image
@@ -72,200 +143,140 @@ def detect_damaged_teeth(image_path, sensitivity='medium'):
             int(width * 0.85),
             int(height * 0.75)
         )
+    return teeth_bbox
+
+
+def _find_lesions(region, scale, teeth_bbox, min_area, max_area, color_ranges=None):
+    """
+    Vùng cao răng / sâu răng / đổi màu trong region (cả ảnh làm việc hoặc một ô).
+
+    Returns:
+        List detection với bbox và area theo toạ độ của region
+    """
+    labels = color_lut.labels_for(region, color_ranges)
+    gray = region.gray
     
-    teeth_x1, teeth_y1, teeth_x2, teeth_y2 = teeth_bbox
-    print(f"  Teeth region: ({teeth_x1},{teeth_y1})-({teeth_x2},{teeth_y2})")
-    
-    # 1. PHÁT HIỆN CAO RĂNG (màu vàng/nâu)
-    # HSV range for yellow/brown (calculus)
-    lower_yellow = np.array([15, 40, 60])
-    upper_yellow = np.array([35, 255, 200])
-    calculus_mask = cv2.inRange(hsv, lower_yellow, upper_yellow)
+    # Vùng bất thường: cao răng (vàng/nâu), sâu răng (đen/nâu đậm), răng đổi màu
+    # (ố vàng/nâu). Lớp 'gum' (viêm lợi, màu đỏ) cũng có trong ảnh nhãn
+    combined_mask = color_lut.mask(labels, 'calculus', 'cavity', 'stain')
     
-    # 2. PHÁT HIỆN SÂU RĂNG (màu đen/nâu đậm)
-    # Detect very dark spots (cavities)
-    lower_dark = np.array([0, 0, 0])
-    upper_dark = np.array([180, 255, 80])
-    cavity_mask = cv2.inRange(hsv, lower_dark, upper_dark)
+    # Morphological operations to clean up
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (scale_pixels(5, scale), scale_pixels(5, scale)))
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
     
-    # 3. PHÁT HIỆN RĂNG ĐỔI MÀU (discoloration)
-    # Detect brown/yellow stains
-    lower_stain = np.array([10, 30, 40])
-    upper_stain = np.array([30, 200, 180])
-    stain_mask = cv2.inRange(hsv, lower_stain, upper_stain)
+    # Filter connected components by size, position and shape (all at once)
+    stats = _candidate_components(combined_mask, min_area, max_area, teeth_bbox)
+    if not len(stats):
+        return []
     
-    # 4. PHÁT HIỆN VIÊM LỢI (màu đỏ)
-    lower_red1 = np.array([0, 100, 100])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([160, 100, 100])
-    upper_red2 = np.array([180, 255, 255])
-    red_mask1 = cv2.inRange(hsv, lower_red1, upper_red1)
-    red_mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-    gum_mask = cv2.bitwise_or(red_mask1, red_mask2)
+    x, y, w, h, area = stats.T
+    box_area = w * h
     
-    # Combine masks
-    combined_mask = cv2.bitwise_or(calculus_mask, cavity_mask)
-    combined_mask = cv2.bitwise_or(combined_mask, stain_mask)
+    # Tổng theo bbox của mọi thành phần qua integral image: O(1) mỗi vùng
+    # thay vì cắt ROI và np.sum/np.mean từng vùng. Integral chỉ tính trên
+    # vùng bao tất cả ứng viên
+    x0, y0 = x.min(), y.min()
+    x1, y1 = (x + w).max(), (y + h).max()
+    rx, ry = x - x0, y - y0
     
-    # Morphological operations to clean up
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
+    label_crop = labels[y0:y1, x0:x1]
     
-    # Find contours
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def region_mean(crop):
+        return _rect_sums(_integral(crop), rx, ry, w, h) / box_area
     
-    # Filter contours by size and position
-    min_area = (width * height) * 0.0003  # At least 0.03% of image
-    max_area = (width * height) * 0.12    # At most 12% of image
+    # Check average brightness (răng thường sáng hơn) - more relaxed threshold
+    avg_brightness = region_mean(gray[y0:y1, x0:x1])
+    # Mask 0/1 của từng lớp: tổng = số pixel
+    calculus_ratio = region_mean(color_lut.mask(label_crop, 'calculus', value=1))
+    cavity_ratio = region_mean(color_lut.mask(label_crop, 'cavity', value=1))
+    stain_ratio = region_mean(color_lut.mask(label_crop, 'stain', value=1))
     
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        
-        if min_area < area < max_area:
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Center of bounding box
-            center_x = x + w / 2
-            center_y = y + h / 2
-            
-            # ONLY accept detections INSIDE teeth region
-            if not (teeth_x1 < center_x < teeth_x2 and teeth_y1 < center_y < teeth_y2):
-                continue
-            
-            # Check aspect ratio (răng thường có tỉ lệ khá vuông)
-            aspect_ratio = float(w) / h if h > 0 else 0
-            if 0.4 < aspect_ratio < 2.5:
-                
-                # Determine type based on mask overlap
-                roi_calculus = calculus_mask[y:y+h, x:x+w]
-                roi_cavity = cavity_mask[y:y+h, x:x+w]
-                roi_stain = stain_mask[y:y+h, x:x+w]
-                roi_gray = gray[y:y+h, x:x+w]
-                
-                # Check average brightness (răng thường sáng hơn)
-                avg_brightness = np.mean(roi_gray)
-                if avg_brightness < 40:  # More relaxed threshold
-                    continue
-                
-                calculus_ratio = np.sum(roi_calculus > 0) / (w * h)
-                cavity_ratio = np.sum(roi_cavity > 0) / (w * h)
-                stain_ratio = np.sum(roi_stain > 0) / (w * h)
-                
-                # Determine dominant issue
-                if cavity_ratio > 0.3:
-                    issue_type = 'Sâu răng'
-                    severity = min(cavity_ratio * 1.5, 1.0)
-                elif calculus_ratio > 0.3:
-                    issue_type = 'Cao răng'
-                    severity = min(calculus_ratio * 1.2, 1.0)
-                elif stain_ratio > 0.2:
-                    issue_type = 'Răng đổi màu'
-                    severity = min(stain_ratio * 1.3, 1.0)
-                else:
-                    continue
-                
-                detection = {
-                    'bbox': {
-                        'x1': int(x),
-                        'y1': int(y),
-                        'x2': int(x + w),
-                        'y2': int(y + h)
-                    },
-                    'class_name': issue_type,
-                    'confidence': float(severity),
-                    'area': float(area)
-                }
-                detections.append(detection)
+    # Determine dominant issue (same priority as before: cavity > calculus > stain)
+    conditions = [cavity_ratio > 0.3, calculus_ratio > 0.3, stain_ratio > 0.2]
+    issue_index = np.select(conditions, [0, 1, 2], default=-1)
+    severity = np.select(conditions, [np.minimum(cavity_ratio * 1.5, 1.0),
+                                      np.minimum(calculus_ratio * 1.2, 1.0),
+                                      np.minimum(stain_ratio * 1.3, 1.0)])
+    issue_types = ('Sâu răng', 'Cao răng', 'Răng đổi màu')
     
-    # Sort by area (largest first)
-    detections.sort(key=lambda d: d['area'], reverse=True)
+    return [_detection(x[i], y[i], w[i], h[i], area[i], issue_types[issue_index[i]], severity[i])
+            for i in np.flatnonzero((avg_brightness >= 40) & (issue_index >= 0))]
+
+
+def _find_healthy(region, scale, teeth_bbox, min_area, max_area, color_ranges=None):
+    """Vùng răng trắng (khỏe mạnh) trong region, bbox và area theo toạ độ của region."""
+    # Detect white/healthy teeth regions
+    white_mask = color_lut.mask(color_lut.labels_for(region, color_ranges), 'white')
     
-    # If no damaged teeth found, detect healthy teeth (white regions)
-    if len(detections) == 0:
-        print("  No damaged teeth found, detecting healthy teeth...")
-        # Detect white/healthy teeth regions
-        lower_white = np.array([0, 0, 150])
-        upper_white = np.array([180, 30, 255])
-        white_mask = cv2.inRange(hsv, lower_white, upper_white)
-        
-        # Clean up
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_CLOSE, kernel)
-        white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_OPEN, kernel)
-        
-        # Find white teeth contours
-        white_contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        for contour in white_contours:
-            area = cv2.contourArea(contour)
-            if min_area < area < max_area:
-                x, y, w, h = cv2.boundingRect(contour)
-                center_x = x + w / 2
-                center_y = y + h / 2
-                
-                # Only in teeth region
-                if (teeth_x1 < center_x < teeth_x2 and 
-                    teeth_y1 < center_y < teeth_y2):
-                    
-                    aspect_ratio = float(w) / h if h > 0 else 0
-                    if 0.4 < aspect_ratio < 2.5:
-                        detection = {
-                            'bbox': {
-                                'x1': int(x),
-                                'y1': int(y),
-                                'x2': int(x + w),
-                                'y2': int(y + h)
-                            },
-                            'class_name': 'Răng khỏe mạnh',
-                            'confidence': 0.85,
-                            'area': float(area)
-                        }
-                        detections.append(detection)
-        
-        detections.sort(key=lambda d: d['area'], reverse=True)
+    # Clean up
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (scale_pixels(5, scale), scale_pixels(5, scale)))
+    white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_CLOSE, kernel)
+    white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_OPEN, kernel)
     
-    # Limit to top 5 detections
-    return detections[:5]
+    # White teeth components, only in teeth region
+    return [_detection(x, y, w, h, area, 'Răng khỏe mạnh', 0.85)
+            for x, y, w, h, area in _candidate_components(white_mask, min_area, max_area, teeth_bbox)]
+
+
+def _detection(x, y, w, h, area, class_name, confidence):
+    x, y, w, h = int(x), int(y), int(w), int(h)
+    return {
+        'bbox': {'x1': x, 'y1': y, 'x2': x + w, 'y2': y + h},
+        'class_name': class_name,
+        'confidence': float(confidence),
+        'area': float(area)
+    }
+
+
+def _candidate_components(mask, min_area, max_area, teeth_bbox):
+    """
+    Thành phần liên thông của mask thoả điều kiện diện tích, tâm nằm trong
+    vùng răng và tỉ lệ khung (răng thường có tỉ lệ khá vuông).
+
+    Returns:
+        np.ndarray (N, 5) int64: x, y, w, h, area của từng thành phần
+    """
+    try:
+        # Ảnh nhãn 16-bit rẻ hơn nhiều; chỉ dùng 32-bit khi có quá 65535 thành phần
+        _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            mask, 8, cv2.CV_16U, cv2.CCL_DEFAULT)
+    except cv2.error:
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:].astype(np.int64)  # Bỏ nhãn 0 (nền)
+    x, y, w, h, area = stats.T
+    teeth_x1, teeth_y1, teeth_x2, teeth_y2 = teeth_bbox
+    center_x = x + w / 2
+    center_y = y + h / 2
+    aspect_ratio = w / h
+    keep = ((min_area < area) & (area < max_area) &
+            (teeth_x1 < center_x) & (center_x < teeth_x2) &
+            (teeth_y1 < center_y) & (center_y < teeth_y2) &
+            (0.4 < aspect_ratio) & (aspect_ratio < 2.5))
+    return stats[keep]
+
+
+def _integral(img):
+    """Integral image; int32 khi chắc chắn không tràn số, ngược lại float64."""
+    fits_int32 = img.size * int(img.max(initial=0)) < 2 ** 31
+    return cv2.integral(img, sdepth=cv2.CV_32S if fits_int32 else cv2.CV_64F)
+
+
+def _rect_sums(integral, x, y, w, h):
+    """Tổng giá trị trong các hình chữ nhật (x, y, w, h) từ integral image (vector hoá)."""
+    return (integral[y + h, x + w] - integral[y, x + w] -
+            integral[y + h, x] + integral[y, x])
 
 
-def draw_detections(image_path, detections):
+def render_detections(image, detections):
     """
-    Vẽ bounding boxes lên ảnh
+    Vẽ bounding boxes lên bản sao của ảnh (không ghi file)
+
+    Args:
+        image: ImageContext (hoặc đường dẫn ảnh)
+        detections: List detection từ detect_damaged_teeth
+
+    Returns:
+        Ảnh BGR đã vẽ, hoặc None nếu không đọc được ảnh
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return image_path
-    
-    colors = {
-        'Sâu răng': (0, 0, 255),      # Red
-        'Cao răng': (0, 255, 255),     # Yellow
-        'Răng đổi màu': (255, 165, 0), # Orange
-        'Viêm lợi': (255, 0, 255),     # Magenta
-        'Răng khỏe mạnh': (0, 255, 0)  # Green
-    }
-    
-    for det in detections:
-        bbox = det['bbox']
-        x1, y1 = bbox['x1'], bbox['y1']
-        x2, y2 = bbox['x2'], bbox['y2']
-        
-        class_name = det['class_name']
-        confidence = det['confidence']
-        
-        color = colors.get(class_name, (255, 0, 0))
-        
-        # Draw rectangle
-        cv2.rectangle(img, (x1, y1), (x2, y2), color, 4)
-        
-        # Draw label
-        label = f"{class_name} {confidence:.0%}"
-        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-        cv2.rectangle(img, (x1, y1-30), (x1+w+10, y1), color, -1)
-        cv2.putText(img, label, (x1+5, y1-8),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-    
-    # Save
-    output_path = image_path.replace('.', '_cv_detected.')
-    cv2.imwrite(output_path, img)
-    return output_path
+    return annotation_renderer.render(image, detections, style='cv')
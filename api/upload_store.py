@@ -0,0 +1,248 @@
+"""
+Kho file upload theo nội dung (content-addressed) trên đĩa.
+
+- Tên file là sha256 của nội dung, chia vào thư mục con theo 4 ký tự đầu
+  (uploads/ab/cd/abcd....jpg) nên hai người upload cùng tên 'image.jpg' không
+  ghi đè lên nhau, và ảnh trùng nội dung chỉ lưu một lần
+- Ghi qua file tạm rồi os.replace: không bao giờ đọc được file ghi dở
+- Giới hạn tổng dung lượng; thread nền xoá file ít dùng nhất (LRU) khi vượt quota.
+  Danh sách file giữ trong bộ nhớ để request không phải quét thư mục
+
+Nhiều web worker dùng chung một thư mục: đĩa là nguồn dữ liệu chung. Thread nền quét
+lại thư mục mỗi evict_interval giây (thấy file của worker khác, bỏ file worker khác
+đã xoá), thứ tự LRU theo mtime (touch cập nhật mtime), và chỉ một process dọn quota
+tại một thời điểm (khoá file .evict.lock) sau khi quét lại.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khoá giữa các process
+    fcntl = None
+
+# Tên file do kho sinh ra: sha256 + đuôi file
+_NAME_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,5})?$')
+# Tên file cũ nằm thẳng trong thư mục gốc (trước khi có kho)
+_LEGACY_NAME_RE = re.compile(r'^[\w.-]+$')
+
+_TMP_DIR = '.tmp'
+_LOCK_FILE = '.evict.lock'
+
+
+class UploadStore:
+    """Kho file theo sha256 với quota và xoá LRU ở background."""
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, low_watermark=0.9, evict_interval=60.0):
+        """
+        Args:
+            root: Thư mục gốc
+            max_bytes: Tổng dung lượng tối đa (byte)
+            low_watermark: Khi dọn, xoá tới khi còn dưới max_bytes * low_watermark
+            evict_interval: Chu kỳ quét lại thư mục và kiểm tra quota của thread nền (giây)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.evict_interval = evict_interval
+        os.makedirs(os.path.join(root, _TMP_DIR), exist_ok=True)
+
+        # name -> kích thước; thứ tự = thứ tự dùng gần nhất (cuối = mới nhất)
+        self._index = OrderedDict()
+        self._bytes = 0
+        # File ghi trong lúc đang quét (chưa có trong kết quả quét)
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._scanned = threading.Event()
+        self._stats = {'puts': 0, 'dedup_hits': 0, 'evicted_files': 0, 'evicted_bytes': 0}
+        self._thread = threading.Thread(target=self._run, name='upload-evictor', daemon=True)
+        self._thread.start()
+
+    def path(self, name):
+        """Đường dẫn trên đĩa của file name (không kiểm tra tồn tại), None nếu tên không hợp lệ."""
+        if _NAME_RE.match(name):
+            return os.path.join(self.root, name[:2], name[2:4], name)
+        if _LEGACY_NAME_RE.match(name) and not name.startswith('.'):
+            return os.path.join(self.root, name)
+        return None
+
+    def put(self, data, ext=''):
+        """
+        Lưu nội dung, trả về tên file (sha256 + ext). Nội dung đã có thì không ghi lại.
+
+        Args:
+            data: Bytes
+            ext: Đuôi file, vd '.jpg'
+        """
+        ext = ext.lower()
+        if ext and not re.match(r'^\.[a-z0-9]{1,5}$', ext):
+            ext = ''
+        name = hashlib.sha256(data).hexdigest() + ext
+        path = self.path(name)
+
+        with self._lock:
+            exists = name in self._index
+            if exists:
+                self._index.move_to_end(name)
+                self._stats['dedup_hits'] += 1
+        if exists and self._utime(path):
+            return name
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, _TMP_DIR))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if name not in self._index:
+                self._bytes += len(data)
+            self._index[name] = len(data)
+            self._index.move_to_end(name)
+            self._recent[name] = len(data)
+            self._stats['puts'] += 1
+            over_quota = self._bytes > self.max_bytes
+        if over_quota:
+            self._wakeup.set()
+        return name
+
+    def touch(self, name):
+        """Đánh dấu file vừa được dùng; trả về đường dẫn hoặc None nếu không có."""
+        path = self.path(name)
+        if path is None:
+            return None
+        with self._lock:
+            known = name in self._index
+            if known:
+                self._index.move_to_end(name)
+            scanned = self._scanned.is_set()
+        if known:
+            # Cập nhật mtime để thứ tự LRU đúng với cả các worker khác
+            if self._utime(path):
+                return path
+            # Worker khác đã xoá file
+            with self._lock:
+                size = self._index.pop(name, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+        # File của worker khác ghi sau lần quét gần nhất, hoặc index chưa quét xong
+        if os.path.isfile(path):
+            if scanned:
+                self._utime(path)
+            return path
+        return None
+
+    def close(self):
+        """Dừng thread nền (file đã lưu vẫn giữ nguyên)."""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(files=len(self._index), bytes=self._bytes, max_bytes=self.max_bytes)
+        return stats
+
+    @staticmethod
+    def _utime(path):
+        """Đặt mtime = hiện tại; False nếu file không còn."""
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def _scan(self):
+        """Quét thư mục và dựng lại index (thứ tự theo mtime) từ những gì đang có trên đĩa."""
+        with self._lock:
+            self._recent = {}
+        found = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != _TMP_DIR]
+            for filename in filenames:
+                if self.path(filename) != os.path.join(dirpath, filename):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, filename, st.st_size))
+        found.sort()
+        with self._lock:
+            recent = self._recent
+            self._index = OrderedDict((name, size) for _, name, size in found if name not in recent)
+            self._index.update(recent)
+            self._bytes = sum(self._index.values())
+        self._scanned.set()
+        # Dọn file tạm còn sót lại sau lần chạy trước (bỏ qua file đang được ghi)
+        tmp_root = os.path.join(self.root, _TMP_DIR)
+        cutoff = time.time() - 3600
+        for filename in os.listdir(tmp_root):
+            tmp_path = os.path.join(tmp_root, filename)
+            try:
+                if os.stat(tmp_path).st_mtime < cutoff:
+                    os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Xoá file ít dùng nhất tới khi dưới ngưỡng low_watermark."""
+        with self._lock:
+            if self._bytes <= self.max_bytes:
+                return
+        with open(os.path.join(self.root, _LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Process khác đang dọn; lần quét sau sẽ thấy kết quả
+                    return
+            # Quét lại ngay trước khi xoá: worker khác có thể vừa dọn xong
+            self._scan()
+            self._evict_lru()
+
+    def _evict_lru(self):
+        target = self.max_bytes * self.low_watermark
+        with self._lock:
+            if self._bytes <= self.max_bytes:
+                return
+        while True:
+            with self._lock:
+                if self._bytes <= target or not self._index:
+                    return
+                name, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self._stats['evicted_files'] += 1
+                self._stats['evicted_bytes'] += size
+            try:
+                os.unlink(self.path(name))
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self._scan()
+                self._evict()
+            except OSError as e:
+                print(f"⚠️  Upload store scan error: {e}")
+                self._scanned.set()
+            self._wakeup.wait(self.evict_interval)
+            self._wakeup.clear()
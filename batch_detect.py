@@ -0,0 +1,94 @@
+"""
+Chạy detector offline trên cả thư mục ảnh hoặc manifest (xem api/offline_batch.py).
+
+Kết quả được ghi dần ra JSONL (mặc định) hoặc Parquet; chạy lại cùng lệnh sẽ tiếp
+tục từ ảnh chưa có kết quả. Tham số detector mặc định lấy theo cấu hình của API
+(DENTAL_DETECTOR_WORKING_SIDE, DENTAL_TILE_SIZE, DENTAL_COLOR_RANGES...).
+
+Cách dùng:
+    python batch_detect.py data/archive -o results.jsonl --detectors simple,cv --workers 8
+    python batch_detect.py manifest.csv -o results.parquet --detectors cv,yolo,cnn --workers 2
+    python batch_detect.py data/archive -o results.jsonl --retry-errors
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+import config
+import offline_batch
+import smoothing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Chạy detector offline trên nhiều ảnh')
+    parser.add_argument('source', help='Thư mục ảnh hoặc manifest (.txt, .csv, .jsonl)')
+    parser.add_argument('-o', '--output', required=True,
+                        help='File .jsonl hoặc thư mục .parquet (cũng là checkpoint để chạy tiếp)')
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), help='Mặc định: đoán theo đuôi output')
+    parser.add_argument('--detectors', default='simple,cv',
+                        help=f"Danh sách detector, cách nhau bởi dấu phẩy ({', '.join(offline_batch.DETECTORS)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Số process')
+    parser.add_argument('--chunk-size', type=int, default=8, help='Số ảnh mỗi lần giao cho một worker')
+    parser.add_argument('--max-batch', type=int, default=config.INFER_MAX_BATCH,
+                        help='Batch tối đa của YOLO/CNN')
+    parser.add_argument('--sensitivity', default='medium', choices=('low', 'medium', 'high'),
+                        help='Độ nhạy của detector cv')
+    parser.add_argument('--working-side', type=int, default=config.DETECTOR_WORKING_SIDE,
+                        help='Cạnh dài nhất của ảnh làm việc (0 = ảnh gốc)')
+    parser.add_argument('--tile-size', type=int, default=config.TILE_SIZE, help='Chia ô ảnh lớn (0 = tắt)')
+    parser.add_argument('--tile-overlap', type=int, default=config.TILE_OVERLAP)
+    parser.add_argument('--smoothing', default=config.SMOOTHING, choices=smoothing.BACKENDS,
+                        help='Backend làm mịn của detector simple')
+    parser.add_argument('--parquet-rows', type=int, default=1000, help='Số record mỗi file part Parquet')
+    parser.add_argument('--retry-errors', action='store_true', help='Chạy lại ảnh đã lỗi ở lần trước')
+    parser.add_argument('--limit', type=int, default=0, help='Chỉ xử lý N ảnh đầu tiên (0 = tất cả)')
+    parser.add_argument('--verbose', action='store_true', help='In log chi tiết của detector')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    detectors = tuple(name.strip() for name in args.detectors.split(',') if name.strip())
+    unknown = set(detectors) - set(offline_batch.DETECTORS)
+    if not detectors or unknown:
+        sys.exit(f"❌ Detector không hợp lệ: {', '.join(sorted(unknown)) or '(trống)'}")
+
+    items = offline_batch.list_images(args.source)
+    if args.limit:
+        items = items[:args.limit]
+    writer = offline_batch.open_writer(args.output, args.format, args.parquet_rows)
+    completed = writer.completed()
+    todo = [(key, path) for key, path in items
+            if key not in completed or (args.retry_errors and completed[key])]
+    print(f"📂 {len(items)} ảnh, {len(items) - len(todo)} đã có kết quả, còn {len(todo)}")
+    if not todo:
+        writer.close()
+        return
+
+    options = {
+        'detectors': detectors,
+        'detector': {
+            'max_side': args.working_side,
+            'color_ranges': config.COLOR_RANGES or None,
+            'tile_size': args.tile_size,
+            'tile_overlap': args.tile_overlap,
+            # Song song theo process, không chia thêm thread theo ô
+            'tile_workers': 1,
+        },
+        'sensitivity': args.sensitivity,
+        'smoothing': args.smoothing,
+        'workers': max(1, min(args.workers, len(todo))),
+        'chunk_size': args.chunk_size,
+        'max_batch': args.max_batch,
+        'verbose': args.verbose,
+    }
+    print(f"🚀 {', '.join(detectors)} trên {options['workers']} worker -> {args.output}")
+    summary = offline_batch.run(todo, writer, options)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
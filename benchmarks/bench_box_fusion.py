@@ -0,0 +1,222 @@
+"""
+Benchmark box_fusion (NumPy) so với cài đặt Python thuần trên list dict.
+
+Box ngẫu nhiên (mô phỏng detection của nhiều detector / nhiều ô chồng nhau) ở
+nhiều cỡ N. Với mỗi phép: thời gian (ms, nhỏ nhất sau --repeat lần) của bản
+Python và bản NumPy, và kiểm tra hai bản cho cùng kết quả:
+- iou_matrix: ma trận IoU N x N
+- nms: non-max suppression theo lớp
+- wbf: weighted box fusion của 3 detector
+- merge: gộp box chồng nhau của tiling (bản Python là tiling.merge_detections cũ,
+  gộp tham lam theo box lớn trước; bản NumPy gộp theo thành phần liên thông nên
+  với box dày đặc có thể gộp nhiều hơn, chỉ so số nhóm)
+- top_k: k box có confidence cao nhất (argpartition so với sorted)
+
+Cách dùng:
+    python benchmarks/bench_box_fusion.py
+    python benchmarks/bench_box_fusion.py --sizes 1000,5000 --repeat 3 --skip-python-above 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import box_fusion
+
+CLASSES = ('Sâu răng', 'Cao răng', 'Răng khỏe mạnh')
+DETECTORS = ('simple', 'cv', 'yolo')
+
+
+def make_detections(count, seed=0, box_side=120):
+    """
+    count detection ngẫu nhiên chia cho 3 detector. Mật độ giữ cố định (ảnh rộng dần
+    theo count); một phần box là bản sao bị xê dịch của box khác (nhiều detector/ô cùng thấy).
+    """
+    rng = random.Random(seed)
+    side = int(box_side * (count / 3) ** 0.5 * 2)
+    detections = []
+    for index in range(count):
+        if detections and rng.random() < 0.5:
+            base = rng.choice(detections)['bbox']
+            jitter = box_side // 8
+            x1, y1 = base['x1'] + rng.randint(-jitter, jitter), base['y1'] + rng.randint(-jitter, jitter)
+            w, h = base['x2'] - base['x1'], base['y2'] - base['y1']
+        else:
+            x1, y1 = rng.randint(0, side), rng.randint(0, side)
+            w, h = rng.randint(box_side // 2, box_side), rng.randint(box_side // 2, box_side)
+        detections.append({
+            'bbox': {'x1': x1, 'y1': y1, 'x2': x1 + w, 'y2': y1 + h},
+            'class_name': rng.choice(CLASSES),
+            'confidence': round(rng.uniform(0.1, 0.99), 3),
+            'area': float(w * h),
+            'detector': DETECTORS[index % len(DETECTORS)],
+        })
+    return detections
+
+
+# ---------------------------------------------------------------------------
+# Cài đặt Python thuần (tham chiếu)
+# ---------------------------------------------------------------------------
+
+def _area(b):
+    return max(0, b['x2'] - b['x1']) * max(0, b['y2'] - b['y1'])
+
+
+def _iou(a, b):
+    iw = min(a['x2'], b['x2']) - max(a['x1'], b['x1'])
+    ih = min(a['y2'], b['y2']) - max(a['y1'], b['y1'])
+    inter = max(0, iw) * max(0, ih)
+    union = _area(a) + _area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def py_iou_matrix(detections):
+    return [[_iou(a['bbox'], b['bbox']) for b in detections] for a in detections]
+
+
+def py_nms(detections, threshold=0.5):
+    order = sorted(range(len(detections)), key=lambda i: -detections[i]['confidence'])
+    keep = []
+    for i in order:
+        if all(detections[j]['class_name'] != detections[i]['class_name']
+               or _iou(detections[i]['bbox'], detections[j]['bbox']) <= threshold for j in keep):
+            keep.append(i)
+    return keep
+
+
+def py_wbf(detections, threshold=0.55):
+    """WBF theo từng box: so với toạ độ trung bình hiện tại của mọi cụm cùng lớp."""
+    order = sorted(range(len(detections)), key=lambda i: -detections[i]['confidence'])
+    clusters = []  # [class_name, sum w*box, sum w, members, sources]
+    for i in order:
+        det = detections[i]
+        box = det['bbox']
+        best, best_iou = None, threshold
+        for cluster in clusters:
+            if cluster[0] != det['class_name']:
+                continue
+            total = cluster[2]
+            fused = {k: cluster[1][k] / total for k in box} if total > 0 else cluster[5]
+            score = _iou(box, fused)
+            if score > best_iou:
+                best, best_iou = cluster, score
+        if best is None:
+            best = [det['class_name'], {k: 0.0 for k in box}, 0.0, 0, set(), dict(box)]
+            clusters.append(best)
+        for k in box:
+            best[1][k] += box[k] * det['confidence']
+        best[2] += det['confidence']
+        best[3] += 1
+        best[4].add(det['detector'])
+    n = len(DETECTORS)
+    return sorted((c[2] / c[3] * min(len(c[4]), n) / n for c in clusters), reverse=True)
+
+
+def py_merge(detections, min_overlap=0.6):
+    """tiling.merge_detections trước khi dùng box_fusion."""
+    def overlap(a, b):
+        iw = min(a['x2'], b['x2']) - max(a['x1'], b['x1'])
+        ih = min(a['y2'], b['y2']) - max(a['y1'], b['y1'])
+        if iw <= 0 or ih <= 0:
+            return 0.0
+        smaller = min(_area(a), _area(b))
+        return iw * ih / smaller if smaller > 0 else 0.0
+
+    merged = [dict(det) for det in detections]
+    changed = True
+    while changed:
+        changed = False
+        pending, merged = sorted(merged, key=lambda d: _area(d['bbox']), reverse=True), []
+        for det in pending:
+            for kept in merged:
+                if kept['class_name'] == det['class_name'] and overlap(kept['bbox'], det['bbox']) >= min_overlap:
+                    box, other = kept['bbox'], det['bbox']
+                    kept['bbox'] = {'x1': min(box['x1'], other['x1']), 'y1': min(box['y1'], other['y1']),
+                                    'x2': max(box['x2'], other['x2']), 'y2': max(box['y2'], other['y2'])}
+                    kept['confidence'] = max(kept['confidence'], det['confidence'])
+                    changed = True
+                    break
+            else:
+                merged.append(det)
+    return merged
+
+
+def py_top_k(detections, k):
+    return sorted(detections, key=lambda d: d['confidence'], reverse=True)[:k]
+
+
+# ---------------------------------------------------------------------------
+
+def np_wbf(detections, threshold=0.55):
+    sources = {name: [d for d in detections if d['detector'] == name] for name in DETECTORS}
+    return box_fusion.fuse_detections(sources, threshold)
+
+
+def best_ms(func, repeat):
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_case(name, count, py_func, np_func, check, args):
+    np_ms, np_result = best_ms(np_func, args.repeat)
+    if count > args.skip_python_above:
+        print(f"{name:<10} {count:>6} {'-':>10} {np_ms:>10.1f} {'-':>8}")
+        return True
+    py_ms, py_result = best_ms(py_func, 1 if count > 1000 else args.repeat)
+    ok = check(py_result, np_result)
+    print(f"{name:<10} {count:>6} {py_ms:>10.1f} {np_ms:>10.1f} {py_ms / np_ms if np_ms else 0:>7.1f}x"
+          f"{'' if ok else '  MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark box_fusion so với Python thuần')
+    parser.add_argument('--sizes', default='100,1000,3000,5000', help='Số box, cách nhau bởi dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo (lấy nhỏ nhất)')
+    parser.add_argument('--top-k', type=int, default=8)
+    parser.add_argument('--skip-python-above', type=int, default=3000,
+                        help='Không chạy bản Python khi N lớn hơn (chậm)')
+    args = parser.parse_args()
+
+    print(f"{'case':<10} {'N':>6} {'python ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    ok = True
+    for count in (int(v) for v in args.sizes.split(',') if v.strip()):
+        detections = make_detections(count)
+        boxes = box_fusion.BoxSet.from_detections(detections)
+        confidences = boxes.scores
+
+        ok &= run_case('iou_matrix', count, lambda: py_iou_matrix(detections),
+                       lambda: box_fusion.iou_matrix(boxes.xyxy, boxes.xyxy),
+                       lambda py, nps: np.allclose(np.array(py), nps), args)
+        ok &= run_case('nms', count, lambda: py_nms(detections),
+                       lambda: box_fusion.nms(boxes.xyxy, boxes.scores, boxes.labels),
+                       lambda py, nps: sorted(py) == sorted(nps.tolist()), args)
+        ok &= run_case('wbf', count, lambda: py_wbf(detections), lambda: np_wbf(detections),
+                       lambda py, nps: len(py) == len(nps) and np.allclose(
+                           py, [d['confidence'] for d in nps], atol=1e-3), args)
+        ok &= run_case('merge', count, lambda: py_merge(detections),
+                       lambda: box_fusion.merge_overlapping_detections(detections),
+                       lambda py, nps: len(nps) <= len(py), args)
+        ok &= run_case('top_k', count, lambda: py_top_k(detections, args.top_k),
+                       lambda: box_fusion.top_k(confidences, args.top_k),
+                       lambda py, nps: [d['confidence'] for d in py] == confidences[nps].tolist(), args)
+
+    print()
+    if not ok:
+        print("❌ Kết quả NumPy khác bản Python")
+        sys.exit(1)
+    print("✅ Kết quả NumPy khớp bản Python")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+So sánh các cách gọi CNN theo kích thước batch (cần TensorFlow).
+
+- keras_predict: serving_model().predict(batch) — tạo data adapter và callback mỗi lần gọi
+- eager_call: serving_model()(batch, training=False) — gọi thẳng, chạy eager
+- tf_function: DentalCNNModel.serving_function() — graph đã trace với input signature cố định
+  (đường dùng bởi predict/predict_batch)
+
+Mỗi cách được chạy thử trước khi đo; in ms/batch, ms/ảnh (nhỏ nhất sau --repeat lần),
+số lần tf.function bị trace lại và sai khác lớn nhất so với keras_predict. Không có file
+model thì dùng mạng chưa huấn luyện cùng kiến trúc (chỉ để đo thời gian).
+
+Cách dùng:
+    python benchmarks/bench_cnn_serving.py
+    python benchmarks/bench_cnn_serving.py --batch-sizes 1,8,32 --intra-op 4 --inter-op 1
+    python benchmarks/bench_cnn_serving.py --output cnn_serving.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def load_model(path):
+    from src.models.cnn_model import DentalCNNModel
+    model = DentalCNNModel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if path and os.path.exists(path):
+            model.load_model(path)
+        else:
+            model.create_model()
+    return model
+
+
+def best_ms(func, repeat):
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh Keras predict với tf.function cho CNN')
+    parser.add_argument('--model', help='File mô hình (mặc định: models/dental_model_final.h5 nếu có)')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)))
+    parser.add_argument('--repeat', type=int, default=5, help='Số lần đo mỗi case (lấy nhỏ nhất)')
+    parser.add_argument('--intra-op', type=int, default=0, help='Số thread intra-op (0 = mặc định TF)')
+    parser.add_argument('--inter-op', type=int, default=0, help='Số thread inter-op (0 = mặc định TF)')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    try:
+        import tensorflow as tf
+    except ImportError:
+        sys.exit('❌ Cần cài tensorflow')
+    from model_loaders import CNN_MODEL_PATH
+    from src.models.cnn_model import configure_threads
+    configure_threads(args.intra_op, args.inter_op)
+
+    model = load_model(args.model or CNN_MODEL_PATH)
+    keras_model = model.serving_model()
+    serve = model.serving_function()
+    height, width = model.input_shape[0], model.input_shape[1]
+    rng = np.random.default_rng(0)
+
+    methods = {
+        'keras_predict': lambda batch: keras_model.predict(batch, verbose=0),
+        'eager_call': lambda batch: keras_model(batch, training=False).numpy(),
+        'tf_function': lambda batch: serve(batch).numpy(),
+    }
+    results = {}
+    print(f"{'batch':>5} {'method':<14} {'ms/batch':>10} {'ms/image':>9} {'vs keras':>8} {'max diff':>9}")
+    for size in (int(v) for v in args.batch_sizes.split(',') if v.strip()):
+        batch = rng.integers(0, 256, (size, height, width, 3), dtype=np.uint8)
+        reference = None
+        for name, func in methods.items():
+            func(batch)  # chạy thử
+            elapsed, output = best_ms(lambda: func(batch), args.repeat)
+            if reference is None:
+                reference, reference_ms = output, elapsed
+            diff = float(np.abs(output - reference).max())
+            results[f'{name}@{size}'] = {'ms_per_batch': round(elapsed, 3),
+                                         'ms_per_image': round(elapsed / size, 3), 'max_diff': diff}
+            print(f"{size:>5} {name:<14} {elapsed:>10.2f} {elapsed / size:>9.2f} "
+                  f"{reference_ms / elapsed:>7.2f}x {diff:>9.1e}")
+
+    traces = serve.experimental_get_tracing_count()
+    print(f"\ntf.function trace: {traces} lần")
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'tensorflow': tf.__version__,
+                'cpu_count': os.cpu_count(),
+                'intra_op': tf.config.threading.get_intra_op_parallelism_threads(),
+                'inter_op': tf.config.threading.get_inter_op_parallelism_threads(),
+                'traces': traces,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Đã ghi {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Micro-benchmark các đường nóng trên ảnh tổng hợp (chạy offline, chỉ cần CPU).
+
+Đo thời gian (ms) cho từng độ phân giải:
+- detect_individual_teeth (mỗi backend làm mịn), detect_damaged_teeth
+- các hàm vẽ: annotation_renderer.draw_detections (kiểu yolo/cv/simple),
+  draw_problems và render_encoded (vẽ + encode JPEG)
+- DentalPredictor.predict (cần TensorFlow; không có file model thì dùng mạng
+  chưa huấn luyện cùng kiến trúc)
+- hậu xử lý YOLO (yolo_result_to_detections, không chạy model)
+
+Case thiếu thư viện được ghi là bỏ qua. Kết quả ghi ra JSON; với --baseline,
+so sánh với file kết quả cũ và trả mã lỗi 1 nếu có case chậm hơn ngưỡng. Mặc định
+so sánh thời gian nhỏ nhất (ít bị ảnh hưởng bởi tiến trình khác trên máy hơn median).
+
+Cách dùng:
+    python benchmarks/bench_detectors.py --output baseline.json
+    python benchmarks/bench_detectors.py --output current.json --baseline baseline.json
+    python benchmarks/bench_detectors.py --sizes 1280x960 --filter detect_ --repeat 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import annotation_renderer
+import color_lut
+import smoothing
+from image_context import ImageContext
+from simple_tooth_detector import detect_individual_teeth
+from synthetic import ALL_KINDS, make_mouth_image
+from tooth_detector import detect_damaged_teeth
+
+DEFAULT_SIZES = ('640x480', '1280x960', '4000x3000')
+
+# Vùng vấn đề giả cho draw_problems (toạ độ tương đối)
+PROBLEMS = [((0.3, 0.5), 'Sâu răng'), ((0.5, 0.45), 'Cao răng'), ((0.7, 0.55), 'Viêm lợi')]
+
+# Số box YOLO giả cho benchmark hậu xử lý
+YOLO_BOXES = 50
+
+
+class Skip(Exception):
+    """Case không chạy được trên máy này (thiếu thư viện)."""
+
+
+def measure(func, repeat, warmup):
+    """Chạy func warmup + repeat lần (ẩn log), trả về list thời gian (ms) của các lần đo."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup + repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                times.append(elapsed)
+    return times
+
+
+def _yolo_result(width, height, count, seed):
+    """
+    Kết quả YOLO giả với count box (ultralytics Boxes nếu có cài, ngược lại đối tượng
+    cùng giao diện box.cls / box.conf / box.xyxy[0].cpu().numpy()).
+    """
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width * 0.8, count)
+    y1 = rng.uniform(0, height * 0.8, count)
+    data = np.stack([x1, y1, x1 + rng.uniform(20, width * 0.2, count), y1 + rng.uniform(20, height * 0.2, count),
+                     rng.uniform(0.15, 0.99, count), rng.integers(0, 7, count)], axis=1).astype(np.float32)
+    try:
+        import torch
+        from ultralytics.engine.results import Boxes
+        return SimpleNamespace(boxes=Boxes(torch.from_numpy(data), (height, width)))
+    except ImportError:
+        pass
+
+    class _Tensor(np.ndarray):
+        def cpu(self):
+            return self
+
+        def numpy(self):
+            return np.asarray(self)
+
+    boxes = [SimpleNamespace(xyxy=row[None, :4].view(_Tensor), conf=row[4:5], cls=row[5:6]) for row in data]
+    return SimpleNamespace(boxes=boxes)
+
+
+def _load_predictor():
+    """DentalPredictor với model thật nếu có, ngược lại mạng chưa huấn luyện (chỉ để đo thời gian)."""
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        raise Skip('chưa cài tensorflow')
+    from model_loaders import CNN_MODEL_PATH
+    from src.ai.dental_predictor import DentalPredictor
+    with contextlib.redirect_stdout(io.StringIO()):
+        predictor = DentalPredictor(CNN_MODEL_PATH if os.path.exists(CNN_MODEL_PATH) else None)
+        if predictor.model.model is None:
+            predictor.model.create_model()
+    return predictor
+
+
+def build_cases(bgr):
+    """
+    Danh sách case cho một ảnh: (tên, hàm chạy một lần).
+    Mỗi lần chạy detector dùng ImageContext mới để không dùng lại view đã cache.
+    """
+    height, width = bgr.shape[:2]
+    with contextlib.redirect_stdout(io.StringIO()):
+        teeth = detect_individual_teeth(ImageContext(bgr))
+        lesions = detect_damaged_teeth(ImageContext(bgr))
+    problems = [((x * width, y * height), desc) for (x, y), desc in PROBLEMS]
+    yolo_result = _yolo_result(width, height, YOLO_BOXES, seed=0)
+
+    cases = [
+        ('detect_individual_teeth', lambda: detect_individual_teeth(ImageContext(bgr))),
+    ]
+    for backend in smoothing.BACKENDS[1:]:
+        cases.append((f'detect_individual_teeth[{backend}]',
+                      lambda backend=backend: detect_individual_teeth(ImageContext(bgr), smoothing=backend)))
+    cases += [
+        ('detect_damaged_teeth', lambda: detect_damaged_teeth(ImageContext(bgr), sensitivity='medium')),
+    ]
+    for style, detections in (('yolo', lesions), ('cv', lesions), ('simple', teeth)):
+        cases.append((f'draw_detections[{style}]',
+                      lambda style=style, detections=detections:
+                      annotation_renderer.draw_detections(bgr.copy(), detections, style)))
+    cases += [
+        ('draw_problems', lambda: annotation_renderer.draw_problems(bgr.copy(), problems)),
+        ('render_encoded[jpeg]',
+         lambda: annotation_renderer.render_encoded(ImageContext(bgr), teeth, style='simple')),
+        ('yolo_result_to_detections', lambda: _yolo_postprocess(yolo_result)),
+        ('DentalPredictor.predict', lambda: _predict(ImageContext(bgr))),
+    ]
+    return cases
+
+
+def _yolo_postprocess(result):
+    from model_loaders import yolo_result_to_detections
+    return yolo_result_to_detections(result)
+
+
+_predictor = None
+
+
+def _predict(ctx):
+    global _predictor
+    if _predictor is None:
+        _predictor = _load_predictor()
+    result = _predictor.predict(ctx)
+    if not result.get('success'):
+        raise RuntimeError(result.get('error'))
+    return result
+
+
+def run_suite(args):
+    results = {}
+    skipped = {}
+    # Dựng sẵn bảng tra màu để không tính vào lần chạy đầu
+    color_lut.lookup_table()
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        bgr = make_mouth_image(width, height, seed=args.seed, kinds=ALL_KINDS)
+        for name, func in build_cases(bgr):
+            key = f'{name}@{size}'
+            if args.filter and args.filter not in key:
+                continue
+            try:
+                times = measure(func, args.repeat, args.warmup)
+            except Skip as e:
+                skipped[key] = str(e)
+                print(f"{key:<48} bỏ qua: {e}")
+                continue
+            results[key] = {
+                'median_ms': round(statistics.median(times), 3),
+                'min_ms': round(min(times), 3),
+                'mean_ms': round(statistics.fmean(times), 3),
+                'stdev_ms': round(statistics.stdev(times), 3) if len(times) > 1 else 0.0,
+                'runs': len(times),
+            }
+            print(f"{key:<48} median {results[key]['median_ms']:>9.2f}ms  "
+                  f"min {results[key]['min_ms']:>9.2f}ms")
+    return results, skipped
+
+
+def compare(results, baseline, threshold, min_delta_ms, metric='min_ms'):
+    """
+    So sánh metric (min_ms hoặc median_ms) với baseline.
+
+    Returns:
+        list tên case chậm hơn baseline quá threshold (tỉ lệ) và quá min_delta_ms
+    """
+    regressions = []
+    print(f"\n{'case (' + metric + ')':<48} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for key, current in results.items():
+        old = baseline.get(key)
+        if old is None:
+            print(f"{key:<48} {'-':>10} {current[metric]:>9.2f}ms   (mới)")
+            continue
+        ratio = current[metric] / old[metric] if old[metric] else 1.0
+        slower = ratio > 1 + threshold and current[metric] - old[metric] > min_delta_ms
+        if slower:
+            regressions.append(key)
+        mark = '  REGRESSION' if slower else ('  faster' if ratio < 1 - threshold else '')
+        print(f"{key:<48} {old[metric]:>8.2f}ms {current[metric]:>8.2f}ms {ratio:>6.2f}x{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark detector, hàm vẽ, CNN và hậu xử lý YOLO')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help='Danh sách WxH, cách nhau bởi dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=7, help='Số lần đo mỗi case')
+    parser.add_argument('--warmup', type=int, default=1, help='Số lần chạy bỏ qua trước khi đo')
+    parser.add_argument('--seed', type=int, default=0, help='Seed của ảnh tổng hợp')
+    parser.add_argument('--filter', help='Chỉ chạy case có tên chứa chuỗi này')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--baseline', help='File JSON kết quả cũ để so sánh')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Tỉ lệ chậm hơn tối đa (0.15 = 15%%)')
+    parser.add_argument('--metric', choices=('min', 'median'), default='min', help='Giá trị dùng để so sánh')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='Bỏ qua chênh lệch tuyệt đối nhỏ hơn (nhiễu đo của case rất nhanh)')
+    args = parser.parse_args()
+    args.sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+
+    results, skipped = run_suite(args)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Đã ghi {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms, f'{args.metric}_ms')
+        if regressions:
+            print(f"\n❌ {len(regressions)} case chậm hơn baseline quá {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n✅ Không có case nào chậm hơn baseline quá {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
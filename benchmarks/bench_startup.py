@@ -0,0 +1,94 @@
+"""
+Benchmark thời gian khởi động API.
+
+Mỗi lần chạy dùng một process Python mới (cold start) và đo:
+- import_s: thời gian import api/app.py (server bắt đầu nhận request được)
+- first_request_s: thời gian tới khi /analyze đầu tiên trả về (chỉ detector CV)
+- models_ready_s: thời gian tới khi mọi model load xong (kèm warm-up)
+
+Cách dùng:
+    python benchmarks/bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Chạy trong process con để đo cold start thật sự
+CHILD_SCRIPT = r'''
+import io, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as appmod
+imported = time.perf_counter() - started
+
+import cv2
+import numpy as np
+img = np.full((600, 800, 3), 60, np.uint8)
+for i in range(6):
+    cv2.rectangle(img, (250 + i * 50, 260), (285 + i * 50, 330), (230, 230, 235), -1)
+ok, buf = cv2.imencode('.jpg', img)
+client = appmod.app.test_client()
+response = client.post('/analyze', data={'image': (io.BytesIO(buf.tobytes()), 'bench.jpg')},
+                       content_type='multipart/form-data')
+first_request = time.perf_counter() - started
+
+for name in ('gemini', 'cnn', 'yolo'):
+    appmod.model_registry.wait(name, timeout=float(sys.argv[2]))
+models_ready = time.perf_counter() - started
+
+print(json.dumps({
+    'import_s': imported,
+    'first_request_s': first_request,
+    'first_request_status': response.status_code,
+    'models_ready_s': models_ready,
+    'models': appmod.model_registry.status(),
+}))
+'''
+
+
+def run_once(timeout):
+    env = dict(os.environ, DENTAL_RESULT_CACHE='0')
+    proc = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, os.path.join(PROJECT_ROOT, 'api'), str(timeout)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=timeout + 120
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else 'process lỗi')
+    # Dòng cuối là JSON, các dòng trước là log của app
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark thời gian khởi động API')
+    parser.add_argument('--runs', type=int, default=3, help='Số lần cold start')
+    parser.add_argument('--timeout', type=float, default=300, help='Thời gian chờ model tối đa (giây)')
+    parser.add_argument('--json', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        result = run_once(args.timeout)
+        runs.append(result)
+        print(f"Run {i + 1}: import {result['import_s']:.2f}s, "
+              f"first request {result['first_request_s']:.2f}s (HTTP {result['first_request_status']}), "
+              f"models ready {result['models_ready_s']:.2f}s")
+
+    summary = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ('import_s', 'first_request_s', 'models_ready_s')
+    }
+    print("\nMedian: " + ", ".join(f"{key} {value:.2f}s" for key, value in summary.items()))
+    print("Models: " + ", ".join(f"{name}={info['status']}" for name, info in runs[-1]['models'].items()))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'runs': runs, 'median': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
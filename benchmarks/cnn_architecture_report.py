@@ -0,0 +1,156 @@
+"""
+So sánh các kiến trúc của DentalCNNModel (xem cnn_model.ARCHITECTURES): số tham số,
+kích thước file .h5, thời gian load, độ trễ CPU (ms/ảnh qua serving_function, nhỏ
+nhất sau --repeat lần) và accuracy.
+
+Có --data-dir thì mỗi kiến trúc được huấn luyện --epochs epoch bằng
+create_data_generators (cùng augmentation và chia training/validation như khi huấn
+luyện thật) và accuracy là accuracy trên tập validation; không có thì chỉ đo kích
+thước và độ trễ với trọng số ngẫu nhiên. Mô hình đã huấn luyện được lưu vào
+--save-dir nếu có (để export bằng export_cnn.py hoặc dùng làm models/dental_model_final.h5).
+
+Cách dùng:
+    python benchmarks/cnn_architecture_report.py
+    python benchmarks/cnn_architecture_report.py --data-dir data/train --epochs 20 --save-dir models/candidates
+    python benchmarks/cnn_architecture_report.py --architectures baseline,gap --threads 4 --output arch.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def best_ms(func, repeat):
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def largest_layer(keras_model):
+    """(tên, số tham số) của layer nhiều tham số nhất (gồm cả backbone lồng bên trong)."""
+    layer = max(keras_model.layers, key=lambda l: l.count_params())
+    return layer.name, layer.count_params()
+
+
+def train(model, args):
+    from src.models.cnn_model import create_data_generators
+    height, width = model.input_shape[0], model.input_shape[1]
+    with contextlib.redirect_stdout(io.StringIO()):
+        train_generator, val_generator = create_data_generators(args.data_dir, height, width, args.batch_size)
+    model.model.fit(train_generator, validation_data=val_generator, epochs=args.epochs, verbose=2)
+    metrics = model.model.evaluate(val_generator, verbose=0, return_dict=True)
+    return float(metrics['accuracy'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh kích thước / độ trễ / accuracy các kiến trúc CNN')
+    parser.add_argument('--architectures', default='', help='Danh sách kiến trúc (mặc định: tất cả)')
+    parser.add_argument('--data-dir', help='Thư mục dữ liệu huấn luyện (mỗi lớp một thư mục con)')
+    parser.add_argument('--epochs', type=int, default=10, help='Số epoch huấn luyện mỗi kiến trúc')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch huấn luyện')
+    parser.add_argument('--pretrained', action='store_true', help='Backbone mobilenet dùng trọng số ImageNet')
+    parser.add_argument('--save-dir', help='Lưu mô hình đã huấn luyện (<kiến trúc>.h5)')
+    parser.add_argument('--batch-sizes', default='1,16', help='Kích thước batch đo độ trễ')
+    parser.add_argument('--repeat', type=int, default=5, help='Số lần đo (lấy nhỏ nhất)')
+    parser.add_argument('--threads', type=int, default=0, help='Số thread intra-op (0 = mặc định TF)')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+    batch_sizes = [int(v) for v in args.batch_sizes.split(',') if v.strip()]
+
+    try:
+        import tensorflow as tf
+    except ImportError:
+        sys.exit('❌ Cần cài tensorflow')
+    from src.models.cnn_model import ARCHITECTURES, DentalCNNModel, configure_threads
+    configure_threads(args.threads)
+    architectures = [a.strip() for a in args.architectures.split(',') if a.strip()] or list(ARCHITECTURES)
+    unknown = set(architectures) - set(ARCHITECTURES)
+    if unknown:
+        sys.exit(f"❌ Kiến trúc không hỗ trợ: {', '.join(sorted(unknown))}")
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+
+    rng = np.random.default_rng(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for architecture in architectures:
+            print(f"🏗️  {architecture}")
+            model = DentalCNNModel(architecture=architecture, pretrained=args.pretrained)
+            model.create_model()
+            accuracy = train(model, args) if args.data_dir else None
+
+            path = os.path.join(args.save_dir or tmp, f'{architecture}.h5')
+            model.model.save(path)
+            loaded = DentalCNNModel()
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                loaded.load_model(path)
+            load_ms = (time.perf_counter() - started) * 1000
+            serve = loaded.serving_function()
+            loaded.warmup(batch_sizes)
+            height, width = loaded.input_shape[0], loaded.input_shape[1]
+            latency = {}
+            for size in batch_sizes:
+                batch = rng.integers(0, 256, (size, height, width, 3), dtype=np.uint8)
+                elapsed, _ = best_ms(lambda: serve(batch).numpy(), args.repeat)
+                latency[str(size)] = round(elapsed / size, 3)
+
+            layer_name, layer_params = largest_layer(model.model)
+            results[architecture] = {
+                'params': int(model.model.count_params()),
+                'largest_layer': layer_name,
+                'largest_layer_params': int(layer_params),
+                'size_mb': round(os.path.getsize(path) / 1e6, 2),
+                'load_ms': round(load_ms, 1),
+                'latency_ms_per_image': latency,
+                'val_accuracy': accuracy,
+            }
+
+    latency_header = ' '.join(f"{f'ms@{size}':>8}" for size in batch_sizes)
+    header = f"{'architecture':<12} {'params':>8} {'largest layer':>22} {'MB':>7} {'load ms':>8} {latency_header} {'val acc':>7}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for architecture, result in results.items():
+        accuracy = result['val_accuracy']
+        print(f"{architecture:<12} {result['params'] / 1e6:>7.2f}M "
+              f"{result['largest_layer'][:12]:>12} {result['largest_layer_params'] / 1e6:>8.2f}M "
+              f"{result['size_mb']:>7.1f} {result['load_ms']:>8.0f} "
+              + ' '.join(f"{result['latency_ms_per_image'][str(size)]:>8.2f}" for size in batch_sizes)
+              + f" {'-' if accuracy is None else f'{accuracy:.1%}':>7}")
+
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'tensorflow': tf.__version__,
+                'cpu_count': os.cpu_count(),
+                'intra_op': tf.config.threading.get_intra_op_parallelism_threads(),
+                'data_dir': args.data_dir,
+                'epochs': args.epochs if args.data_dir else 0,
+                'pretrained': args.pretrained,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Đã ghi {args.output}")
+
+
+if __name__ == '__main__':
+    main()
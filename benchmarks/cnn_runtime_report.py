@@ -0,0 +1,191 @@
+"""
+So sánh CNN Keras với các bản export (TFLite / ONNX, xem export_cnn.py) trên tập
+ảnh held-out trước khi đổi DENTAL_CNN_RUNTIME.
+
+Tập đánh giá mặc định là phần validation của --data-dir, chia giống
+create_data_generators (ảnh không dùng để huấn luyện hay calibration int8); dùng
+--subset all khi --data-dir là một thư mục test riêng. Nhãn là chỉ số thư mục lớp
+theo thứ tự alphabet như flow_from_directory.
+
+Với mỗi runtime: kích thước file, accuracy theo nhãn, tỉ lệ cùng lớp dự đoán với
+Keras, sai khác xác suất so với Keras, độ trễ (ms/ảnh, nhỏ nhất sau --repeat lần) ở
+từng kích thước batch. Runtime đạt khi accuracy không giảm quá --max-accuracy-drop và
+cùng lớp với Keras ít nhất --min-agreement ảnh; trả mã lỗi 1 nếu có runtime không đạt.
+
+Cách dùng:
+    python benchmarks/cnn_runtime_report.py --data-dir data/train
+    python benchmarks/cnn_runtime_report.py --data-dir data/test --subset all --threads 4
+    python benchmarks/cnn_runtime_report.py --data-dir data/train --models exported/m_int8.tflite --output report.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from model_loaders import CNN_MODEL_PATH
+from src.models.cnn_runtime import VARIANTS, exported_path, load_runtime, runtime_available, runtime_of
+
+
+def best_ms(func, repeat):
+    best, result = None, None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def probabilities(model, images, batch_size=32):
+    return np.stack([pred for pred, _ in model.predict_batch(images, batch_size=batch_size)])
+
+
+def evaluate(name, path, images, labels, reference, args):
+    runtime = runtime_of(path)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = load_runtime(runtime, path, args.threads)
+    load_ms = (time.perf_counter() - started) * 1000
+    model.warmup(args.batch_sizes)
+
+    probs = probabilities(model, images)
+    predicted = probs.argmax(axis=1)
+    result = {
+        'path': path,
+        'runtime': runtime,
+        'size_mb': round(os.path.getsize(path) / 1e6, 2),
+        'load_ms': round(load_ms, 1),
+        'accuracy': float((predicted == labels).mean()),
+        'latency_ms_per_image': {},
+    }
+    if reference is not None:
+        diff = np.abs(probs - reference)
+        result.update({
+            'agreement': float((predicted == reference.argmax(axis=1)).mean()),
+            'max_prob_diff': float(diff.max()),
+            'mean_prob_diff': float(diff.mean()),
+        })
+    for size in args.batch_sizes:
+        batch = images[:size]
+        if len(batch) < size:
+            batch = np.resize(images, (size,) + images.shape[1:])
+        elapsed, _ = best_ms(lambda: model.predict_batch(batch, batch_size=size), args.repeat)
+        result['latency_ms_per_image'][str(size)] = round(elapsed / size, 3)
+    return result, probs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh độ chính xác / độ trễ của CNN Keras và bản export')
+    parser.add_argument('--data-dir', required=True, help='Thư mục ảnh có nhãn (mỗi lớp một thư mục con)')
+    parser.add_argument('--subset', default='validation', choices=('validation', 'all'),
+                        help='validation: phần held-out của tập huấn luyện; all: cả thư mục')
+    parser.add_argument('--validation-split', type=float, default=0.2, help='Tỉ lệ validation lúc huấn luyện')
+    parser.add_argument('--model', default=CNN_MODEL_PATH, help='Mô hình Keras tham chiếu')
+    parser.add_argument('--models', default='',
+                        help='File .tflite / .onnx cần so, cách nhau bởi dấu phẩy '
+                             '(mặc định: các variant export_cnn.py đã tạo cạnh --model)')
+    parser.add_argument('--limit', type=int, default=0, help='Chỉ dùng N ảnh đầu tiên (0 = tất cả)')
+    parser.add_argument('--batch-sizes', default='1,16', help='Kích thước batch đo độ trễ')
+    parser.add_argument('--repeat', type=int, default=5, help='Số lần đo độ trễ (lấy nhỏ nhất)')
+    parser.add_argument('--threads', type=int, default=0, help='Số thread suy luận (0 = mặc định runtime)')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01, help='Accuracy giảm tối đa so với Keras')
+    parser.add_argument('--min-agreement', type=float, default=0.98, help='Tỉ lệ cùng lớp với Keras tối thiểu')
+    parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+    args.batch_sizes = [int(v) for v in args.batch_sizes.split(',') if v.strip()]
+
+    if not os.path.exists(args.model):
+        sys.exit(f"❌ Không tìm thấy mô hình Keras: {args.model}")
+    if args.models:
+        candidates = [(os.path.basename(p.strip()), p.strip()) for p in args.models.split(',') if p.strip()]
+    else:
+        candidates = [(variant, exported_path(args.model, variant)) for variant in VARIANTS]
+        candidates = [(name, path) for name, path in candidates if os.path.exists(path)]
+    for name, path in list(candidates):
+        if not os.path.exists(path) or not runtime_available(runtime_of(path)):
+            print(f"⚠️  Bỏ qua {name}: không có file hoặc chưa cài runtime {runtime_of(path)}")
+            candidates.remove((name, path))
+    if not candidates:
+        sys.exit("❌ Không có bản export nào để so (chạy export_cnn.py trước)")
+
+    from src.models.cnn_export import list_dataset, load_images
+    from src.models.cnn_model import configure_threads
+    configure_threads(args.threads)
+
+    files, class_names = list_dataset(args.data_dir, None if args.subset == 'all' else 'validation',
+                                      args.validation_split)
+    if args.limit:
+        files = files[:args.limit]
+    images, kept = load_images([path for path, _ in files])
+    labels = np.array([files[i][1] for i in kept])
+    if not len(images):
+        sys.exit(f"❌ Không có ảnh đánh giá trong {args.data_dir}")
+    print(f"📷 {len(images)} ảnh ({args.subset}), lớp: {', '.join(class_names)}")
+
+    results = {}
+    reference = None
+    for name, path in [('keras', args.model)] + candidates:
+        results[name], probs = evaluate(name, path, images, labels, reference, args)
+        if reference is None:
+            reference = probs
+
+    keras_accuracy = results['keras']['accuracy']
+    latency_header = ' '.join(f"{f'ms@{size}':>8}" for size in args.batch_sizes)
+    header = f"{'runtime':<16} {'MB':>6} {'acc':>6} {'agree':>6} {'max diff':>9} {latency_header} {'speedup':>7}"
+    print(header)
+    print('-' * len(header))
+    failed = []
+    reference_ms = results['keras']['latency_ms_per_image'][str(args.batch_sizes[0])]
+    for name, result in results.items():
+        latency = result['latency_ms_per_image']
+        ok = name == 'keras' or (keras_accuracy - result['accuracy'] <= args.max_accuracy_drop
+                                 and result['agreement'] >= args.min_agreement)
+        result['ok'] = ok
+        if not ok:
+            failed.append(name)
+        first_ms = latency[str(args.batch_sizes[0])]
+        print(f"{name:<16} {result['size_mb']:>6.1f} {result['accuracy']:>6.1%} "
+              f"{result.get('agreement', 1.0):>6.1%} {result.get('max_prob_diff', 0.0):>9.1e} "
+              + ' '.join(f"{latency[str(size)]:>8.2f}" for size in args.batch_sizes)
+              + f" {reference_ms / first_ms if first_ms else 0:>6.1f}x{'' if ok else '  FAIL'}")
+
+    if args.output:
+        import tensorflow as tf
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'tensorflow': tf.__version__,
+                'cpu_count': os.cpu_count(),
+                'threads': args.threads,
+                'data_dir': args.data_dir,
+                'subset': args.subset,
+                'images': int(len(images)),
+                'class_names': class_names,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Đã ghi {args.output}")
+
+    print()
+    if failed:
+        print(f"❌ {', '.join(failed)}: accuracy giảm quá {args.max_accuracy_drop:.1%} hoặc "
+              f"cùng lớp với Keras dưới {args.min_agreement:.0%}")
+        sys.exit(1)
+    print("✅ Mọi bản export nằm trong ngưỡng; chọn bằng DENTAL_CNN_RUNTIME / DENTAL_CNN_MODEL_PATH")
+
+
+if __name__ == '__main__':
+    main()
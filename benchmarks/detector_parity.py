@@ -0,0 +1,158 @@
+"""
+Kiểm tra parity: detector CV chạy trên ảnh làm việc (DENTAL_DETECTOR_WORKING_SIDE)
+hoặc theo từng ô (DENTAL_TILE_SIZE) so với chạy trên cả ảnh độ phân giải gốc.
+
+Với mỗi ảnh và mỗi detector (simple, cv), ghép cặp detection theo IoU và báo:
+số detection, số cặp khớp, IoU trung bình, tỉ lệ cùng lớp, thời gian chạy và
+đỉnh RSS tăng thêm (MB).
+Trả mã lỗi 1 nếu vượt ngưỡng sai lệch.
+
+Lưu ý: ở ảnh rất lớn (~48MP) bản chạy trên ảnh gốc đôi khi bỏ sót răng vì các
+kernel cố định (bilateral 9px, adaptive block 11px) được chỉnh cho ảnh ~1MP,
+nên ngưỡng chênh lệch số detection mặc định là 2.
+
+Cách dùng:
+    python benchmarks/detector_parity.py                       # ảnh tổng hợp 1.2-48MP
+    python benchmarks/detector_parity.py --images path/to/photos --working-side 1280
+    python benchmarks/detector_parity.py --working-side 0 --tile-size 2048 --tile-workers 4
+"""
+import argparse
+import contextlib
+import ctypes
+import glob
+import io
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from image_context import ImageContext
+from memory_stats import peak_rss, reset_peak
+from simple_tooth_detector import detect_individual_teeth
+from synthetic import make_mouth_image
+from tooth_detector import detect_damaged_teeth
+
+DETECTORS = {
+    'simple': lambda ctx, options: detect_individual_teeth(ctx, **options),
+    'cv': lambda ctx, options: detect_damaged_teeth(ctx, sensitivity='medium', **options),
+}
+
+# Kích thước ảnh tổng hợp mặc định (~1.2MP tới ~48MP)
+DEFAULT_SIZES = ((1280, 960), (4000, 3000), (8000, 6000))
+
+
+def iou(a, b):
+    x1, y1 = max(a['x1'], b['x1']), max(a['y1'], b['y1'])
+    x2, y2 = min(a['x2'], b['x2']), min(a['y2'], b['y2'])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = ((a['x2'] - a['x1']) * (a['y2'] - a['y1']) +
+             (b['x2'] - b['x1']) * (b['y2'] - b['y1']) - inter)
+    return inter / union if union > 0 else 0.0
+
+
+def match(reference, candidate, min_iou=0.3):
+    """Ghép cặp tham lam theo IoU giảm dần; trả về list (ref, cand, iou)."""
+    pairs = sorted(((iou(r['bbox'], c['bbox']), i, j)
+                    for i, r in enumerate(reference) for j, c in enumerate(candidate)), reverse=True)
+    used_r, used_c, matches = set(), set(), []
+    for score, i, j in pairs:
+        if score < min_iou or i in used_r or j in used_c:
+            continue
+        used_r.add(i)
+        used_c.add(j)
+        matches.append((reference[i], candidate[j], score))
+    return matches
+
+
+def release_memory():
+    """Trả bộ nhớ đã free về hệ điều hành (glibc) để đỉnh RSS của lần chạy sau không bị thấp đi."""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def run(detector, bgr, options):
+    """
+    Chạy detector trên ImageContext mới (không dùng lại view đã cache).
+
+    Returns:
+        tuple (detections, giây, đỉnh RSS tăng thêm tính bằng byte)
+    """
+    ctx = ImageContext(bgr)
+    release_memory()
+    reset_peak()
+    baseline = peak_rss()
+    started = time.perf_counter()
+    # Detector in log chi tiết; ẩn đi cho bảng kết quả dễ đọc
+    with contextlib.redirect_stdout(io.StringIO()):
+        detections = DETECTORS[detector](ctx, options)
+    return detections, time.perf_counter() - started, peak_rss() - baseline
+
+
+def load_images(args):
+    if args.images:
+        paths = sorted(p for ext in ('jpg', 'jpeg', 'png', 'webp')
+                       for p in glob.glob(os.path.join(args.images, f'*.{ext}')))
+        for path in paths:
+            img = cv2.imread(path)
+            if img is not None:
+                yield os.path.basename(path), img
+        return
+    for width, height in DEFAULT_SIZES:
+        for seed in range(args.seeds):
+            yield f'synthetic {width}x{height} #{seed}', make_mouth_image(width, height, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parity detector CV: ảnh làm việc vs ảnh gốc')
+    parser.add_argument('--images', help='Thư mục ảnh thật (mặc định: ảnh tổng hợp)')
+    parser.add_argument('--working-side', type=int, default=1280, help='Cạnh dài nhất của ảnh làm việc')
+    parser.add_argument('--tile-size', type=int, default=0, help='Chia ô (0 = không chia)')
+    parser.add_argument('--tile-overlap', type=int, default=768, help='Độ chồng giữa các ô (px)')
+    parser.add_argument('--tile-workers', type=int, default=1, help='Số ô xử lý song song')
+    parser.add_argument('--seeds', type=int, default=3, help='Số ảnh tổng hợp mỗi kích thước')
+    parser.add_argument('--min-iou', type=float, default=0.75, help='IoU trung bình tối thiểu')
+    parser.add_argument('--max-count-diff', type=int, default=2, help='Chênh lệch số detection tối đa')
+    args = parser.parse_args()
+
+    reference = {'max_side': 0}
+    candidate = {'max_side': args.working_side, 'tile_size': args.tile_size,
+                 'tile_overlap': args.tile_overlap, 'tile_workers': args.tile_workers}
+    # Nạp sẵn bảng tra màu để không tính vào lần chạy đầu
+    run('cv', make_mouth_image(64, 48), reference)
+
+    failures = 0
+    header = f"{'image':<28} {'det':<6} {'full':>4} {'work':>4} {'match':>5} {'IoU':>5} {'class':>5} " \
+             f"{'full ms':>8} {'work ms':>8} {'speedup':>7} {'full MB':>8} {'work MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, bgr in load_images(args):
+        for detector in DETECTORS:
+            full, full_s, full_mem = run(detector, bgr, reference)
+            work, work_s, work_mem = run(detector, bgr, candidate)
+            matches = match(full, work)
+            mean_iou = sum(m[2] for m in matches) / len(matches) if matches else (1.0 if not full and not work else 0.0)
+            same_class = (sum(a['class_name'] == b['class_name'] for a, b, _ in matches) / len(matches)
+                          if matches else 1.0)
+            ok = abs(len(full) - len(work)) <= args.max_count_diff and mean_iou >= args.min_iou
+            failures += not ok
+            print(f"{name:<28} {detector:<6} {len(full):>4} {len(work):>4} {len(matches):>5} "
+                  f"{mean_iou:>5.2f} {same_class:>5.2f} {full_s * 1000:>8.1f} {work_s * 1000:>8.1f} "
+                  f"{full_s / work_s if work_s else 0:>6.1f}x {full_mem / 2 ** 20:>8.1f} {work_mem / 2 ** 20:>8.1f}"
+                  f"{'' if ok else '  FAIL'}")
+
+    print()
+    if failures:
+        print(f"❌ {failures} trường hợp vượt ngưỡng (IoU >= {args.min_iou}, "
+              f"chênh lệch số detection <= {args.max_count_diff})")
+        sys.exit(1)
+    print("✅ Detections khớp với lần chạy trên cả ảnh gốc trong ngưỡng cho phép")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Kiểm tra parity các backend làm mịn của simple tooth detector (xem api/smoothing.py).
+
+Với mỗi ảnh, chạy detect_individual_teeth với backend bilateral (tham chiếu) và
+từng backend khác cùng tham số detector, ghép cặp bbox răng theo IoU và báo: số
+răng, số cặp khớp, IoU trung bình, thời gian riêng bước làm mịn trên ảnh làm việc
+và thời gian cả detector. Một ảnh lệch khi IoU trung bình hoặc chênh lệch số răng
+vượt ngưỡng; trả mã lỗi 1 nếu tỉ lệ ảnh lệch của một backend vượt --max-fail-rate
+(detector dựa trên threshold nên răng nằm sát ngưỡng có thể được/mất dù ảnh làm mịn
+gần như giống hệt).
+
+Ở cạnh ảnh làm việc mặc định (1280) kernel bilateral của ảnh lớn hơn đã nhỏ và mọi
+backend dùng bilateral, nên ảnh tổng hợp mặc định chỉ ở ~1MP; dùng --working-side 0
+để so trên ảnh độ phân giải gốc.
+
+Cách dùng:
+    python benchmarks/smoothing_parity.py                        # ảnh tổng hợp, nhiều mức nhiễu
+    python benchmarks/smoothing_parity.py --images path/to/photos --working-side 1280
+    python benchmarks/smoothing_parity.py --backends guided --working-side 0 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import smoothing
+from detector_parity import load_images as _load_images, match
+from image_context import ImageContext
+from simple_tooth_detector import detect_individual_teeth
+from synthetic import ALL_KINDS, make_mouth_image
+
+REFERENCE = 'bilateral'
+
+# Ảnh tổng hợp mặc định: (kích thước, độ lệch chuẩn nhiễu)
+DEFAULT_CASES = tuple((size, noise) for size in ((1280, 960), (1024, 768)) for noise in (4.0, 8.0, 12.0))
+
+
+def best_ms(func, repeat):
+    """Thời gian nhỏ nhất (ms) sau repeat lần chạy, cùng kết quả của lần chạy cuối."""
+    best = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def load_images(args):
+    if args.images:
+        yield from _load_images(args)
+        return
+    for (width, height), noise in DEFAULT_CASES:
+        for seed in range(args.seeds):
+            yield (f'synthetic {width}x{height} σ{noise:g} #{seed}',
+                   make_mouth_image(width, height, seed=seed, noise=noise, kinds=ALL_KINDS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parity các backend làm mịn của simple tooth detector')
+    parser.add_argument('--images', help='Thư mục ảnh thật (mặc định: ảnh tổng hợp)')
+    parser.add_argument('--backends', default=','.join(b for b in smoothing.BACKENDS if b != REFERENCE),
+                        help='Backend cần so với bilateral, cách nhau bởi dấu phẩy')
+    parser.add_argument('--working-side', type=int, default=1280, help='Cạnh dài nhất của ảnh làm việc (0 = gốc)')
+    parser.add_argument('--seeds', type=int, default=3, help='Số ảnh tổng hợp mỗi trường hợp')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo thời gian (lấy nhỏ nhất)')
+    parser.add_argument('--min-iou', type=float, default=0.8, help='IoU trung bình tối thiểu')
+    parser.add_argument('--max-count-diff', type=int, default=1, help='Chênh lệch số răng tối đa')
+    parser.add_argument('--max-fail-rate', type=float, default=0.2, help='Tỉ lệ ảnh lệch tối đa của mỗi backend')
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    unknown = set(backends) - set(smoothing.BACKENDS)
+    if unknown:
+        sys.exit(f"❌ Backend không hỗ trợ: {', '.join(sorted(unknown))}")
+
+    options = {'max_side': args.working_side}
+    totals = {backend: [0.0, 0.0] for backend in [REFERENCE] + backends}
+    failures = {backend: 0 for backend in backends}
+    images = 0
+    header = f"{'image':<32} {'backend':<17} {'ref':>3} {'cand':>4} {'match':>5} {'IoU':>5} " \
+             f"{'smooth ms':>9} {'detect ms':>9} {'speedup':>7}"
+    print(header)
+    print('-' * len(header))
+    for name, bgr in load_images(args):
+        images += 1
+        ctx = ImageContext(bgr)
+        work = ctx.working(args.working_side)
+        gray = work.gray
+        scale = work.scale / ctx.scale
+
+        def measure(backend):
+            smooth_ms, _ = best_ms(lambda: smoothing.smooth(gray, scale, backend), args.repeat)
+            # Detector in log chi tiết; ẩn đi cho bảng kết quả dễ đọc
+            with contextlib.redirect_stdout(io.StringIO()):
+                detect_ms, detections = best_ms(
+                    lambda: detect_individual_teeth(ImageContext(bgr), smoothing=backend, **options), args.repeat)
+            totals[backend][0] += smooth_ms
+            totals[backend][1] += detect_ms
+            return detections, smooth_ms, detect_ms
+
+        reference, ref_smooth, ref_detect = measure(REFERENCE)
+        print(f"{name:<32} {REFERENCE:<17} {len(reference):>3} {'':>4} {'':>5} {'':>5} "
+              f"{ref_smooth:>9.1f} {ref_detect:>9.1f}")
+        for backend in backends:
+            detections, smooth_ms, detect_ms = measure(backend)
+            matches = match(reference, detections)
+            mean_iou = (sum(m[2] for m in matches) / len(matches) if matches
+                        else (1.0 if not reference and not detections else 0.0))
+            ok = abs(len(reference) - len(detections)) <= args.max_count_diff and mean_iou >= args.min_iou
+            failures[backend] += not ok
+            print(f"{'':<32} {backend:<17} {'':>3} {len(detections):>4} {len(matches):>5} {mean_iou:>5.2f} "
+                  f"{smooth_ms:>9.1f} {detect_ms:>9.1f} {ref_smooth / smooth_ms if smooth_ms else 0:>6.1f}x"
+                  f"{'' if ok else '  FAIL'}")
+
+    print()
+    print(f"{'backend':<17} {'smooth ms':>10} {'detect ms':>10} {'lệch':>6}  (tổng {images} ảnh)")
+    for backend, (smooth_ms, detect_ms) in totals.items():
+        fails = f"{failures[backend]}/{images}" if backend in failures else ''
+        print(f"{backend:<17} {smooth_ms:>10.1f} {detect_ms:>10.1f} {fails:>6}")
+    print()
+    failed = [b for b, count in failures.items() if images and count / images > args.max_fail_rate]
+    if failed:
+        print(f"❌ {', '.join(failed)}: quá {args.max_fail_rate:.0%} ảnh vượt ngưỡng (IoU >= {args.min_iou}, "
+              f"chênh lệch số răng <= {args.max_count_diff})")
+        sys.exit(1)
+    print("✅ Răng phát hiện khớp với backend bilateral trong ngưỡng cho phép")
+
+
+if __name__ == '__main__':
+    main()
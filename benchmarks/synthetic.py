@@ -0,0 +1,67 @@
+"""
+Sinh ảnh răng tổng hợp cho benchmark và kiểm tra parity.
+
+Ảnh gồm nền lợi đỏ, một hàng răng trắng ở giữa ảnh, vết ố nâu, cao răng vàng
+dọc chân răng (tuỳ chọn) và lỗ sâu tối màu, thêm nhiễu như ảnh chụp điện thoại.
+Hình học tỉ lệ theo kích thước ảnh nên cùng seed cho cùng một "khuôn miệng" ở
+mọi độ phân giải.
+"""
+import cv2
+import numpy as np
+
+# Loại tổn thương được rải ngẫu nhiên lên từng răng (lặp lại để tăng tỉ lệ)
+DEFAULT_KINDS = ('healthy', 'healthy', 'stain', 'cavity')
+ALL_KINDS = ('healthy', 'healthy', 'stain', 'calculus', 'cavity')
+
+
+def make_mouth_image(width=1600, height=1200, seed=0, num_teeth=6, noise=4.0, kinds=DEFAULT_KINDS):
+    """
+    Tạo ảnh BGR uint8 (height, width, 3).
+
+    Args:
+        width, height: Kích thước ảnh
+        seed: Seed cho vị trí răng, vết ố và nhiễu
+        num_teeth: Số răng trong hàng
+        noise: Độ lệch chuẩn nhiễu Gaussian (0 = không nhiễu)
+        kinds: Loại răng để chọn ngẫu nhiên (ALL_KINDS có thêm cao răng vàng)
+    """
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (70, 70, 160)  # Lợi (BGR)
+
+    tooth_w = 0.07 * width
+    tooth_h = 0.14 * height
+    gap = 0.012 * width
+    row_w = num_teeth * tooth_w + (num_teeth - 1) * gap
+    x0 = (width - row_w) / 2
+    y0 = 0.5 * height - tooth_h / 2
+
+    for i in range(num_teeth):
+        jitter_x = rng.uniform(-0.1, 0.1) * gap
+        jitter_y = rng.uniform(-0.08, 0.08) * tooth_h
+        x1 = int(x0 + i * (tooth_w + gap) + jitter_x)
+        y1 = int(y0 + jitter_y)
+        x2 = int(x1 + tooth_w * rng.uniform(0.9, 1.05))
+        y2 = int(y1 + tooth_h * rng.uniform(0.9, 1.05))
+        shade = int(rng.integers(215, 240))
+        cv2.rectangle(img, (x1, y1), (x2, y2), (shade - 8, shade - 4, shade), -1)
+
+        kind = rng.choice(list(kinds))
+        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        if kind == 'calculus':
+            # Dải vàng ở chân răng (sát lợi)
+            band = max(1, int((y2 - y1) * 0.22))
+            cv2.rectangle(img, (x1, y2 - band), (x2, y2), (50, 160, 190), -1)
+        elif kind == 'stain':
+            axes = (max(1, int((x2 - x1) * 0.35)), max(1, int((y2 - y1) * 0.3)))
+            cv2.ellipse(img, (cx, cy), axes, 0, 0, 360, (40, 120, 170), -1)
+        elif kind == 'cavity':
+            radius = max(1, int((x2 - x1) * 0.22))
+            cv2.circle(img, (cx, cy), radius, (20, 25, 30), -1)
+
+    if noise:
+        noisy = img.astype(np.float32) + rng.normal(0, noise, img.shape).astype(np.float32)
+        img = np.clip(noisy, 0, 255).astype(np.uint8)
+    # Làm mềm biên như ảnh chụp thật
+    blur = max(1, int(round(min(width, height) / 800))) * 2 + 1
+    return cv2.GaussianBlur(img, (blur, blur), 0)
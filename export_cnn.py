@@ -0,0 +1,109 @@
+"""
+Export CNN (models/dental_model_final.h5) sang TFLite / ONNX lượng tử hoá cho node
+suy luận chỉ có CPU (xem src/models/cnn_export.py).
+
+Variant (file đặt cạnh mô hình Keras, hoặc trong --output-dir):
+- tflite_dynamic: trọng số int8, tính toán float    -> dental_model_final_dynamic.tflite
+- tflite_int8: trọng số + activation int8, input uint8 -> dental_model_final_int8.tflite
+  (calibration bằng ảnh của tập training trong --data-dir)
+- onnx: float32 (cần tf2onnx)                        -> dental_model_final.onnx
+- onnx_int8: trọng số int8 (cần tf2onnx + onnxruntime) -> dental_model_final_int8.onnx
+  (không export mặc định: Conv lượng tử hoá động của onnxruntime thường chậm hơn bản float trên CPU)
+
+Sau khi export, so độ chính xác / độ trễ với mô hình Keras trên tập validation bằng
+benchmarks/cnn_runtime_report.py rồi chọn runtime qua DENTAL_CNN_RUNTIME và
+DENTAL_CNN_MODEL_PATH.
+
+Cách dùng:
+    python export_cnn.py --data-dir data/train
+    python export_cnn.py --variants tflite_dynamic,onnx,onnx_int8
+    python export_cnn.py --model models/dental_model_final.h5 --data-dir data/train --calibration-size 500
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'api'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from model_loaders import CNN_MODEL_PATH
+from src.models.cnn_runtime import VARIANTS, exported_path
+
+DEFAULT_VARIANTS = ('tflite_dynamic', 'tflite_int8', 'onnx')
+
+# Thư viện cần cho từng variant (ngoài TensorFlow)
+REQUIREMENTS = {
+    'onnx': ('tf2onnx',),
+    'onnx_int8': ('tf2onnx', 'onnxruntime'),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export CNN sang TFLite / ONNX lượng tử hoá')
+    parser.add_argument('--model', default=CNN_MODEL_PATH, help='File mô hình Keras (.h5 / .keras)')
+    parser.add_argument('--variants', default=','.join(DEFAULT_VARIANTS),
+                        help=f"Danh sách variant, cách nhau bởi dấu phẩy ({', '.join(VARIANTS)})")
+    parser.add_argument('--data-dir', help='Thư mục dữ liệu huấn luyện (mỗi lớp một thư mục con), '
+                                           'lấy ảnh calibration cho tflite_int8')
+    parser.add_argument('--calibration-size', type=int, default=200, help='Số ảnh calibration')
+    parser.add_argument('--validation-split', type=float, default=0.2,
+                        help='Tỉ lệ validation lúc huấn luyện (ảnh calibration chỉ lấy từ phần training)')
+    parser.add_argument('--output-dir', help='Thư mục ghi file export (mặc định: cạnh file mô hình)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    variants = [name.strip() for name in args.variants.split(',') if name.strip()]
+    unknown = set(variants) - set(VARIANTS)
+    if not variants or unknown:
+        sys.exit(f"❌ Variant không hợp lệ: {', '.join(sorted(unknown)) or '(trống)'}")
+    if not os.path.exists(args.model):
+        sys.exit(f"❌ Không tìm thấy mô hình: {args.model}")
+    if 'tflite_int8' in variants and not args.data_dir:
+        sys.exit("❌ tflite_int8 cần --data-dir để lấy ảnh calibration")
+    missing = {name: [m for m in REQUIREMENTS.get(name, ()) if importlib.util.find_spec(m) is None]
+               for name in variants}
+    for name, modules in missing.items():
+        if modules:
+            print(f"⚠️  Bỏ qua {name}: chưa cài {', '.join(modules)}")
+    variants = [name for name in variants if not missing[name]]
+
+    from src.models.cnn_export import calibration_images, export_variant
+    from src.models.cnn_model import DentalCNNModel
+    model = DentalCNNModel()
+    model.load_model(args.model)
+
+    calibration = None
+    if 'tflite_int8' in variants:
+        calibration = calibration_images(args.data_dir, args.calibration_size, model.input_shape,
+                                         args.validation_split)
+        if len(calibration) == 0:
+            sys.exit(f"❌ Không có ảnh training trong {args.data_dir}")
+        print(f"📷 {len(calibration)} ảnh calibration từ {args.data_dir}")
+
+    base = args.model
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        base = os.path.join(args.output_dir, os.path.basename(args.model))
+    source_mb = os.path.getsize(args.model) / 1e6
+    print(f"📦 {args.model}: {source_mb:.1f} MB")
+    for name in variants:
+        path = exported_path(base, name)
+        started = time.perf_counter()
+        # Converter in rất nhiều log; chỉ giữ kết quả
+        with contextlib.redirect_stdout(io.StringIO()):
+            export_variant(model, name, path, calibration)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"✅ {name:<15} {path}: {size_mb:.1f} MB ({size_mb / source_mb:.0%}), "
+              f"{time.perf_counter() - started:.1f}s")
+    print("👉 So sánh với mô hình Keras: python benchmarks/cnn_runtime_report.py --data-dir <thư mục dữ liệu>")
+
+
+if __name__ == '__main__':
+    main()
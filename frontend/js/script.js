@@ -189,9 +189,6 @@ function performAnalysis(file) {
 
     const formData = new FormData();
     formData.append('image', file);
-    
-    // Store filename for later use
-    const uploadedFileName = file.name;
 
     // API endpoint from your Flask server
     const apiUrl = 'http://127.0.0.1:5001/analyze';
@@ -242,8 +239,8 @@ function performAnalysis(file) {
                     return;
                 }
                 
-                // Load original image and draw boxes on canvas
-                const originalImageUrl = `http://127.0.0.1:5001/uploads/${uploadedFileName}?t=${Date.now()}`;
+                // Draw boxes over the local preview (server does not need to keep the upload)
+                const originalImageUrl = previewImage.src;
                 
                 console.log('📸 Loading image:', originalImageUrl);
                 console.log('📊 Detections:', detectionsData.detections);
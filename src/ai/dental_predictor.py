@@ -4,23 +4,24 @@ Module dự đoán sử dụng mô hình CNN đã huấn luyện
 
 import os
 import numpy as np
-import tensorflow as tf
 from PIL import Image
-from src.models.cnn_model import DentalCNNModel
+from src.models.cnn_runtime import load_runtime, runtime_of, to_uint8_rgb
 
 class DentalPredictor:
     """
     Lớp để dự đoán tình trạng răng miệng sử dụng mô hình CNN
     """
 
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, runtime=None, num_threads=0):
         """
         Khởi tạo predictor
 
         Args:
-            model_path: Đường dẫn đến file mô hình đã huấn luyện
+            model_path: Đường dẫn đến file mô hình đã huấn luyện (.h5, hoặc .tflite /
+                .onnx do export_cnn.py tạo)
+            runtime: 'keras', 'tflite' hoặc 'onnx' (mặc định: đoán theo đuôi file)
+            num_threads: Số thread của runtime tflite / onnx (0 = mặc định)
         """
-        self.model = DentalCNNModel()
         self.class_names = ['normal', 'cavity', 'gingivitis', 'plaque']
         self.class_descriptions = {
             'normal': 'Răng miệng bình thường, không có vấn đề đáng chú ý',
@@ -29,77 +30,83 @@ class DentalPredictor:
             'plaque': 'Phát hiện cao răng hoặc mảng bám'
         }
 
+        self.runtime = runtime or (runtime_of(model_path) if model_path else 'keras')
         if model_path and os.path.exists(model_path):
-            self.model.load_model(model_path)
-        else:
+            self.model = load_runtime(self.runtime, model_path, num_threads)
+        elif self.runtime == 'keras':
+            from src.models.cnn_model import DentalCNNModel
+            self.model = DentalCNNModel()
             print("Cảnh báo: Không tìm thấy mô hình đã huấn luyện")
+        else:
+            raise FileNotFoundError(f"Không tìm thấy mô hình {self.runtime}: {model_path}")
 
     def preprocess_image(self, image):
         """
-        Tiền xử lý ảnh trước khi dự đoán
+        Tiền xử lý ảnh trước khi dự đoán: chỉ đưa về mảng RGB uint8.
+        Resize về kích thước input và chia 255 nằm trong mô hình
+        (DentalCNNModel.serving_model / runtime đã export), không làm lại ở đây.
 
         Args:
-            image: PIL Image hoặc numpy array
+            image: PIL Image, numpy array, đường dẫn đến file ảnh hoặc ImageContext
+                (dùng view cnn_input đã resize sẵn, không decode lại)
 
         Returns:
-            numpy array: Ảnh đã được xử lý
+            numpy array: Ảnh RGB uint8 có batch dimension (1, H, W, 3)
         """
-        if isinstance(image, np.ndarray):
-            img_array = image
-        else:
-            img_array = np.array(image)
-
-        # Resize về kích thước mong muốn
-        img_array = tf.image.resize(img_array, (224, 224))
-
-        # Normalize
-        img_array = img_array / 255.0
-
-        # Thêm batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
-
-        return img_array
+        if isinstance(image, str):
+            image = Image.open(image)
+        elif hasattr(image, 'cnn_input'):
+            image = image.cnn_input
+        return np.expand_dims(to_uint8_rgb(image), axis=0)
 
     def predict(self, image):
         """
         Dự đoán tình trạng răng miệng từ ảnh
 
         Args:
-            image: PIL Image hoặc đường dẫn đến file ảnh
+            image: PIL Image, đường dẫn đến file ảnh hoặc ImageContext
+                (dùng view cnn_input đã resize sẵn, không decode lại)
 
         Returns:
             dict: Kết quả dự đoán
         """
-        try:
-            # Load ảnh nếu là đường dẫn
-            if isinstance(image, str):
-                image = Image.open(image)
-
-            # Preprocess
-            processed_image = self.preprocess_image(image)
-
-            # Dự đoán
-            predictions, predicted_class = self.model.predict(processed_image[0])
-
-            # Tạo kết quả
-            result = {
-                'success': True,
-                'predicted_class': predicted_class,
-                'description': self.class_descriptions.get(predicted_class, 'Không xác định'),
-                'confidence': float(np.max(predictions)),
-                'all_probabilities': {
-                    class_name: float(prob)
-                    for class_name, prob in zip(self.class_names, predictions)
-                }
-            }
+        return self.predict_batch([image])[0]
 
-            return result
+    def predict_batch(self, images):
+        """
+        Dự đoán nhiều ảnh bằng một lần forward của mô hình
+
+        Args:
+            images: List ảnh (PIL Image, đường dẫn, numpy array hoặc ImageContext)
+
+        Returns:
+            list: Kết quả dự đoán cho từng ảnh, cùng định dạng với predict()
+        """
+        try:
+            batch = [self.preprocess_image(image)[0] for image in images]
+            outputs = self.model.predict_batch(batch)
+            return [self._build_result(predictions, predicted_class)
+                    for predictions, predicted_class in outputs]
 
         except Exception as e:
-            return {
+            error = {
                 'success': False,
                 'error': f'Lỗi khi dự đoán: {str(e)}'
             }
+            return [dict(error) for _ in images]
+
+    def _build_result(self, predictions, predicted_class):
+        """Tạo dict kết quả từ xác suất các lớp."""
+        return {
+            'success': True,
+            'predicted_class': predicted_class,
+            'description': self.class_descriptions.get(predicted_class, 'Không xác định'),
+            'confidence': float(np.max(predictions)),
+            'all_probabilities': {
+                class_name: float(prob)
+                for class_name, prob in zip(self.class_names, predictions)
+            }
+        }
 
     def get_regions_of_interest(self, image, prediction_result):
         """
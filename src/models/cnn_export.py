@@ -0,0 +1,169 @@
+"""
+Export DentalCNNModel sang TFLite / ONNX để chạy trên node chỉ có CPU
+(CLI: export_cnn.py, runtime: cnn_runtime.py).
+
+Mọi bản export nhận batch ảnh RGB kích thước input_shape, giá trị 0-255 (float32;
+bản tflite_int8 nhận thẳng uint8), chia 255 nằm trong graph như serving_model().
+"""
+import os
+import random
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from src.models.cnn_runtime import VARIANTS
+
+# Đuôi ảnh được ImageDataGenerator.flow_from_directory đọc
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+ONNX_OPSET = 13
+
+
+def list_dataset(data_dir, subset=None, validation_split=0.2):
+    """
+    Ảnh của thư mục dữ liệu huấn luyện (mỗi lớp một thư mục con), chia giống
+    create_data_generators: subset 'validation' là validation_split ảnh đầu tiên (theo
+    tên file) của mỗi lớp, 'training' là phần còn lại, nên tập validation không có ảnh
+    nào dùng để huấn luyện hay calibration.
+
+    Args:
+        data_dir: Thư mục dữ liệu (cấu trúc của flow_from_directory)
+        subset: 'training', 'validation' hoặc None (tất cả)
+        validation_split: Tỉ lệ validation lúc huấn luyện
+
+    Returns:
+        tuple: ([(path, class_index), ...], class_names); class_index theo thứ tự
+            alphabet của thư mục lớp như flow_from_directory
+    """
+    class_names = sorted(name for name in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, name)))
+    files = []
+    for index, name in enumerate(class_names):
+        class_files = [os.path.join(root, fname)
+                       for root, _, fnames in sorted(os.walk(os.path.join(data_dir, name)), key=lambda w: w[0])
+                       for fname in sorted(fnames) if fname.lower().endswith(IMAGE_EXTENSIONS)]
+        split = int(validation_split * len(class_files))
+        if subset == 'validation':
+            class_files = class_files[:split]
+        elif subset == 'training':
+            class_files = class_files[split:]
+        files.extend((path, index) for path in class_files)
+    return files, class_names
+
+
+def load_images(paths, input_shape=(224, 224, 3)):
+    """
+    Đọc và resize ảnh về input_shape (bilinear như ImageContext.cnn_input).
+
+    Returns:
+        tuple: (mảng uint8 (N, H, W, 3), chỉ số các ảnh đọc được trong paths)
+    """
+    height, width = input_shape[0], input_shape[1]
+    images, kept = [], []
+    for index, path in enumerate(paths):
+        bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+        if bgr is None:
+            print(f"⚠️  Bỏ qua ảnh không đọc được: {path}")
+            continue
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        images.append(cv2.resize(rgb, (width, height), interpolation=cv2.INTER_LINEAR))
+        kept.append(index)
+    if not images:
+        return np.zeros((0, height, width, 3), dtype=np.uint8), kept
+    return np.stack(images), kept
+
+
+def calibration_images(data_dir, count=200, input_shape=(224, 224, 3), validation_split=0.2, seed=0):
+    """count ảnh ngẫu nhiên (cố định theo seed) của tập training, dùng để calibration int8."""
+    files, _ = list_dataset(data_dir, 'training', validation_split)
+    paths = [path for path, _ in files]
+    random.Random(seed).shuffle(paths)
+    images, _ = load_images(paths[:count], input_shape)
+    return images
+
+
+def export_function(model):
+    """
+    tf.function nhận batch float32 (N, H, W, 3) giá trị 0-255 và trả về xác suất.
+    Không chứa bước resize (ảnh đã ở input_shape) để graph export chỉ gồm op có sẵn
+    trong TFLite builtin và ONNX.
+    """
+    if model.model is None:
+        raise ValueError("Mô hình chưa được tạo hoặc load")
+    keras_model = model.model
+    uint8_input = bool(keras_model.inputs) and keras_model.inputs[0].dtype == tf.uint8
+    height, width = model.input_shape[0], model.input_shape[1]
+
+    @tf.function(input_signature=[tf.TensorSpec([None, height, width, 3], tf.float32, name='image')])
+    def serve(images):
+        if uint8_input:
+            return keras_model(tf.cast(images, tf.uint8), training=False)
+        return keras_model(images / 255.0, training=False)
+
+    return serve
+
+
+def export_tflite(model, path, quantization='dynamic', calibration=None):
+    """
+    Export TFLite.
+
+    Args:
+        model: DentalCNNModel đã load
+        path: File .tflite
+        quantization: 'dynamic' (trọng số int8, tính toán float) hoặc 'int8' (trọng số
+            và activation int8, input uint8, output xác suất float32)
+        calibration: Mảng ảnh uint8 (N, H, W, 3) để đo dải activation (bắt buộc với int8)
+    """
+    serve = export_function(model)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serve.get_concrete_function()], serve)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if calibration is None or len(calibration) == 0:
+            raise ValueError("Export int8 cần ảnh calibration từ tập huấn luyện")
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Input 0-255 được lượng tử hoá với scale 1, nên nhận thẳng ảnh uint8
+        converter.inference_input_type = tf.uint8
+    elif quantization != 'dynamic':
+        raise ValueError(f"Kiểu lượng tử hoá không hỗ trợ: {quantization}")
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+
+def export_onnx(model, path, quantize=False):
+    """
+    Export ONNX float32 bằng tf2onnx; quantize=True lượng tử hoá thêm trọng số sang
+    int8 (onnxruntime quantize_dynamic).
+    """
+    import tf2onnx
+    serve = export_function(model)
+    if not quantize:
+        tf2onnx.convert.from_function(serve, input_signature=serve.input_signature, opset=ONNX_OPSET,
+                                      output_path=path)
+        return path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    float_path = path + '.float.onnx'
+    try:
+        tf2onnx.convert.from_function(serve, input_signature=serve.input_signature, opset=ONNX_OPSET,
+                                      output_path=float_path)
+        quantize_dynamic(float_path, path, weight_type=QuantType.QInt8)
+    finally:
+        if os.path.exists(float_path):
+            os.remove(float_path)
+    return path
+
+
+def export_variant(model, variant, path, calibration=None):
+    """Export một variant trong cnn_runtime.VARIANTS ra path."""
+    if variant not in VARIANTS:
+        raise ValueError(f"Variant không hỗ trợ: {variant} (chọn {', '.join(VARIANTS)})")
+    if variant.startswith('tflite'):
+        return export_tflite(model, path, 'int8' if variant == 'tflite_int8' else 'dynamic', calibration)
+    return export_onnx(model, path, quantize=variant == 'onnx_int8')
@@ -5,76 +5,126 @@ File này chứa kiến trúc mô hình và các hàm liên quan
 
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from tensorflow.keras.layers import (Conv2D, SeparableConv2D, MaxPooling2D, Flatten, GlobalAveragePooling2D,
+                                     Dense, Dropout, BatchNormalization, Rescaling)
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import numpy as np
 import os
 
+from src.models.cnn_runtime import CLASS_NAMES, to_uint8_rgb
+
+# Kiến trúc có thể chọn khi tạo mô hình mới (so sánh: benchmarks/cnn_architecture_report.py)
+# - baseline: 4 block Conv2D, Flatten (14x14x256) -> Dense(512): ~27M tham số, ~25.7M ở Dense đầu tiên
+# - gap: cùng các block Conv2D, GlobalAveragePooling2D thay Flatten: ~1.2M tham số
+# - separable: như gap nhưng các Conv2D (trừ lớp đầu) là SeparableConv2D: ~0.2M tham số
+# - mobilenet: backbone MobileNetV2 + GlobalAveragePooling2D: ~2.3M tham số
+ARCHITECTURES = ('baseline', 'gap', 'separable', 'mobilenet')
+
+def configure_threads(intra_op=0, inter_op=0):
+    """
+    Đặt số thread của TensorFlow (0 = mặc định của TF). Phải gọi trước op TensorFlow đầu tiên.
+
+    Returns:
+        bool: False nếu runtime TensorFlow đã khởi tạo (giữ nguyên cấu hình cũ)
+    """
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        print(f"Cảnh báo: Không đổi được số thread TensorFlow: {e}")
+        return False
+    return True
+
+
 class DentalCNNModel:
     """
     Lớp mô hình CNN cho phân tích răng miệng
     """
 
-    def __init__(self, input_shape=(224, 224, 3), num_classes=4):
+    def __init__(self, input_shape=(224, 224, 3), num_classes=4, architecture='baseline', pretrained=False):
         """
         Khởi tạo mô hình
 
         Args:
             input_shape: Kích thước đầu vào (height, width, channels)
             num_classes: Số lớp phân loại
+            architecture: Một trong ARCHITECTURES (chỉ dùng khi create_model; load_model
+                dùng kiến trúc đã lưu trong file)
+            pretrained: Khởi tạo backbone mobilenet bằng trọng số ImageNet (cần tải về)
         """
+        if architecture not in ARCHITECTURES:
+            raise ValueError(f"Kiến trúc không hỗ trợ: {architecture} (chọn {', '.join(ARCHITECTURES)})")
         self.input_shape = input_shape
         self.num_classes = num_classes
+        self.architecture = architecture
+        self.pretrained = pretrained
         self.model = None
+        self._serving = None
+        self._serve = None
 
-    def create_model(self):
-        """
-        Tạo kiến trúc mô hình CNN
-        """
-        model = Sequential([
-            # Block 1
-            Conv2D(32, (3, 3), activation='relu', input_shape=self.input_shape, padding='same'),
-            BatchNormalization(),
-            Conv2D(32, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            MaxPooling2D(2, 2),
-            Dropout(0.25),
+    def _conv_blocks(self, separable=False):
+        """4 block (2 conv + BatchNorm, MaxPooling, Dropout) với 32, 64, 128, 256 filter."""
+        layers = []
+        for block, filters in enumerate((32, 64, 128, 256)):
+            for index in range(2):
+                first = block == 0 and index == 0
+                # Lớp đầu chỉ có 3 kênh vào: tách depthwise không tiết kiệm gì
+                conv = SeparableConv2D if separable and not first else Conv2D
+                extra = {'input_shape': self.input_shape} if first else {}
+                layers += [conv(filters, (3, 3), activation='relu', padding='same', **extra),
+                           BatchNormalization()]
+            layers += [MaxPooling2D(2, 2), Dropout(0.25)]
+        return layers
 
-            # Block 2
-            Conv2D(64, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            Conv2D(64, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            MaxPooling2D(2, 2),
-            Dropout(0.25),
-
-            # Block 3
-            Conv2D(128, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            Conv2D(128, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            MaxPooling2D(2, 2),
-            Dropout(0.25),
-
-            # Block 4
-            Conv2D(256, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            Conv2D(256, (3, 3), activation='relu', padding='same'),
-            BatchNormalization(),
-            MaxPooling2D(2, 2),
-            Dropout(0.25),
-
-            # Fully Connected layers
-            Flatten(),
-            Dense(512, activation='relu'),
-            BatchNormalization(),
-            Dropout(0.5),
+    def _gap_head(self):
+        return [
+            GlobalAveragePooling2D(),
             Dense(256, activation='relu'),
             BatchNormalization(),
             Dropout(0.3),
             Dense(self.num_classes, activation='softmax')
-        ])
+        ]
+
+    def _mobilenet_layers(self):
+        backbone = tf.keras.applications.MobileNetV2(
+            input_shape=self.input_shape, include_top=False,
+            weights='imagenet' if self.pretrained else None)
+        return [
+            # MobileNetV2 cần input [-1, 1]; dữ liệu huấn luyện đã chia 255 về [0, 1]
+            Rescaling(2.0, offset=-1.0, input_shape=self.input_shape),
+            backbone,
+            GlobalAveragePooling2D(),
+            Dropout(0.2),
+            Dense(self.num_classes, activation='softmax')
+        ]
+
+    def create_model(self):
+        """
+        Tạo kiến trúc mô hình CNN theo self.architecture (xem ARCHITECTURES)
+
+        Mô hình huấn luyện nhận ảnh float đã chia 255 (create_data_generators rescale);
+        khi dự đoán dùng serving_model() nhận thẳng ảnh uint8.
+        """
+        if self.architecture == 'baseline':
+            layers = self._conv_blocks() + [
+                # Fully Connected layers
+                Flatten(),
+                Dense(512, activation='relu'),
+                BatchNormalization(),
+                Dropout(0.5),
+                Dense(256, activation='relu'),
+                BatchNormalization(),
+                Dropout(0.3),
+                Dense(self.num_classes, activation='softmax')
+            ]
+        elif self.architecture == 'mobilenet':
+            layers = self._mobilenet_layers()
+        else:
+            layers = self._conv_blocks(separable=self.architecture == 'separable') + self._gap_head()
+        model = Sequential(layers)
 
         # Compile model
         model.compile(
@@ -84,6 +134,8 @@ class DentalCNNModel:
         )
 
         self.model = model
+        self._serving = None
+        self._serve = None
         return model
 
     def load_weights(self, weights_path):
@@ -106,8 +158,62 @@ class DentalCNNModel:
             model_path: Đường dẫn đến file mô hình
         """
         self.model = tf.keras.models.load_model(model_path)
+        self._serving = None
+        self._serve = None
+        shape = tuple(self.model.input_shape[1:])
+        if None not in shape:
+            self.input_shape = shape
         print(f"Đã load mô hình từ: {model_path}")
 
+    def serving_model(self):
+        """
+        Mô hình dự đoán nhận ảnh RGB uint8 kích thước bất kỳ: Resizing về input_shape và
+        Rescaling 1/255 nằm trong graph, nên ảnh chỉ được resize và normalize đúng một lần
+        và dữ liệu đưa vào model chỉ bằng 1/4 so với float32.
+        Mô hình đã có sẵn bước này (input uint8) được dùng nguyên.
+        """
+        if self.model is None:
+            raise ValueError("Mô hình chưa được tạo hoặc load")
+        if self._serving is None:
+            if self.model.inputs and self.model.inputs[0].dtype == tf.uint8:
+                self._serving = self.model
+            else:
+                height, width = self.input_shape[0], self.input_shape[1]
+                inputs = tf.keras.Input(shape=(None, None, 3), dtype=tf.uint8, name='image')
+                x = tf.keras.layers.Resizing(height, width, name='resize')(inputs)
+                x = tf.keras.layers.Rescaling(1.0 / 255, name='rescale')(x)
+                outputs = self.model(x, training=False)
+                self._serving = tf.keras.Model(inputs, outputs, name='dental_cnn_serving')
+        return self._serving
+
+    def serving_function(self):
+        """
+        tf.function gọi thẳng serving_model(x, training=False) với input signature cố định
+        (batch uint8 kích thước bất kỳ): chỉ trace một lần, không tạo data adapter / progress
+        bar như Keras model.predict ở mỗi lần gọi.
+        """
+        if self._serve is None:
+            model = self.serving_model()
+
+            @tf.function(input_signature=[tf.TensorSpec([None, None, None, 3], tf.uint8, name='images')])
+            def serve(images):
+                return model(images, training=False)
+
+            self._serve = serve
+        return self._serve
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Trace serving_function và khởi tạo kernel trước request đầu tiên.
+
+        Args:
+            batch_sizes: Các kích thước batch chạy thử (vd 1 và batch tối đa của micro-batching)
+        """
+        serve = self.serving_function()
+        height, width = self.input_shape[0], self.input_shape[1]
+        for size in batch_sizes:
+            serve(tf.zeros((size, height, width, 3), dtype=tf.uint8))
+
     def predict(self, image):
         """
         Dự đoán trên một ảnh
@@ -118,29 +224,39 @@ class DentalCNNModel:
         Returns:
             tuple: (predictions, class_names)
         """
-        if self.model is None:
-            raise ValueError("Mô hình chưa được tạo hoặc load")
+        return self.predict_batch([image])[0]
 
-        # Preprocess image
-        if isinstance(image, np.ndarray):
-            img_array = image
-        else:
-            # Assume PIL Image
-            img_array = np.array(image)
+    def predict_batch(self, images, batch_size=32):
+        """
+        Dự đoán trên nhiều ảnh bằng một lần forward (theo từng batch)
 
-        # Resize và normalize
-        img_array = tf.image.resize(img_array, (self.input_shape[0], self.input_shape[1]))
-        img_array = img_array / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
+        Args:
+            images: List ảnh RGB (numpy array hoặc PIL Image) hoặc numpy array (N, H, W, C);
+                giá trị 0-255, kích thước bất kỳ (resize trong graph)
+            batch_size: Số ảnh tối đa mỗi lần gọi model
 
-        # Predict
-        predictions = self.model.predict(img_array)
-        predicted_class = np.argmax(predictions[0])
+        Returns:
+            list: [(predictions, class_name), ...] theo thứ tự đầu vào
+        """
+        serve = self.serving_function()
+        if len(images) == 0:
+            return []
 
-        # Class names (có thể customize theo dataset)
-        class_names = ['normal', 'cavity', 'gingivitis', 'plaque']
+        # Resizing trong graph cần mọi ảnh của một batch cùng kích thước: gom theo kích thước
+        # (ảnh từ ImageContext.cnn_input đều đã là input_shape nên chỉ có một nhóm)
+        arrays = [to_uint8_rgb(img) for img in images]
+        groups = {}
+        for index, array in enumerate(arrays):
+            groups.setdefault(array.shape, []).append(index)
 
-        return predictions[0], class_names[predicted_class]
+        predictions = [None] * len(arrays)
+        for indices in groups.values():
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                outputs = serve(np.stack([arrays[i] for i in chunk])).numpy()
+                for index, pred in zip(chunk, outputs):
+                    predictions[index] = pred
+        return [(pred, CLASS_NAMES[int(np.argmax(pred))]) for pred in predictions]
 
     def get_model_summary(self):
         """
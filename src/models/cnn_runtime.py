@@ -0,0 +1,243 @@
+"""
+Chạy CNN đã export (TFLite / ONNX, xem export_cnn.py) trên CPU.
+
+Các lớp ở đây có cùng giao diện dự đoán với DentalCNNModel (input_shape, warmup,
+predict, predict_batch) để DentalPredictor chọn runtime theo cấu hình. Module không
+import TensorFlow: TFLite ưu tiên ai_edge_litert / tflite_runtime, chỉ dùng
+tf.lite khi không có, nên node chỉ chạy suy luận không cần cài TensorFlow đầy đủ.
+
+File export nhận batch ảnh RGB kích thước input_shape, giá trị 0-255 (float32, hoặc
+uint8 với bản int8); chia 255 nằm trong graph. Ảnh khác kích thước được resize
+bilinear như ImageContext.cnn_input.
+"""
+import abc
+import importlib.util
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Tên lớp theo thứ tự output của mô hình (có thể customize theo dataset)
+CLASS_NAMES = ['normal', 'cavity', 'gingivitis', 'plaque']
+
+# keras: mô hình .h5 gốc (DentalCNNModel); tflite / onnx: file do export_cnn.py tạo
+RUNTIMES = ('keras', 'tflite', 'onnx')
+
+# Các bản export và hậu tố file (đặt cạnh file .h5: dental_model_final_int8.tflite, ...)
+VARIANTS = {
+    'tflite_dynamic': '_dynamic.tflite',  # trọng số int8, tính toán float
+    'tflite_int8': '_int8.tflite',        # trọng số và activation int8 (cần tập calibration)
+    'onnx': '.onnx',                      # float32
+    'onnx_int8': '_int8.onnx',            # trọng số int8 (onnxruntime quantize_dynamic)
+}
+
+
+def exported_path(model_path, variant):
+    """Đường dẫn file export của variant, cạnh file mô hình Keras."""
+    return os.path.splitext(model_path)[0] + VARIANTS[variant]
+
+
+def runtime_of(path):
+    """Runtime chạy được file mô hình theo đuôi file."""
+    ext = os.path.splitext(path)[1].lower()
+    return {'.tflite': 'tflite', '.onnx': 'onnx'}.get(ext, 'keras')
+
+
+def runtime_available(runtime):
+    """Thư viện của runtime đã cài hay chưa (không import)."""
+    if runtime == 'tflite':
+        modules = ('ai_edge_litert', 'tflite_runtime', 'tensorflow')
+    elif runtime == 'onnx':
+        modules = ('onnxruntime',)
+    else:
+        modules = ('tensorflow',)
+    return any(importlib.util.find_spec(name) is not None for name in modules)
+
+
+def to_uint8_rgb(image):
+    """Ảnh (numpy array hoặc PIL Image) về mảng RGB uint8 (H, W, 3), không resize."""
+    if not isinstance(image, np.ndarray):
+        # Assume PIL Image
+        image = np.array(image.convert('RGB') if getattr(image, 'mode', 'RGB') != 'RGB' else image)
+    if image.ndim == 2:
+        image = np.stack([image] * 3, axis=-1)
+    elif image.shape[-1] == 4:
+        image = image[..., :3]
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    return image
+
+
+def _tflite_interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class ExportedCNN(abc.ABC):
+    """
+    Phần chung của các runtime đã export: resize về input_shape, chia batch và chuyển
+    xác suất thành (predictions, class_name). Lớp con cài _run(batch) nhận mảng uint8
+    (N, H, W, 3) và trả về xác suất (N, num_classes).
+    """
+
+    runtime = None
+
+    def __init__(self, model_path, num_threads=0):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Không tìm thấy mô hình: {model_path}")
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.input_shape = (224, 224, 3)
+        # Interpreter / session không an toàn khi gọi song song (micro-batcher và /analyze/batch)
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _run(self, batch):
+        """Xác suất (N, num_classes) cho batch uint8 (N, H, W, 3) đã đúng input_shape."""
+
+    def warmup(self, batch_sizes=(1,)):
+        """Chạy thử với các kích thước batch (cấp phát buffer trước request đầu tiên)."""
+        height, width = self.input_shape[0], self.input_shape[1]
+        for size in batch_sizes:
+            self.predict_batch(np.zeros((size, height, width, 3), dtype=np.uint8), batch_size=size)
+
+    def predict(self, image):
+        """
+        Dự đoán trên một ảnh
+
+        Returns:
+            tuple: (predictions, class_names)
+        """
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images, batch_size=32):
+        """
+        Dự đoán trên nhiều ảnh (theo từng batch)
+
+        Args:
+            images: List ảnh RGB (numpy array hoặc PIL Image) hoặc numpy array (N, H, W, C);
+                giá trị 0-255, kích thước bất kỳ
+            batch_size: Số ảnh tối đa mỗi lần gọi model
+
+        Returns:
+            list: [(predictions, class_name), ...] theo thứ tự đầu vào
+        """
+        if len(images) == 0:
+            return []
+        height, width = self.input_shape[0], self.input_shape[1]
+        arrays = []
+        for image in images:
+            array = to_uint8_rgb(image)
+            if array.shape[:2] != (height, width):
+                array = cv2.resize(array, (width, height), interpolation=cv2.INTER_LINEAR)
+            arrays.append(array)
+
+        predictions = []
+        for start in range(0, len(arrays), batch_size):
+            batch = np.stack(arrays[start:start + batch_size])
+            with self._lock:
+                predictions.extend(self._run(batch))
+        return [(pred, CLASS_NAMES[int(np.argmax(pred))]) for pred in predictions]
+
+
+class TFLiteCNN(ExportedCNN):
+    """CNN chạy bằng TFLite interpreter (bản dynamic-range hoặc full int8)."""
+
+    runtime = 'tflite'
+
+    def __init__(self, model_path, num_threads=0):
+        super().__init__(model_path, num_threads)
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads or None)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(v) for v in self._input['shape'][1:])
+        self._batch_size = None
+
+    def _run(self, batch):
+        if batch.shape[0] != self._batch_size:
+            # Đổi kích thước batch phải cấp phát lại tensor: chỉ làm khi batch đổi
+            self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch.shape[0]
+        self.interpreter.set_tensor(self._input['index'], _quantize(batch, self._input))
+        self.interpreter.invoke()
+        return _dequantize(self.interpreter.get_tensor(self._output['index']), self._output)
+
+
+class OnnxCNN(ExportedCNN):
+    """CNN chạy bằng onnxruntime trên CPU."""
+
+    runtime = 'onnx'
+
+    def __init__(self, model_path, num_threads=0):
+        super().__init__(model_path, num_threads)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._input_dtype = np.uint8 if model_input.type == 'tensor(uint8)' else np.float32
+        shape = model_input.shape[1:]
+        if all(isinstance(v, int) for v in shape):
+            self.input_shape = tuple(shape)
+
+    def _run(self, batch):
+        return self.session.run(None, {self._input_name: batch.astype(self._input_dtype, copy=False)})[0]
+
+
+def _quantize(batch, details):
+    """Đưa batch uint8 0-255 về dtype input của interpreter (lượng tử hoá nếu cần)."""
+    dtype = details['dtype']
+    scale, zero_point = details['quantization']
+    if dtype == np.float32:
+        return batch.astype(np.float32)
+    if scale == 1.0 and zero_point == 0 and dtype == np.uint8:
+        return batch
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output, details):
+    scale, zero_point = details['quantization']
+    if output.dtype == np.float32 or not scale:
+        return output
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+def load_runtime(runtime, model_path, num_threads=0):
+    """
+    Load mô hình với runtime đã chọn.
+
+    Args:
+        runtime: Một trong RUNTIMES
+        model_path: File .h5/.keras (keras), .tflite hoặc .onnx
+        num_threads: Số thread suy luận (0 = mặc định của runtime); với keras dùng
+            configure_threads trước khi load
+
+    Returns:
+        DentalCNNModel, TFLiteCNN hoặc OnnxCNN
+
+    Raises:
+        ValueError: Nếu runtime không hỗ trợ
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Runtime CNN không hỗ trợ: {runtime} (chọn {', '.join(RUNTIMES)})")
+    if runtime == 'tflite':
+        return TFLiteCNN(model_path, num_threads)
+    if runtime == 'onnx':
+        return OnnxCNN(model_path, num_threads)
+    from src.models.cnn_model import DentalCNNModel
+    model = DentalCNNModel()
+    model.load_model(model_path)
+    return model
@@ -0,0 +1,63 @@
+"""
+read_batch_files: giới hạn số ảnh và dung lượng giải nén của file zip.
+Chạy: python -m pytest tests
+"""
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from batch_analysis import read_batch_files
+
+MB = 1024 * 1024
+
+
+class _Upload:
+    """Thay cho werkzeug FileStorage: chỉ cần filename và read()."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+def _zip(entries):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return _Upload('photos.zip', buf.getvalue())
+
+
+def test_rejects_member_larger_than_image_limit():
+    # 64MB số 0 nén còn vài chục KB
+    bomb = _zip([('bomb.jpg', b'\0' * (64 * MB))])
+    assert len(bomb.read()) < MB
+    with pytest.raises(ValueError, match='giải nén'):
+        read_batch_files([bomb], 50, max_image_bytes=20 * MB, max_total_bytes=200 * MB)
+
+
+def test_rejects_total_extracted_size():
+    upload = _zip([(f'{i}.jpg', b'\0' * (4 * MB)) for i in range(5)])
+    with pytest.raises(ValueError, match='Tổng dung lượng'):
+        read_batch_files([upload], 50, max_image_bytes=20 * MB, max_total_bytes=10 * MB)
+
+
+def test_rejects_too_many_images_before_reading():
+    upload = _zip([(f'{i}.jpg', b'x') for i in range(4)])
+    with pytest.raises(ValueError, match='Tối đa 3'):
+        read_batch_files([upload], 3)
+    with pytest.raises(ValueError, match='Tối đa 1'):
+        read_batch_files([_Upload('a.jpg', b'x'), _Upload('b.jpg', b'y')], 1)
+
+
+def test_reads_images_within_limits():
+    upload = _zip([('a.jpg', b'aaa'), ('notes.txt', b'skip'), ('.hidden.jpg', b'skip'), ('b.png', b'bb')])
+    items = read_batch_files([upload, _Upload('c.jpg', b'c')], 3, max_image_bytes=MB, max_total_bytes=MB)
+    assert items == [('a.jpg', b'aaa'), ('b.png', b'bb'), ('c.jpg', b'c')]
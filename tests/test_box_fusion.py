@@ -0,0 +1,130 @@
+"""
+box_fusion: top_k, nms và weighted_box_fusion so với cài đặt tham chiếu bằng Python
+thuần; trọng số nguồn không hợp lệ bị từ chối thay vì cho confidence NaN.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import box_fusion
+import config
+
+
+def _random_boxes(rng, count, labels=3, sources=1):
+    # Box dồn quanh ít tâm để có nhiều cặp chồng nhau
+    anchors = rng.uniform(0, 300, (max(1, count // 8), 2))
+    xy = anchors[rng.integers(0, len(anchors), count)] + rng.normal(0, 6, (count, 2))
+    wh = rng.uniform(20, 40, (count, 2))
+    # Score làm tròn để có các giá trị bằng nhau (kiểm tra thứ tự ổn định)
+    scores = np.round(rng.uniform(0.05, 1.0, count), 1)
+    return (np.hstack([xy, xy + wh]), scores, rng.integers(0, labels, count),
+            rng.integers(0, sources, count))
+
+
+def _iou(a, b):
+    iw = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    ih = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _reference_nms(xyxy, scores, labels, iou_threshold):
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    keep = []
+    for i in order:
+        if all(labels[i] != labels[k] or _iou(xyxy[i], xyxy[k]) <= iou_threshold for k in keep):
+            keep.append(i)
+    return keep
+
+
+def _reference_wbf(xyxy, scores, labels, sources, num_sources, iou_threshold):
+    """Cụm: (label, tổng toạ độ * score, tổng score, số box, các nguồn); box ghép vào cụm IoU cao nhất."""
+    clusters = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        best, best_iou = None, iou_threshold
+        for c, cluster in enumerate(clusters):
+            if cluster['label'] != labels[i]:
+                continue
+            iou = _iou(xyxy[i], cluster['weighted'] / cluster['total'])
+            if iou > best_iou:
+                best, best_iou = c, iou
+        if best is None:
+            clusters.append({'label': labels[i], 'weighted': np.zeros(4), 'total': 0.0, 'count': 0,
+                             'sources': set()})
+            best = len(clusters) - 1
+        cluster = clusters[best]
+        cluster['weighted'] = cluster['weighted'] + xyxy[i] * scores[i]
+        cluster['total'] += scores[i]
+        cluster['count'] += 1
+        cluster['sources'].add(sources[i])
+    fused = [(c['total'] / c['count'] * len(c['sources']) / num_sources, c['weighted'] / c['total'])
+             for c in clusters]
+    return sorted(fused, key=lambda item: -item[0])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_k_matches_stable_sort(seed):
+    values = np.random.default_rng(seed).integers(0, 10, 200)
+    for k in (0, 1, 7, 50, 200, 300):
+        assert box_fusion.top_k(values, k).tolist() == np.argsort(-values, kind='stable')[:k].tolist()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_nms_matches_reference(seed):
+    xyxy, scores, labels, _ = _random_boxes(np.random.default_rng(seed), 120)
+    for threshold in (0.3, 0.5):
+        kept = box_fusion.nms(xyxy, scores, labels, iou_threshold=threshold)
+        assert kept.tolist() == _reference_nms(xyxy, scores, labels, threshold)
+    assert len(box_fusion.nms(xyxy, scores, labels, max_output=5)) == 5
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_weighted_box_fusion_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    xyxy, scores, labels, sources = _random_boxes(rng, 80, sources=3)
+    # Score không trùng nhau để thứ tự ghép cụm không phụ thuộc cách xử lý bằng nhau
+    scores = scores + rng.uniform(0, 0.01, len(scores))
+    boxes = box_fusion.BoxSet(xyxy, scores, labels, ('a', 'b', 'c'), sources)
+    fused, assignment = box_fusion.weighted_box_fusion(boxes, iou_threshold=0.4, num_sources=3)
+    expected = _reference_wbf(xyxy, scores, labels, sources, 3, 0.4)
+    assert len(fused) == len(expected)
+    np.testing.assert_allclose(fused.scores, [score for score, _ in expected])
+    np.testing.assert_allclose(fused.xyxy, [box for _, box in expected])
+    assert (assignment >= 0).all()
+    assert np.bincount(assignment).sum() == len(xyxy)
+
+
+def _det(x1, y1, x2, y2, confidence, class_name='cavity'):
+    return {'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}, 'confidence': confidence, 'class_name': class_name}
+
+
+SOURCES = {
+    'cv': [_det(10, 10, 50, 50, 0.6)],
+    'yolo': [_det(12, 10, 52, 50, 0.9)],
+}
+
+
+@pytest.mark.parametrize('weights', [{'cv': 0, 'yolo': 0}, {'cv': -1, 'yolo': 1}, {'cv': float('nan')}])
+def test_invalid_weights_are_rejected(weights):
+    with pytest.raises(ValueError):
+        box_fusion.fuse_detections(SOURCES, weights=weights)
+
+
+def test_zero_weight_for_one_source_keeps_confidences_finite():
+    fused = box_fusion.fuse_detections(SOURCES, weights={'cv': 0, 'yolo': 2})
+    assert len(fused) == 1
+    assert np.isfinite(fused[0]['confidence'])
+    assert fused[0]['sources'] == ['cv', 'yolo']
+
+
+def test_config_drops_non_positive_weights(monkeypatch):
+    monkeypatch.setenv('DENTAL_TEST_WEIGHTS', '{"cv": 0, "yolo": 2, "simple": "x", "cnn": -1}')
+    assert config._env_weights('DENTAL_TEST_WEIGHTS') == {'yolo': 2.0}
+    monkeypatch.setenv('DENTAL_TEST_WEIGHTS', '[1, 2]')
+    assert config._env_weights('DENTAL_TEST_WEIGHTS') == {}
@@ -0,0 +1,43 @@
+"""
+ExportedCNN: runtime chưa cài _run báo lỗi ngay khi tạo, không phải ở request đầu tiên.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.models.cnn_runtime import CLASS_NAMES, ExportedCNN
+
+
+class _ConstantCNN(ExportedCNN):
+    runtime = 'constant'
+
+    def _run(self, batch):
+        assert batch.shape[1:] == self.input_shape and batch.dtype == np.uint8
+        return np.tile(np.eye(len(CLASS_NAMES))[1], (batch.shape[0], 1))
+
+
+def test_runtime_without_run_cannot_be_created(tmp_path):
+    path = tmp_path / 'model.tflite'
+    path.write_bytes(b'')
+
+    class Unfinished(ExportedCNN):
+        runtime = 'unfinished'
+
+    with pytest.raises(TypeError):
+        ExportedCNN(str(path))
+    with pytest.raises(TypeError):
+        Unfinished(str(path))
+
+
+def test_predict_batch_resizes_and_maps_class_names(tmp_path):
+    path = tmp_path / 'model.tflite'
+    path.write_bytes(b'')
+    model = _ConstantCNN(str(path))
+    images = [np.zeros((100, 80, 3), dtype=np.uint8), np.full((224, 224), 255, dtype=np.uint8)]
+    results = model.predict_batch(images, batch_size=1)
+    assert [name for _, name in results] == [CLASS_NAMES[1]] * 2
@@ -0,0 +1,63 @@
+"""
+color_lut: ảnh nhãn từ bảng tra trùng với cv2.cvtColor + cv2.inRange trên từng lớp.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import color_lut
+
+
+def _in_range(bgr, pairs):
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    hit = np.zeros(bgr.shape[:2], dtype=np.uint8)
+    for lower, upper in pairs:
+        hit |= cv2.inRange(hsv, np.array(lower), np.array(upper))
+    return hit
+
+
+def _image():
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    # Thêm các màu nằm sát ngưỡng (xám, trắng, đỏ, vàng) bên cạnh màu ngẫu nhiên
+    levels = np.array([0, 1, 29, 30, 31, 40, 79, 80, 81, 139, 140, 150, 199, 200, 254, 255], dtype=np.uint8)
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(64, 64, 3)
+    return np.concatenate([noise, grid], axis=1)
+
+
+@pytest.mark.parametrize('name', list(color_lut.CLASS_BITS))
+def test_labels_match_in_range(name):
+    bgr = _image()
+    labels = color_lut.classify(bgr)
+    expected = _in_range(bgr, color_lut.DEFAULT_RANGES[name])
+    np.testing.assert_array_equal(color_lut.mask(labels, name), expected)
+
+
+def test_mask_of_several_classes_is_union():
+    bgr = _image()
+    labels = color_lut.classify(bgr)
+    expected = _in_range(bgr, color_lut.DEFAULT_RANGES['cavity'] + color_lut.DEFAULT_RANGES['stain'])
+    np.testing.assert_array_equal(color_lut.mask(labels, 'cavity', 'stain'), expected)
+    np.testing.assert_array_equal(color_lut.mask(labels, 'cavity', 'stain', value=1), expected // 255)
+
+
+def test_overridden_ranges():
+    bgr = _image()
+    override = {'calculus': [((20, 50, 50), (30, 255, 255))]}
+    labels = color_lut.classify(bgr, override)
+    np.testing.assert_array_equal(color_lut.mask(labels, 'calculus'), _in_range(bgr, override['calculus']))
+    # Lớp không ghi đè giữ ngưỡng mặc định
+    np.testing.assert_array_equal(color_lut.mask(labels, 'gum'), _in_range(bgr, color_lut.DEFAULT_RANGES['gum']))
+
+
+def test_invalid_ranges_are_rejected():
+    with pytest.raises(ValueError):
+        color_lut.normalize_ranges({'unknown': [((0, 0, 0), (1, 1, 1))]})
+    with pytest.raises(ValueError):
+        color_lut.normalize_ranges({'gum': [((0, 0), (1, 1))]})
@@ -0,0 +1,50 @@
+"""
+CascadePolicy: mode full chạy mọi detector, kể cả detector cùng result_key với
+một detector rẻ hơn đã đủ tin cậy.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from detector_cascade import MODE_FULL, MODE_STANDARD, SKIP_SUFFICIENT, CascadePolicy, Detector
+from stage_executor import STATUS_OK, STATUS_SKIPPED, StageExecutor
+
+
+def _detectors(calls):
+    def make(name):
+        def run(ctx, publish, timeout):
+            calls.append((name, publish))
+            return {'cv_detections': {'detections': [{'confidence': 0.9, 'source': name}]}}
+        return run
+
+    return [Detector('simple', make('simple'), 5, result_key='cv_detections'),
+            Detector('cv', make('cv'), 50, result_key='cv_detections')]
+
+
+def _run(mode):
+    calls = []
+    policy = CascadePolicy(mode=mode)
+    stages = policy.build_stages(None, _detectors(calls))
+    executor = StageExecutor(max_workers=2)
+    try:
+        results = executor.run(stages)
+    finally:
+        executor.shutdown(wait=True)
+    return policy, results, calls
+
+
+def test_full_mode_runs_detectors_sharing_result_key():
+    policy, results, calls = _run(MODE_FULL)
+    assert results['cv'].status == STATUS_OK
+    # Chỉ detector đủ tin cậy đầu tiên vẽ ảnh kết quả
+    assert calls == [('simple', True), ('cv', False)]
+    assert policy.summary(results)['skipped'] == {}
+
+
+def test_standard_mode_skips_when_cheaper_detector_is_sufficient():
+    policy, results, calls = _run(MODE_STANDARD)
+    assert results['cv'].status == STATUS_SKIPPED
+    assert calls == [('simple', True)]
+    assert policy.summary(results)['skipped'] == {'cv': SKIP_SUFFICIENT}
@@ -0,0 +1,56 @@
+"""
+MicroBatcher: item hết timeout khi còn trong hàng đợi bị huỷ và không chạy model.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from inference_scheduler import MicroBatcher
+from stage_executor import Stage, StageExecutor
+
+
+def test_timed_out_item_is_cancelled_and_skipped():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        seen.extend(items)
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher('test', batch_fn, max_batch_size=1, max_wait_ms=0)
+    first = batcher.submit('first')
+    # Chờ tới khi worker đang chạy batch đầu tiên
+    deadline = time.monotonic() + 2
+    while not seen and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    with pytest.raises(TimeoutError):
+        batcher('late', timeout=0.05)
+    release.set()
+    assert first.result(timeout=2) == 'first'
+    assert batcher('next', timeout=2) == 'next'
+    assert seen == ['first', 'next']
+
+
+def test_stage_inputs_remaining_follows_stage_timeout():
+    executor = StageExecutor(max_workers=2)
+    remaining = {}
+    stages = [
+        Stage('limited', lambda inputs: remaining.setdefault('limited', inputs.remaining()), timeout=2.0),
+        Stage('unlimited', lambda inputs: remaining.setdefault('unlimited', inputs.remaining())),
+    ]
+    executor.run(stages)
+    assert 1.5 < remaining['limited'] <= 2.0
+    assert remaining['unlimited'] is None
+
+    executor.run([Stage('request', lambda inputs: remaining.setdefault('request', inputs.remaining()),
+                        timeout=30.0)], timeout=1.0)
+    assert remaining['request'] <= 1.0
+    executor.shutdown()
@@ -0,0 +1,49 @@
+"""
+Stream Server-Sent Events của JobManager: client kết nối lại sau event cuối.
+Chạy: python -m pytest tests
+"""
+import itertools
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from jobs import JobManager
+
+
+def _finished_job(runner):
+    manager = JobManager(runner, workers=1)
+    job = manager.submit({})
+    # Đọc stream tới event cuối để chắc chắn job đã xong
+    list(manager.stream(job, heartbeat=1.0))
+    return manager, job
+
+
+def _last_id(job):
+    return job.wait_events(0, 0)[-1][0]
+
+
+def test_reconnect_after_done_replays_done_and_ends():
+    manager, job = _finished_job(lambda job: {'ok': True})
+    last_id = _last_id(job)
+    for after in (last_id, last_id + 5):
+        # Generator phải kết thúc, không lặp keep-alive vô hạn
+        chunks = list(itertools.islice(manager.stream(job, after, heartbeat=0.01), 10))
+        assert len(chunks) == 1
+        assert chunks[0].startswith(f'id: {last_id}\nevent: done\n')
+
+
+def test_reconnect_after_error_replays_error():
+    def runner(job):
+        raise ValueError('boom')
+
+    manager, job = _finished_job(runner)
+    chunks = list(itertools.islice(manager.stream(job, _last_id(job), heartbeat=0.01), 10))
+    assert len(chunks) == 1
+    assert 'event: error\n' in chunks[0]
+
+
+def test_reconnect_mid_stream_sends_remaining_events():
+    manager, job = _finished_job(lambda job: {'ok': True})
+    chunks = list(manager.stream(job, 1, heartbeat=0.01))
+    assert [c.split('\n')[1] for c in chunks] == ['event: status', 'event: done']
@@ -0,0 +1,55 @@
+"""
+Shard theo thread của metrics: thread ngắn (một thread mỗi request) không làm số
+shard tăng mãi, và giá trị của thread đã kết thúc vẫn được giữ.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import metrics
+
+
+def _run_threads(count, func):
+    for _ in range(count):
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+
+
+def test_dead_thread_shards_are_folded():
+    registry = metrics.Registry()
+    counter = registry.counter('test_requests_total', 'test', ('outcome',))
+    histogram = registry.histogram('test_latency_seconds', 'test', ('stage',), buckets=(0.1, 1.0))
+
+    def request():
+        counter.inc(outcome='ok')
+        histogram.observe(0.5, stage='cv')
+
+    _run_threads(500, request)
+    counter.inc(outcome='ok')
+
+    assert counter.value(outcome='ok') == 501
+    # Chỉ còn shard của thread hiện tại (các thread kia đã được gộp)
+    assert len(counter._shards) <= 2
+    assert len(histogram._shards) <= 2
+    text = registry.render()
+    assert 'test_requests_total{outcome="ok"} 501' in text
+    assert 'test_latency_seconds_bucket{stage="cv",le="1"} 500' in text
+    assert 'test_latency_seconds_count{stage="cv"} 500' in text
+
+
+def test_gauge_inc_and_dec_on_different_threads():
+    gauge = metrics.Registry().gauge('test_in_flight', 'test', ('endpoint',))
+    _run_threads(10, lambda: gauge.inc(endpoint='analyze'))
+    _run_threads(10, lambda: gauge.dec(endpoint='analyze'))
+    assert gauge.value(endpoint='analyze') == 0
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric('x', 'x')
@@ -0,0 +1,64 @@
+"""
+ModelServerClient: hết thời gian còn lại của stage thì client dừng chờ, ảnh còn trong
+hàng đợi của server bị huỷ và slot shared memory được trả.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from model_registry import ModelRegistry
+from model_server import ModelServer, ModelServerClient
+
+
+@pytest.fixture
+def server(tmp_path):
+    address = str(tmp_path / 'model.sock')
+    server = ModelServer(address, ModelRegistry())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(address) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server
+
+
+def test_timeout_cancels_queued_items_and_frees_slots(server):
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        seen.append([float(item[0, 0]) for item in items])
+        release.wait(5)
+        return [float(item[0, 0]) for item in items]
+
+    server.add_batcher('cnn', batch_fn)
+    server.batchers['cnn'].max_batch_size = 1
+    client = ModelServerClient(server.address, slots=2, slot_bytes=1024, timeout=30.0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            # Ảnh đầu vào batch và bị giữ; ảnh thứ hai còn trong hàng đợi
+            client.infer('cnn', [np.full((2, 2), 1.0), np.full((2, 2), 2.0)], timeout=0.2)
+        assert time.monotonic() - started < 2
+        # Server xử lý 'cancel' trên thread của kết nối: chờ ảnh trong hàng đợi bị huỷ
+        queued = server.batchers['cnn']._queue.queue
+        deadline = time.monotonic() + 5
+        while not (queued and queued[0].future.cancelled()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        deadline = time.monotonic() + 5
+        while len(client._free) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(client._free) == 2
+        assert seen == [[1.0]]
+        # Client vẫn dùng được sau khi huỷ
+        assert client.infer('cnn', [np.full((2, 2), 3.0)], timeout=5) == [3.0]
+    finally:
+        release.set()
+        client.close()
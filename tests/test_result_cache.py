@@ -0,0 +1,36 @@
+"""
+ResultCache: lỗi SQLite của tầng đĩa không làm get/put lỗi, cache vẫn chạy bằng bộ nhớ.
+Chạy: python -m pytest tests
+"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from result_cache import ResultCache
+
+
+def test_disk_errors_fall_back_to_memory(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(disk_path=path)
+    cache.put('a', {'ok': 1}, b'img')
+    # Bảng bị xoá từ bên ngoài: mọi câu lệnh của tầng đĩa đều lỗi
+    with sqlite3.connect(path) as other:
+        other.execute('DROP TABLE results')
+
+    cache.put('b', {'ok': 2})
+    assert cache.get('b') == ({'ok': 2}, None)
+    cache._memory.clear()
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['disk_errors'] == 2
+    assert stats['disk_enabled']
+
+
+def test_unusable_disk_path_disables_disk_tier(tmp_path):
+    # Thư mục thay vì file: sqlite3 không mở được
+    cache = ResultCache(disk_path=str(tmp_path))
+    cache.put('a', {'ok': 1})
+    assert cache.get('a') == ({'ok': 1}, None)
+    assert not cache.stats()['disk_enabled']
@@ -0,0 +1,115 @@
+"""
+StageExecutor: phụ thuộc và condition, timeout của stage và của cả lần chạy, huỷ.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from stage_executor import (STATUS_CANCELLED, STATUS_ERROR, STATUS_OK, STATUS_SKIPPED, STATUS_TIMEOUT,
+                            Stage, StageExecutor)
+
+
+@pytest.fixture
+def executor():
+    executor = StageExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def _blocking(started, seen_cancel):
+    """Stage chờ tới khi bị huỷ (tối đa 5 giây)."""
+    def func(inputs):
+        started.set()
+        if inputs.cancel_event.wait(5):
+            seen_cancel.set()
+        return 'late'
+    return func
+
+
+def test_dependencies_and_condition(executor):
+    order = []
+
+    def record(name, value=None):
+        def func(inputs):
+            order.append(name)
+            return value if value is not None else {dep: r.value for dep, r in inputs.results.items()}
+        return func
+
+    stages = [
+        Stage('c', record('c'), depends_on=('b',)),
+        Stage('a', record('a', 1)),
+        Stage('b', record('b'), depends_on=('a',), condition=lambda results: results['a'].value > 1),
+        Stage('d', record('d'), depends_on=('a',)),
+    ]
+    results = executor.run(stages)
+    assert results['a'].status == STATUS_OK
+    # b bị bỏ qua theo condition; c phụ thuộc b vẫn chạy và thấy kết quả skipped
+    assert results['b'].status == STATUS_SKIPPED
+    assert results['c'].status == STATUS_OK
+    assert results['d'].value == {'a': 1}
+    assert order.index('a') < order.index('d')
+    assert 'b' not in order
+
+
+def test_error_is_reported(executor):
+    def fail(inputs):
+        raise ValueError('boom')
+
+    results = executor.run([Stage('bad', fail), Stage('good', lambda inputs: 42)])
+    assert results['bad'].status == STATUS_ERROR
+    assert results['bad'].error == 'boom'
+    assert results['good'].value == 42
+
+
+def test_stage_timeout_sets_cancel_flag(executor):
+    started, seen_cancel = threading.Event(), threading.Event()
+    remaining = []
+
+    def quick(inputs):
+        remaining.append(inputs.remaining())
+        return 'ok'
+
+    begin = time.monotonic()
+    results = executor.run([
+        Stage('slow', _blocking(started, seen_cancel), timeout=0.1),
+        Stage('quick', quick, timeout=2.0),
+    ])
+    assert time.monotonic() - begin < 2
+    assert results['slow'].status == STATUS_TIMEOUT
+    assert results['quick'].status == STATUS_OK
+    assert seen_cancel.wait(2)
+    assert 0 < remaining[0] <= 2.0
+
+
+def test_run_timeout_cancels_running_and_pending(executor):
+    started, seen_cancel = threading.Event(), threading.Event()
+    results = executor.run([
+        Stage('slow', _blocking(started, seen_cancel)),
+        Stage('after', lambda inputs: 'never', depends_on=('slow',)),
+    ], timeout=0.1)
+    assert results['slow'].status == STATUS_CANCELLED
+    assert results['after'].status == STATUS_CANCELLED
+    assert seen_cancel.wait(2)
+
+
+def test_invalid_graphs(executor):
+    with pytest.raises(ValueError):
+        executor.run([Stage('a', lambda inputs: 1, depends_on=('missing',))])
+    results = executor.run([
+        Stage('a', lambda inputs: 1, depends_on=('b',)),
+        Stage('b', lambda inputs: 1, depends_on=('a',)),
+    ])
+    assert {r.status for r in results.values()} == {STATUS_SKIPPED}
+
+
+def test_on_complete_called_per_stage(executor):
+    completed = []
+    executor.run([Stage('a', lambda inputs: 1), Stage('b', lambda inputs: 2, depends_on=('a',))],
+                 on_complete=lambda result: completed.append(result.name))
+    assert completed == ['a', 'b']
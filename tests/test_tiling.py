@@ -0,0 +1,84 @@
+"""
+tiling: chia ô phủ kín ảnh với độ chồng yêu cầu; detection bị cắt ở mép ô được gộp
+lại thành box đầy đủ.
+Chạy: python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import tiling
+from image_context import ImageContext
+
+
+def _det(x1, y1, x2, y2, confidence=0.5, class_name='cavity', **extra):
+    return {'bbox': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}, 'confidence': confidence,
+            'class_name': class_name, **extra}
+
+
+@pytest.mark.parametrize('width,height,tile_size,overlap', [
+    (4000, 3000, 2048, 768), (2049, 100, 2048, 768), (5000, 5000, 1000, 200), (3000, 1200, 1024, 900),
+])
+def test_tile_grid_covers_image_with_overlap(width, height, tile_size, overlap):
+    tiles = tiling.tile_grid(width, height, tile_size, overlap)
+    covered = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in tiles:
+        assert 0 <= x and 0 <= y and x + w <= width and y + h <= height
+        assert w <= tile_size and h <= tile_size
+        covered[y:y + h, x:x + w] = True
+    assert covered.all()
+    effective = min(overlap, tile_size // 2)
+    xs = sorted({(x, w) for x, _, w, _ in tiles})
+    ys = sorted({(y, h) for _, y, _, h in tiles})
+    for spans in (xs, ys):
+        # Các ô cùng kích thước theo mỗi chiều, ô liền kề chồng nhau ít nhất overlap
+        assert len({size for _, size in spans}) == 1
+        for (start, size), (next_start, _) in zip(spans, spans[1:]):
+            assert start + size - next_start >= effective
+
+
+def test_small_image_is_one_tile():
+    assert tiling.tile_grid(800, 600, 2048) == [(0, 0, 800, 600)]
+
+
+def test_merge_detections_joins_fragments_of_same_class():
+    detections = [
+        _det(100, 100, 200, 180, 0.6, area=8000),   # box đầy đủ trong ô trái
+        _det(150, 100, 210, 180, 0.8, area=4800),   # mảnh bị cắt ở mép ô phải
+        _det(150, 100, 210, 180, 0.9, class_name='stain'),
+        _det(500, 500, 520, 520, 0.3),
+    ]
+    merged = tiling.merge_detections(detections)
+    assert [d['class_name'] for d in merged] == ['stain', 'cavity', 'cavity']
+    joined = merged[1]
+    assert joined['bbox'] == {'x1': 100, 'y1': 100, 'x2': 210, 'y2': 180}
+    assert joined['confidence'] == 0.8
+    assert joined['area'] == 8000
+    assert merged[2]['bbox'] == detections[3]['bbox']
+
+
+def test_tiled_detection_matches_whole_image():
+    # "Detector" thấy các vật thể cố định, cắt theo ô; tâm vùng trên đường nối giữa hai ô
+    objects = [(90, 40, 170, 90), (10, 10, 40, 30), (180, 150, 250, 190)]
+    view = ImageContext(np.zeros((200, 260, 3), dtype=np.uint8))
+
+    def find(region, x, y):
+        height, width = region.bgr.shape[:2]
+        found = []
+        for x1, y1, x2, y2 in objects:
+            cx1, cy1 = max(x1 - x, 0), max(y1 - y, 0)
+            cx2, cy2 = min(x2 - x, width), min(y2 - y, height)
+            if cx1 < cx2 and cy1 < cy2:
+                found.append(_det(cx1, cy1, cx2, cy2))
+        return found
+
+    tiles = tiling.tile_grid(260, 200, 128, 40)
+    assert len(tiles) > 1
+    whole = tiling.detect(view, find)
+    tiled = tiling.detect(view, find, tiles, workers=2)
+    key = lambda d: tuple(d['bbox'].values())
+    assert sorted(map(key, tiled)) == sorted(map(key, whole))
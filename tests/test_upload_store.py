@@ -0,0 +1,119 @@
+"""
+UploadStore: ghi atomic, không lưu trùng nội dung, quota giữ được khi nhiều process
+(web worker) dùng chung một thư mục.
+Chạy: python -m pytest tests
+"""
+import hashlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import upload_store
+from upload_store import UploadStore
+
+
+def _disk_bytes(root):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != '.tmp']
+        total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames if not f.startswith('.'))
+    return total
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def stores(tmp_path):
+    created = []
+
+    def make(**kwargs):
+        store = UploadStore(str(tmp_path), **kwargs)
+        created.append(store)
+        assert _wait(store._scanned.is_set)
+        return store
+
+    yield make
+    for store in created:
+        store.close()
+
+
+def test_quota_holds_across_processes(tmp_path, stores):
+    # Hai instance trên cùng thư mục thay cho hai web worker
+    first = stores(max_bytes=1000, low_watermark=0.9, evict_interval=0.05)
+    second = stores(max_bytes=1000, low_watermark=0.9, evict_interval=0.05)
+    older = [first.put(bytes([i]) * 300, '.jpg') for i in range(2)]
+    for i, name in enumerate(older):
+        os.utime(first.path(name), (i + 1, i + 1))
+    # Mỗi worker chỉ tự ghi 600 byte (dưới quota) nhưng tổng trên đĩa là 1200
+    for i in range(2):
+        second.put(bytes([10 + i]) * 300, '.jpg')
+
+    assert _wait(lambda: _disk_bytes(str(tmp_path)) <= 1000)
+    # File cũ nhất (theo mtime) bị xoá, worker kia cũng thấy
+    assert not os.path.exists(first.path(older[0]))
+    assert first.touch(older[0]) is None
+    assert _wait(lambda: first.stats()['bytes'] == second.stats()['bytes'] == 900)
+
+
+
+def test_put_is_atomic_and_content_addressed(tmp_path, stores, monkeypatch):
+    store = stores()
+    data = b'\xff\xd8 anh rang'
+    name = store.put(data, '.JPG')
+    assert name == hashlib.sha256(data).hexdigest() + '.jpg'
+    with open(store.path(name), 'rb') as f:
+        assert f.read() == data
+    tmp_dir = os.path.join(str(tmp_path), '.tmp')
+    assert os.listdir(tmp_dir) == []
+
+    # Ghi lỗi giữa chừng không để lại file tạm hay file đích dở dang
+    def fail(src, dst):
+        raise OSError('đĩa đầy')
+    monkeypatch.setattr(upload_store.os, 'replace', fail)
+    with pytest.raises(OSError):
+        store.put(b'khac', '.jpg')
+    assert os.listdir(tmp_dir) == []
+    assert _disk_bytes(str(tmp_path)) == len(data)
+
+
+def test_same_content_is_stored_once(tmp_path, stores):
+    store = stores()
+    first = store.put(b'x' * 100, '.png')
+    second = store.put(b'x' * 100, '.png')
+    assert first == second
+    stats = store.stats()
+    assert stats['dedup_hits'] == 1
+    assert stats['files'] == 1 and stats['bytes'] == 100
+    assert _disk_bytes(str(tmp_path)) == 100
+
+
+def test_eviction_removes_least_recently_used(tmp_path, stores):
+    store = stores(max_bytes=1000, low_watermark=0.6, evict_interval=0.05)
+    names = [store.put(bytes([i]) * 300, '.jpg') for i in range(3)]
+    for i, name in enumerate(names):
+        os.utime(store.path(name), (i + 1, i + 1))
+    # File cũ nhất vừa được dùng lại nên phải sống sót
+    assert store.touch(names[0]) == store.path(names[0])
+    store.put(b'\x09' * 300, '.jpg')
+
+    assert _wait(lambda: _disk_bytes(str(tmp_path)) <= 600)
+    assert os.path.exists(store.path(names[0]))
+    assert not os.path.exists(store.path(names[1]))
+    assert not os.path.exists(store.path(names[2]))
+    assert store.touch(names[1]) is None
+    assert store.stats()['evicted_files'] == 2
+
+
+def test_invalid_names_are_rejected(stores):
+    store = stores()
+    assert store.path('../x') is None
+    assert store.touch('../../etc/passwd') is None